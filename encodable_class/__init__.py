@@ -0,0 +1,25 @@
+from ._core import EncodableClass, ForeignObjectCodec
+from ._core import EncodeContext, DecodeContext, Ref, PendingTuple, ClassPlan, TemplateNode
+from ._core import Columnar, VALIDATION_LEVELS
+from ._core import InternTable, intern_objects
+from ._core import get_class_plan, invalidate_plans, get_template_str
+from ._core import register_class, get_registered_class, lookup_subtype, get_subtype_table
+from ._core import get_all_subclasses, get_classid_str, is_in_list
+from ._core import do_encode, do_decode, do_resolve_ref
+from ._json_stream import JSONStreamWriter, iterencode, dump
+from ._json_stream import JSONStreamReader, JSONTokenizer, load, iterload
+from ._iterative import to_dict_iterative, from_dict_iterative, decode_member_iterative
+from ._binary import dumpb, loadb
+from ._buffers import BufferCodec, BytesCodec, ByteArrayCodec, MemoryViewCodec, ArrayCodec, NDArrayCodec
+from ._buffers import SidecarWriter, SidecarReader
+from ._lazy import LazyClass, from_dict_lazy, materialize, is_lazy, LazyDecodeContext
+from ._delta import TrackedClass, ChangeTracker, mark_dirty
+from ._parallel import to_dict_parallel
+from ._archive import dump_archive, Archive
+from ._slots import SlottedClass, SlottedMeta
+from ._profile import Profiler
+from ._header import to_header_dict, from_header_dict
+from ._clone import clone
+from ._compare import graph_equal, graph_diff, GraphHasher
+from ._store import RecordStore
+from ._autosave import AutoSaver
@@ -0,0 +1,105 @@
+# The MIT License (MIT)
+# 
+# Copyright (c) 2016 Alex Mykyta
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Example usage. Run with:
+#   python -m encodable_class
+#
+
+import json
+import filecmp
+import datetime
+
+from encodable_class import EncodableClass, ForeignObjectCodec, dump
+
+class DatetimeCodec(ForeignObjectCodec):
+    obj_type = datetime.datetime
+
+    @classmethod
+    def encode(cls, obj):
+        return(obj.timestamp()*1000000)
+
+    @classmethod
+    def decode(cls, d):
+        return(datetime.datetime.fromtimestamp(d/1000000))
+
+class Bar(EncodableClass):
+
+    encode_schema = {
+        "x": int,
+        "D" : {
+            str: str
+        }
+    }
+
+    def __init__(self, x):
+        self.x = x
+        self.D = {}
+
+class Foo(EncodableClass):
+
+    encode_schema = {
+        "a": int,
+        "items": [EncodableClass],
+        "timestamp": DatetimeCodec
+    }
+
+    def __init__(self, a):
+        self.a = a
+        self.items = []
+        self.timestamp = datetime.datetime.today()
+
+# Create a data structure
+foo = Foo(1)
+foo.items.append(Bar(100))
+foo.items.append(Bar(1234))
+b = Bar(22)
+foo.items.append(b)
+foo.items.append(b)
+b.D["hello"] = "world"
+b.D["bye"] = "asdf"
+foo2 = Foo(999)
+foo2.items.append(Bar(77))
+foo2.items.append(Bar(66))
+foo2.items.append(b)
+foo.items.append(foo2)
+foo.items.append(foo)
+
+# Convert to dict and save to file as JSON
+with open("test.json", 'w') as f:
+    json.dump(foo.to_dict(), f, indent=2, sort_keys = True)
+
+# Reconstitute from file
+with open("test.json", 'r') as f:
+    foo_prime = Foo.from_dict(json.load(f))
+
+# Convert back to JSON
+with open("test2.json", 'w') as f:
+    json.dump(foo_prime.to_dict(), f, indent=2, sort_keys = True)
+
+# Stream directly to a file, without building the intermediate dict
+with open("test3.json", 'w') as f:
+    dump(foo_prime, f, indent=2, sort_keys = True)
+
+if(filecmp.cmp("test.json", "test2.json") and filecmp.cmp("test.json", "test3.json")):
+    print("OK!")
+else:
+    print("Failed")
\ No newline at end of file
@@ -0,0 +1,349 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Random-access archive of EncodableClass objects
+#
+# Objects are stored as separate records, so that any of them can be decoded
+# without parsing the rest of the file. Records are made for:
+#   - The root object
+#   - Objects directly inside the root's members (top-level objects)
+#   - Objects that are referenced more than once (shared objects)
+# Every other object is stored within the record of the one object that
+# contains it.
+#
+#   Archive:    MAGIC, the records, the index, then the trailer
+#   Record:     UTF-8 JSON of the record object's to_dict() form, except that
+#               all other record objects are stored as <ref>s
+#   Index:      One entry per record, in order of <ref_id>:
+#               little-endian u64 offset, u64 size, u64 first inline <ref_id>
+#   Trailer:    little-endian u64 index offset, u64 number of records,
+#               u64 number of <ref_id>s, then MAGIC
+#
+# Records have <ref_id> 0 (the root) to n_records-1. Objects stored within a
+# record are numbered after that, with a contiguous range of <ref_id>s per
+# record, so the record that contains any <ref_id> is found by bisecting the
+# index.
+#
+
+import os
+import json
+import mmap
+import struct
+
+from ._core import EncodeContext, DecodeContext, TemplateNode
+from ._core import get_class_plan, get_registered_class
+from ._parallel import _scan
+
+MAGIC = b'ECA\x01'
+
+_INDEX_ENTRY = struct.Struct('<QQQ')
+_TRAILER = struct.Struct('<QQQ')
+
+#-------------------------------------------------------------------------------
+# Writing
+#-------------------------------------------------------------------------------
+class _ScanContext(EncodeContext):
+    """
+    EncodeContext for the pre-pass, that also records which objects are
+    reached more than once
+    """
+    def __init__(self):
+        EncodeContext.__init__(self)
+        
+        # id() of objects that were reached again after being registered
+        self.shared = set()
+    
+    def get_ref_id(self, obj):
+        ref_id = self._ref_ids.get(id(obj))
+        if(ref_id is not None):
+            self.shared.add(id(obj))
+        return(ref_id)
+
+class _RecordContext(EncodeContext):
+    """
+    EncodeContext that encodes one record.
+    All other record objects are considered already encoded, so they are
+    stored as references. Other objects are numbered from next_ref_id.
+    """
+    def __init__(self, record_ids, record, next_ref_id):
+        EncodeContext.__init__(self)
+        
+        # id(obj) --> <ref_id> of all records
+        self.record_ids = record_ids
+        self.record = record
+        self.next_ref_id = next_ref_id
+    
+    @property
+    def n_objects(self):
+        return(self.next_ref_id)
+    
+    def get_ref_id(self, obj):
+        ref_id = self._ref_ids.get(id(obj))
+        if((ref_id is None) and (obj is not self.record)):
+            ref_id = self.record_ids.get(id(obj))
+        return(ref_id)
+    
+    def add_obj(self, obj):
+        if(obj is self.record):
+            ref_id = self.record_ids[id(obj)]
+        else:
+            ref_id = self.next_ref_id
+            self.next_ref_id += 1
+        self._ref_ids[id(obj)] = ref_id
+        self._objs.append(obj)
+        return(ref_id)
+
+def _find_top_level(value, node, found):
+    """
+    Append all objects in value, described by node, that are not inside another
+    object to found
+    """
+    if(value is None):
+        return
+    kind = node.kind
+    if(kind == TemplateNode.ENCODABLE):
+        found.append(value)
+    elif((kind == TemplateNode.LIST) or (kind == TemplateNode.COLUMNAR)):
+        for v in value:
+            _find_top_level(v, node.item, found)
+    elif(kind == TemplateNode.TUPLE):
+        for n, v in zip(node.items, value):
+            if(n.has_encodable):
+                _find_top_level(v, n, found)
+    elif(kind == TemplateNode.DICT):
+        for v in value.values():
+            _find_top_level(v, node.value, found)
+
+def dump_archive(obj, path):
+    """
+    Encode EncodableClass obj, and everything it references, to a random-access
+    archive at path (or binary file-like object). See Archive
+    """
+    plan = get_class_plan(type(obj))
+    
+    # Find the objects that get their own record, in to_dict() order
+    ctx = _ScanContext()
+    ctx.add_obj(obj)
+    top_level = []
+    for key, node in plan.nodes:
+        if(node.has_encodable):
+            value = getattr(obj, key)
+            _scan(value, node, ctx)
+            _find_top_level(value, node, top_level)
+    
+    is_record = ctx.shared
+    is_record.add(id(obj))
+    is_record.update(id(o) for o in top_level)
+    records = [o for o in ctx._objs if id(o) in is_record]
+    del ctx, top_level, is_record
+    
+    record_ids = dict((id(o), ref_id) for ref_id, o in enumerate(records))
+    
+    if(hasattr(path, 'write')):
+        fp = path
+    else:
+        fp = open(path, 'wb')
+    try:
+        fp.write(MAGIC)
+        offset = len(MAGIC)
+        index = []
+        next_ref_id = len(records)
+        for record in records:
+            rctx = _RecordContext(record_ids, record, next_ref_id)
+            data = json.dumps(record.to_dict(rctx), separators=(',', ':')).encode('utf-8')
+            fp.write(data)
+            index.append(_INDEX_ENTRY.pack(offset, len(data), next_ref_id))
+            offset += len(data)
+            next_ref_id = rctx.next_ref_id
+        
+        fp.write(b"".join(index))
+        fp.write(_TRAILER.pack(offset, len(records), next_ref_id))
+        fp.write(MAGIC)
+    finally:
+        if(fp is not path):
+            fp.close()
+
+#-------------------------------------------------------------------------------
+# Reading
+#-------------------------------------------------------------------------------
+class _ArchiveObjects(dict):
+    """
+    Objects decoded from an Archive, by <ref_id>.
+    Looking up an object that was not decoded yet loads the record that
+    contains it, so that references between records resolve on demand.
+    """
+    def __init__(self, archive):
+        dict.__init__(self)
+        self.archive = archive
+    
+    def __contains__(self, ref_id):
+        return(dict.__contains__(self, ref_id) or self.archive._load(ref_id))
+    
+    def __missing__(self, ref_id):
+        if(not self.archive._load(ref_id)):
+            raise KeyError(ref_id)
+        return(dict.__getitem__(self, ref_id))
+
+class Archive:
+    """
+    Random-access archive written by dump_archive().
+    path is the archive file, which is memory-mapped, or a bytes-like object.
+    
+    Objects are only decoded when requested with get(), along with all objects
+    they reference. Objects are decoded once, so repeated requests, and
+    references from objects decoded later, return the same object.
+    
+        with Archive("model.eca") as archive:
+            part = archive.get(ref_id)
+    """
+    def __init__(self, path):
+        if(isinstance(path, (str, os.PathLike))):
+            with open(path, 'rb') as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty file cannot be mapped
+                    data = b''
+        else:
+            data = path
+        self.data = data
+        
+        trailer_offset = len(data) - _TRAILER.size - len(MAGIC)
+        if((trailer_offset < len(MAGIC))
+           or (bytes(data[:len(MAGIC)]) != MAGIC)
+           or (bytes(data[-len(MAGIC):]) != MAGIC)):
+            raise ValueError("Not an EncodableClass archive")
+        
+        self._index_offset, self.n_records, self.n_ref_ids = _TRAILER.unpack_from(data, trailer_offset)
+        if(self._index_offset + self.n_records * _INDEX_ENTRY.size != trailer_offset):
+            raise ValueError("Archive index is corrupt")
+        
+        self._objs = _ArchiveObjects(self)
+        
+        # DecodeContexts of records that were decoded, but whose references to
+        # other records are not resolved yet
+        self._unresolved = []
+    
+    def __len__(self):
+        return(self.n_records)
+    
+    @property
+    def n_objects(self):
+        """
+        Number of objects decoded so far
+        """
+        return(dict.__len__(self._objs))
+    
+    @property
+    def root(self):
+        """
+        The root object. Note that this decodes everything the root references
+        """
+        return(self.get(0))
+    
+    def get(self, ref_id):
+        """
+        Returns the object with ref_id
+        """
+        if(ref_id not in self._objs):
+            raise KeyError("Archive has no object with <ref_id> %d" % ref_id)
+        obj = dict.__getitem__(self._objs, ref_id)
+        
+        # Resolving references may load more records. Keep going until all
+        # are resolved
+        while(self._unresolved):
+            ctx = self._unresolved.pop()
+            ctx.resolve_pending(self._objs)
+            ctx.check_resolved()
+        return(obj)
+    
+    def get_raw(self, ref_id):
+        """
+        Returns the to_dict() form of record ref_id, without decoding it.
+        Other records are referenced as <ref>s
+        """
+        if((ref_id < 0) or (ref_id >= self.n_records)):
+            raise KeyError("Archive has no record with <ref_id> %d" % ref_id)
+        offset, size, _ = self._get_entry(ref_id)
+        return(json.loads(bytes(self.data[offset:offset+size])))
+    
+    def close(self):
+        self._objs = None
+        self._unresolved = None
+        if(type(self.data) == mmap.mmap):
+            self.data.close()
+        self.data = None
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    #---------------------------------------------------------------------------
+    def _get_entry(self, idx):
+        return(_INDEX_ENTRY.unpack_from(self.data, self._index_offset + idx * _INDEX_ENTRY.size))
+    
+    def _find_record(self, ref_id):
+        """
+        Returns the index of the record that contains ref_id, or None
+        """
+        if((type(ref_id) != int) or (ref_id < 0) or (ref_id >= self.n_ref_ids)):
+            return(None)
+        if(ref_id < self.n_records):
+            return(ref_id)
+        
+        # Last record whose range of <ref_id>s starts at or before ref_id
+        lo = 0
+        hi = self.n_records
+        while(lo < hi):
+            mid = (lo + hi) // 2
+            if(self._get_entry(mid)[2] <= ref_id):
+                lo = mid + 1
+            else:
+                hi = mid
+        return(lo - 1)
+    
+    def _load(self, ref_id):
+        """
+        Decode the record that contains ref_id, if it was not decoded yet.
+        Returns True if the object with ref_id exists
+        """
+        idx = self._find_record(ref_id)
+        if(idx is None):
+            return(False)
+        
+        if(not dict.__contains__(self._objs, idx)):
+            D = self.get_raw(idx)
+            cls = get_registered_class(D.get('<classtype>'))
+            if(cls is None):
+                raise TypeError("Unknown class '%s'" % D.get('<classtype>'))
+            
+            # Decode without resolving references to other records
+            decoded = DecodeContext()
+            obj = cls.from_dict(D, decoded)
+            if(decoded.get(idx) is not obj):
+                raise ValueError("Archive record %d is corrupt" % idx)
+            dict.update(self._objs, decoded)
+            self._unresolved.append(decoded)
+        
+        return(dict.__contains__(self._objs, ref_id))
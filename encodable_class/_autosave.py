@@ -0,0 +1,282 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Background saving of EncodableClass models
+#
+# save() takes a snapshot of the model with clone() on the calling thread, and
+# returns. A worker thread then encodes the snapshot, compresses it, and writes
+# it to a temporary file that is renamed over the destination once complete.
+# Since the snapshot is never modified, the model can keep changing while it is
+# being saved.
+#
+# The snapshot is encoded with JSONStreamWriter rather than json.dumps(), which
+# would hold the interpreter lock for the whole encode. Progress is the number
+# of objects written out of those in the snapshot.
+#
+# Requests made while a save is running are coalesced: only the latest
+# snapshot is saved once the running save completes.
+#
+
+import os
+import json
+import gzip
+import zlib
+import threading
+
+from ._clone import clone, _DEEPCOPY_MEMO
+from ._compare import graph_equal
+from ._json_stream import JSONStreamWriter
+from ._store import _fsync_dir
+
+# First bytes of a gzip file
+_GZIP_MAGIC = b'\x1f\x8b'
+
+#-------------------------------------------------------------------------------
+class AutoSaver:
+    """
+    Saves snapshots of EncodableClass models to path, in the background.
+    
+    The file is gzip-compressed JSON if compresslevel is not 0, otherwise
+    plain JSON. Either way, it holds the same data as json.dump(obj.to_dict()).
+    If skip_unchanged is True, a snapshot that is structurally equal to the
+    last one saved is not written.
+    
+    Callbacks are only called from poll(), on the thread that calls it:
+        on_progress(percent, status)
+        on_done(error)      error is None if the save succeeded
+    
+    From a Tk application, poll() can be called periodically with a
+    tk_extensions.Timer:
+        saver = AutoSaver("model.json.gz", on_progress=show_progress)
+        Timer(root, 100, saver.poll).start()
+        ...
+        saver.save(model)
+    """
+    def __init__(self, path, compresslevel=6, skip_unchanged=True,
+                 on_progress=None, on_done=None, chunk_size=65536):
+        self.path = os.fspath(path)
+        self.compresslevel = compresslevel
+        self.skip_unchanged = skip_unchanged
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.chunk_size = chunk_size
+        
+        # Number of snapshots that were written, and skipped as unchanged
+        self.n_saved = 0
+        self.n_skipped = 0
+        
+        # Exception raised by the last save, if it failed
+        self.error = None
+        
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        
+        # (snapshot, number of objects in it) waiting to be saved
+        self._pending = None
+        self._busy = False
+        self._closed = False
+        
+        # Last snapshot that was saved
+        self._last = None
+        
+        # Progress not yet reported by poll()
+        self._progress = None
+        self._results = []
+        
+        self._thread = None
+    
+    def save(self, obj):
+        """
+        Take a snapshot of EncodableClass obj, and save it in the background.
+        If a save is already running, the snapshot replaces any other one that
+        is waiting for it to complete.
+        """
+        memo = {}
+        snapshot = clone(obj, memo)
+        with self._cond:
+            if(self._closed):
+                raise ValueError("AutoSaver is closed")
+            # The memo also holds the deepcopy memo, which is not an object
+            self._pending = (snapshot, len(memo) - (_DEEPCOPY_MEMO in memo))
+            if(self._thread is None):
+                self._thread = threading.Thread(target=self._run, name="AutoSaver", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+    
+    @property
+    def busy(self):
+        """
+        True while a save is running or waiting to run
+        """
+        with self._lock:
+            return(self._busy or (self._pending is not None))
+    
+    def poll(self):
+        """
+        Report progress and completed saves through the callbacks, on the
+        calling thread. Returns True while busy.
+        """
+        with self._lock:
+            progress = self._progress
+            self._progress = None
+            results = self._results
+            self._results = []
+            busy = self._busy or (self._pending is not None)
+        
+        if((progress is not None) and (self.on_progress is not None)):
+            self.on_progress(*progress)
+        if(self.on_done is not None):
+            for error in results:
+                self.on_done(error)
+        return(busy)
+    
+    def wait(self, timeout=None):
+        """
+        Block until all requested saves are complete.
+        Returns False if timeout expired first.
+        """
+        with self._cond:
+            return(self._cond.wait_for(
+                lambda: not (self._busy or (self._pending is not None)),
+                timeout
+            ))
+    
+    def close(self):
+        """
+        Complete all requested saves, and stop the worker thread
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if(thread is not None):
+            thread.join()
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def load(self, cls):
+        """
+        Decode the saved model into EncodableClass cls.
+        Whether the file is compressed is told from its contents, not from
+        compresslevel, so files saved with other settings are read too.
+        """
+        with open(self.path, 'rb') as f:
+            is_gzip = (f.read(2) == _GZIP_MAGIC)
+        if(is_gzip):
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                D = json.load(f)
+        else:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                D = json.load(f)
+        return(cls.from_dict(D))
+    
+    #---------------------------------------------------------------------------
+    def _set_progress(self, percent, status):
+        with self._lock:
+            self._progress = (percent, status)
+    
+    def _run(self):
+        while(True):
+            with self._cond:
+                while((self._pending is None) and (not self._closed)):
+                    self._cond.wait()
+                if(self._pending is None):
+                    return
+                snapshot, n_objects = self._pending
+                self._pending = None
+                self._busy = True
+                last = self._last
+            
+            error = None
+            saved = False
+            try:
+                if(self.skip_unchanged and (last is not None)
+                   and graph_equal(snapshot, last)):
+                    pass
+                else:
+                    self._write(snapshot, n_objects)
+                    saved = True
+            except Exception as E:
+                error = E
+            
+            with self._cond:
+                if(error is not None):
+                    self._progress = (0, "Failed")
+                elif(saved):
+                    self._last = snapshot
+                    self.n_saved += 1
+                    self._progress = (100, "Saved")
+                else:
+                    self.n_skipped += 1
+                    self._progress = (100, "Unchanged")
+                self.error = error
+                self._results.append(error)
+                self._busy = False
+                self._cond.notify_all()
+    
+    def _write(self, snapshot, n_objects):
+        self._set_progress(0, "Saving")
+        writer = JSONStreamWriter(separators=(',', ':'))
+        if(self.compresslevel):
+            # gzip container, readable with gzip.open()
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+        else:
+            compressor = None
+        
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                buf = []
+                buf_len = 0
+                for chunk in writer.iterencode(snapshot):
+                    buf.append(chunk)
+                    buf_len += len(chunk)
+                    if(buf_len >= self.chunk_size):
+                        data = ''.join(buf).encode('utf-8')
+                        if(compressor is not None):
+                            data = compressor.compress(data)
+                        f.write(data)
+                        buf = []
+                        buf_len = 0
+                        self._set_progress(
+                            min(99, 100 * writer.ctx.n_objects // max(n_objects, 1)),
+                            "Saving"
+                        )
+                
+                data = ''.join(buf).encode('utf-8')
+                if(compressor is not None):
+                    data = compressor.compress(data) + compressor.flush()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        _fsync_dir(self.path)
@@ -0,0 +1,858 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Compact binary format for EncodableClass objects
+#
+# Since the merged encode_schema already defines the order and type of every
+# member, only the values themselves are stored:
+#
+#   Document:   MAGIC, followed by the root object
+#
+#   int:        varint(zigzag(value) + 1). 0 is None
+#   str:        varint(len + 1), followed by the UTF-8 bytes. 0 is None
+#   float:      0x00 for None, or 0x01 followed by a little-endian double
+#   bool:       0x00 False, 0x01 True, 0x02 None
+#   list:       varint(len), followed by the items
+#   dict:       varint(len), followed by key/value pairs
+#   tuple:      The items. The length is fixed by the template
+#   columnar:   varint(len), varint(class tag), varint(number of items that are
+#               not in the columns), followed by their indexes. Then one column
+#               per member of the class, in schema order, and finally the items
+#               that are not in the columns.
+#               int and float columns that contain no None are stored packed:
+#               A byte with the size of each item (int: 1, 2, 4 or 8, float: 8)
+#               followed by an array of little-endian signed ints or doubles.
+#               Otherwise, 0x00 followed by each value.
+#   codec:      The value returned by the codec, as a tagged generic value
+#   BufferCodec: The codec's info dictionary, as a tagged generic value, then
+#               varint(size) followed by the raw buffer
+#   other:      Tagged generic value
+#
+#   EncodableClass:
+#       varint(0): None
+#       varint(1), varint(ref_id): Reference to an object that was already stored
+#       varint(tag + 2): Object of the class with that tag, followed by its
+#                        members in schema order.
+#           Class tags are assigned in order of first use, and are shared with
+#           columnar lists. The first use of a
+#           tag is followed by the classid string, and the 8-byte fingerprint
+#           of the class's merged schema.
+#
+#   Objects are numbered (ref_id) in the order they are stored, the same way
+#   as to_dict() does.
+#
+
+import sys
+import mmap
+import struct
+import weakref
+from array import array
+
+from ._core import EncodeContext, TemplateNode
+from ._core import get_class_plan, get_classid_str, get_registered_class
+from ._core import _columnar_split
+from ._buffers import BufferCodec
+
+MAGIC = b'ECB\x01'
+
+# Generic value tags
+_G_NONE = 0
+_G_FALSE = 1
+_G_TRUE = 2
+_G_INT = 3
+_G_FLOAT = 4
+_G_STR = 5
+_G_LIST = 6
+_G_DICT = 7
+_G_BYTES = 8
+
+_DOUBLE = struct.Struct('<d')
+
+# Packed columns are stored little-endian
+_SWAP_COLUMNS = (sys.byteorder != 'little')
+
+# Packed int column item size --> (array typecode, min, max)
+_INT_COLUMN_TYPES = {}
+for _typecode in ('b', 'h', 'i', 'l', 'q'):
+    _size = array(_typecode).itemsize
+    if((_size in (1, 2, 4, 8)) and (_size not in _INT_COLUMN_TYPES)):
+        _INT_COLUMN_TYPES[_size] = (_typecode, -(1 << (8*_size - 1)), (1 << (8*_size - 1)) - 1)
+
+#-------------------------------------------------------------------------------
+# Primitives
+#-------------------------------------------------------------------------------
+def write_uvarint(buf, n):
+    while(n > 0x7F):
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def read_uvarint(data, pos):
+    b = data[pos]
+    pos += 1
+    if(b < 0x80):
+        return(b, pos)
+
+    result = b & 0x7F
+    shift = 7
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if(b < 0x80):
+            return(result, pos)
+        shift += 7
+
+def zigzag(n):
+    if(n >= 0):
+        return(n << 1)
+    return(((-n) << 1) - 1)
+
+def unzigzag(n):
+    if(n & 1):
+        return(-((n + 1) >> 1))
+    return(n >> 1)
+
+def write_generic(buf, v):
+    """
+    Write a primitive value of any type, prefixed by its type tag
+    """
+    if(v is None):
+        buf.append(_G_NONE)
+    elif(v is False):
+        buf.append(_G_FALSE)
+    elif(v is True):
+        buf.append(_G_TRUE)
+    elif(isinstance(v, int)):
+        buf.append(_G_INT)
+        write_uvarint(buf, zigzag(v))
+    elif(isinstance(v, float)):
+        buf.append(_G_FLOAT)
+        buf += _DOUBLE.pack(v)
+    elif(isinstance(v, str)):
+        b = v.encode('utf-8')
+        buf.append(_G_STR)
+        write_uvarint(buf, len(b))
+        buf += b
+    elif(isinstance(v, (list, tuple))):
+        buf.append(_G_LIST)
+        write_uvarint(buf, len(v))
+        for item in v:
+            write_generic(buf, item)
+    elif(isinstance(v, dict)):
+        buf.append(_G_DICT)
+        write_uvarint(buf, len(v))
+        for k, item in v.items():
+            write_generic(buf, k)
+            write_generic(buf, item)
+    elif(isinstance(v, (bytes, bytearray))):
+        buf.append(_G_BYTES)
+        write_uvarint(buf, len(v))
+        buf += v
+    else:
+        raise TypeError("Object of type '%s' cannot be stored in binary format" % type(v).__name__)
+
+def read_generic(data, pos):
+    tag = data[pos]
+    pos += 1
+    if(tag == _G_NONE):
+        return(None, pos)
+    elif(tag == _G_FALSE):
+        return(False, pos)
+    elif(tag == _G_TRUE):
+        return(True, pos)
+    elif(tag == _G_INT):
+        n, pos = read_uvarint(data, pos)
+        return(unzigzag(n), pos)
+    elif(tag == _G_FLOAT):
+        return(_DOUBLE.unpack_from(data, pos)[0], pos + 8)
+    elif(tag == _G_STR):
+        n, pos = read_uvarint(data, pos)
+        return(str(data[pos:pos+n], 'utf-8'), pos + n)
+    elif(tag == _G_LIST):
+        n, pos = read_uvarint(data, pos)
+        result = []
+        for _ in range(n):
+            v, pos = read_generic(data, pos)
+            result.append(v)
+        return(result, pos)
+    elif(tag == _G_DICT):
+        n, pos = read_uvarint(data, pos)
+        result = {}
+        for _ in range(n):
+            k, pos = read_generic(data, pos)
+            v, pos = read_generic(data, pos)
+            result[k] = v
+        return(result, pos)
+    elif(tag == _G_BYTES):
+        n, pos = read_uvarint(data, pos)
+        return(bytes(data[pos:pos+n]), pos + n)
+    else:
+        raise ValueError("Invalid value tag %d at offset %d" % (tag, pos - 1))
+
+def pack_int_column(values):
+    """
+    Returns (item size, packed bytes) of ints packed as a little-endian array
+    with the smallest item size that fits all of them, or (0, None) if they
+    do not fit in 64 bits
+    """
+    lo = min(values, default=0)
+    hi = max(values, default=0)
+    for size in sorted(_INT_COLUMN_TYPES.keys()):
+        typecode, size_lo, size_hi = _INT_COLUMN_TYPES[size]
+        if((lo >= size_lo) and (hi <= size_hi)):
+            return(size, pack_column(typecode, values))
+    return(0, None)
+
+def pack_column(typecode, values):
+    """
+    Returns values packed as a little-endian array
+    """
+    a = array(typecode, values)
+    if(_SWAP_COLUMNS):
+        a.byteswap()
+    return(a.tobytes())
+
+def unpack_column(typecode, data, start, end):
+    a = array(typecode)
+    a.frombytes(data[start:end])
+    if(_SWAP_COLUMNS):
+        a.byteswap()
+    return(a.tolist())
+
+#-------------------------------------------------------------------------------
+# Compiled member writers
+#
+# Writers have the signature:
+#   w(value, st)
+# where st is the _BinaryWriter
+#-------------------------------------------------------------------------------
+def _compile_writer(node):
+    kind = node.kind
+
+    if(kind == TemplateNode.PRIMITIVE):
+        tmpl = node.tmpl
+        check = node.encode
+
+        if(tmpl is int):
+            def w(v, st):
+                if(v is None):
+                    st.buf.append(0)
+                    return
+                if(type(v) is not int):
+                    check(v, st.ctx)
+                write_uvarint(st.buf, zigzag(v) + 1)
+
+        elif(tmpl is str):
+            def w(v, st):
+                if(v is None):
+                    st.buf.append(0)
+                    return
+                if(type(v) is not str):
+                    check(v, st.ctx)
+                b = v.encode('utf-8')
+                write_uvarint(st.buf, len(b) + 1)
+                st.buf += b
+
+        elif(tmpl is float):
+            def w(v, st):
+                if(v is None):
+                    st.buf.append(0)
+                    return
+                if(type(v) is not float):
+                    check(v, st.ctx)
+                st.buf.append(1)
+                st.buf += _DOUBLE.pack(v)
+
+        elif(tmpl is bool):
+            def w(v, st):
+                if(v is None):
+                    st.buf.append(2)
+                    return
+                if(type(v) is not bool):
+                    check(v, st.ctx)
+                st.buf.append(1 if v else 0)
+
+        else:
+            def w(v, st):
+                write_generic(st.buf, check(v, st.ctx))
+
+    elif((kind == TemplateNode.CODEC) and issubclass(node.tmpl, BufferCodec)):
+        codec = node.tmpl
+        check = node.encode
+        def w(v, st):
+            if(not codec.is_compatible(v)):
+                check(v, st.ctx)
+            info, buf = codec.to_buffer(v)
+            buf = memoryview(buf)
+            write_generic(st.buf, info)
+            write_uvarint(st.buf, buf.nbytes)
+            st.buf += buf
+
+    elif(kind == TemplateNode.CODEC):
+        encode = node.encode
+        def w(v, st):
+            write_generic(st.buf, encode(v, st.ctx))
+
+    elif(kind == TemplateNode.LIST):
+        item_w = _compile_writer(node.item)
+        check = node.encode
+        def w(v, st):
+            if(type(v) != list):
+                check(v, st.ctx)
+            write_uvarint(st.buf, len(v))
+            for item in v:
+                item_w(item, st)
+
+    elif(kind == TemplateNode.TUPLE):
+        item_ws = [_compile_writer(n) for n in node.items]
+        check = node.encode
+        def w(v, st):
+            if((type(v) != tuple) or (len(v) != len(item_ws))):
+                check(v, st.ctx)
+            for item_w, item in zip(item_ws, v):
+                item_w(item, st)
+
+    elif(kind == TemplateNode.DICT):
+        key_w = _compile_writer(node.key)
+        value_w = _compile_writer(node.value)
+        check = node.encode
+        def w(v, st):
+            if(type(v) != dict):
+                check(v, st.ctx)
+            write_uvarint(st.buf, len(v))
+            for k, item in v.items():
+                key_w(k, st)
+                value_w(item, st)
+
+    elif(kind == TemplateNode.COLUMNAR):
+        item_w = _compile_writer(node.item)
+        check = node.encode
+        tmpl = node.tmpl
+        def w(v, st):
+            if(type(v) != list):
+                check(v, st.ctx)
+            rows, fallback, _ = _columnar_split(tmpl, v, st.ctx)
+            plan = get_class_plan(tmpl.cls)
+
+            buf = st.buf
+            write_uvarint(buf, len(v))
+            st.write_class_tag(plan, 0)
+            write_uvarint(buf, len(fallback))
+            for idx in fallback:
+                write_uvarint(buf, idx)
+
+            for key, column_w in _get_column_writers(plan):
+                column_w([getattr(row, key) for row in rows], st)
+
+            for idx in fallback:
+                item_w(v[idx], st)
+
+    else:
+        tmpl = node.tmpl
+        check = node.encode
+        def w(v, st):
+            if(v is None):
+                st.buf.append(0)
+                return
+            if(not isinstance(v, tmpl)):
+                check(v, st.ctx)
+            st.write_obj(v)
+
+    return(w)
+
+def _compile_column_writer(node):
+    """
+    Writer for all values of one member of the objects in a columnar list.
+    Has the signature:
+        w(values, st)
+    """
+    value_w = _compile_writer(node)
+
+    if((node.kind == TemplateNode.PRIMITIVE) and (node.tmpl in (int, float))):
+        tmpl = node.tmpl
+        def w(values, st):
+            size = 0
+            if(set(map(type, values)) <= {tmpl}):
+                if(tmpl is int):
+                    size, packed = pack_int_column(values)
+                else:
+                    size, packed = 8, pack_column('d', values)
+            st.buf.append(size)
+            if(size):
+                st.buf += packed
+            else:
+                # Contains None, or something that does not fit
+                for v in values:
+                    value_w(v, st)
+    else:
+        def w(values, st):
+            for v in values:
+                value_w(v, st)
+
+    return(w)
+
+#-------------------------------------------------------------------------------
+# Generated member readers
+#
+# Reading is where most of the time goes, so rather than nesting one closure
+# per template level, Python source for a function that reads all members of a
+# class is generated from the plan and compiled once. Primitive values are
+# read inline. The generated function has the signature:
+#   read_members(data, pos, obj, st) --> pos
+# where st is the _BinaryReader. Strings and results of codecs that set
+# intern_results are interned with st.intern, unless it is None.
+#-------------------------------------------------------------------------------
+class _ReaderSource:
+    def __init__(self):
+        self.lines = []
+        self.namespace = {
+            'read_uvarint': read_uvarint,
+            'read_generic': read_generic,
+            'unpack_double': _DOUBLE.unpack_from,
+            'setattr': setattr,
+            'unpack_column': unpack_column,
+        }
+        self.n_vars = 0
+
+    def new_var(self):
+        self.n_vars += 1
+        return("v%d" % self.n_vars)
+
+    def add_const(self, value):
+        name = "c%d" % len(self.namespace)
+        self.namespace[name] = value
+        return(name)
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def emit_uvarint(self, indent, var):
+        self.emit(indent, "%s = data[pos]" % var)
+        self.emit(indent, "if(%s < 0x80):" % var)
+        self.emit(indent+1, "pos += 1")
+        self.emit(indent, "else:")
+        self.emit(indent+1, "%s, pos = read_uvarint(data, pos)" % var)
+
+    def emit_intern_value(self, indent, node, codec, var):
+        """
+        Emit code that interns var, the result of codec
+        """
+        if(node.tmpl.intern_results):
+            self.emit(indent, "if(intern is not None):")
+            self.emit(indent+1, "%s = intern.intern_value(%s, %s)" % (var, codec, var))
+
+    def emit_value(self, indent, node, var):
+        """
+        Emit code that reads a value described by node into var
+        """
+        kind = node.kind
+
+        if(kind == TemplateNode.PRIMITIVE):
+            tmpl = node.tmpl
+            if(tmpl is int):
+                self.emit_uvarint(indent, var)
+                self.emit(indent, "if(%s == 0):" % var)
+                self.emit(indent+1, "%s = None" % var)
+                self.emit(indent, "else:")
+                self.emit(indent+1, "%s -= 1" % var)
+                self.emit(indent+1, "%s = (%s >> 1) ^ -(%s & 1)" % (var, var, var))
+            elif(tmpl is str):
+                end = self.new_var()
+                self.emit_uvarint(indent, var)
+                self.emit(indent, "if(%s == 0):" % var)
+                self.emit(indent+1, "%s = None" % var)
+                self.emit(indent, "else:")
+                self.emit(indent+1, "%s = pos + %s - 1" % (end, var))
+                self.emit(indent+1, "%s = str(data[pos:%s], 'utf-8')" % (var, end))
+                self.emit(indent+1, "pos = %s" % end)
+                self.emit(indent+1, "if(intern is not None):")
+                self.emit(indent+2, "%s = intern.intern_str(%s)" % (var, var))
+            elif(tmpl is float):
+                self.emit(indent, "if(data[pos] == 0):")
+                self.emit(indent+1, "%s = None" % var)
+                self.emit(indent+1, "pos += 1")
+                self.emit(indent, "else:")
+                self.emit(indent+1, "%s = unpack_double(data, pos + 1)[0]" % var)
+                self.emit(indent+1, "pos += 9")
+            elif(tmpl is bool):
+                self.emit(indent, "%s = data[pos]" % var)
+                self.emit(indent, "%s = None if (%s == 2) else (%s == 1)" % (var, var, var))
+                self.emit(indent, "pos += 1")
+            else:
+                self.emit(indent, "%s, pos = read_generic(data, pos)" % var)
+
+        elif((kind == TemplateNode.CODEC) and issubclass(node.tmpl, BufferCodec)):
+            codec = self.add_const(node.tmpl)
+            info = self.new_var()
+            end = self.new_var()
+            self.emit(indent, "%s, pos = read_generic(data, pos)" % info)
+            self.emit_uvarint(indent, end)
+            self.emit(indent, "%s += pos" % end)
+            self.emit(indent, "%s = %s.from_buffer(%s, memoryview(data)[pos:%s].toreadonly())" % (var, codec, info, end))
+            self.emit(indent, "pos = %s" % end)
+            self.emit_intern_value(indent, node, codec, var)
+
+        elif(kind == TemplateNode.CODEC):
+            codec = self.add_const(node.tmpl)
+            self.emit(indent, "%s, pos = read_generic(data, pos)" % var)
+            self.emit(indent, "%s = %s.decode(%s)" % (var, codec, var))
+            self.emit_intern_value(indent, node, codec, var)
+
+        elif(kind == TemplateNode.LIST):
+            n = self.new_var()
+            item = self.new_var()
+            self.emit_uvarint(indent, n)
+            self.emit(indent, "%s = []" % var)
+            self.emit(indent, "for _ in range(%s):" % n)
+            self.emit_value(indent+1, node.item, item)
+            self.emit(indent+1, "%s.append(%s)" % (var, item))
+
+        elif(kind == TemplateNode.TUPLE):
+            items = []
+            for item_node in node.items:
+                item = self.new_var()
+                self.emit_value(indent, item_node, item)
+                items.append(item)
+            self.emit(indent, "%s = (%s,)" % (var, ", ".join(items)))
+
+        elif(kind == TemplateNode.DICT):
+            n = self.new_var()
+            k = self.new_var()
+            item = self.new_var()
+            self.emit_uvarint(indent, n)
+            self.emit(indent, "%s = {}" % var)
+            self.emit(indent, "for _ in range(%s):" % n)
+            self.emit_value(indent+1, node.key, k)
+            self.emit_value(indent+1, node.value, item)
+            self.emit(indent+1, "%s[%s] = %s" % (var, k, item))
+
+        elif(kind == TemplateNode.COLUMNAR):
+            tmpl = self.add_const(node.tmpl)
+            self.emit(indent, "%s, pos = st.read_columnar(data, pos, %s)" % (var, tmpl))
+
+        else:
+            tmpl = self.add_const(node.tmpl)
+            self.emit(indent, "%s, pos = st.read_obj(data, pos, %s)" % (var, tmpl))
+
+def _generate_reader(plan):
+    src = _ReaderSource()
+    src.emit(0, "def read_members(data, pos, obj, st):")
+    src.emit(1, "intern = st.intern")
+    for key, node in plan.nodes:
+        var = src.new_var()
+        src.emit_value(1, node, var)
+        src.emit(1, "setattr(obj, %r, %s)" % (key, var))
+    src.emit(1, "return(pos)")
+
+    code = compile("\n".join(src.lines), "<binary reader for %s>" % plan.classid, "exec")
+    exec(code, src.namespace)
+    return(src.namespace['read_members'])
+
+def _generate_column_reader(plan):
+    """
+    Generates a function that reads the columns of a columnar list:
+        read_columns(data, pos, objs, st) --> pos
+    where objs are the objects stored in the columns
+    """
+    src = _ReaderSource()
+    src.emit(0, "def read_columns(data, pos, objs, st):")
+    src.emit(1, "intern = st.intern")
+    src.emit(1, "n = len(objs)")
+    for key, node in plan.nodes:
+        src.emit(1, "col = []")
+        indent = 1
+        if((node.kind == TemplateNode.PRIMITIVE) and (node.tmpl in (int, float))):
+            if(node.tmpl is int):
+                typecodes = dict((size, tc) for size, (tc, _, _) in _INT_COLUMN_TYPES.items())
+            else:
+                typecodes = {8: 'd'}
+            src.emit(1, "size = data[pos]")
+            src.emit(1, "if(size):")
+            src.emit(2, "if(size not in %r):" % typecodes)
+            src.emit(3, "raise ValueError('Invalid column item size %d at offset %d' % (size, pos))")
+            src.emit(2, "end = pos + 1 + size*n")
+            src.emit(2, "col = unpack_column(%r[size], data, pos + 1, end)" % typecodes)
+            src.emit(2, "pos = end")
+            src.emit(1, "else:")
+            src.emit(2, "pos += 1")
+            indent = 2
+        var = src.new_var()
+        src.emit(indent, "for _ in range(n):")
+        src.emit_value(indent+1, node, var)
+        src.emit(indent+1, "col.append(%s)" % var)
+        src.emit(1, "for obj, v in zip(objs, col):")
+        src.emit(2, "setattr(obj, %r, v)" % key)
+    src.emit(1, "return(pos)")
+
+    code = compile("\n".join(src.lines), "<binary column reader for %s>" % plan.classid, "exec")
+    exec(code, src.namespace)
+    return(src.namespace['read_columns'])
+
+# ClassPlan --> [(key, writer), ...]
+_plan_writers = weakref.WeakKeyDictionary()
+
+# ClassPlan --> read_members()
+_plan_readers = weakref.WeakKeyDictionary()
+
+# ClassPlan --> [(key, column writer), ...]
+_plan_column_writers = weakref.WeakKeyDictionary()
+
+# ClassPlan --> read_columns()
+_plan_column_readers = weakref.WeakKeyDictionary()
+
+def _get_writers(plan):
+    try:
+        return(_plan_writers[plan])
+    except KeyError:
+        writers = [(key, _compile_writer(node)) for key, node in plan.nodes]
+        _plan_writers[plan] = writers
+        return(writers)
+
+def _get_readers(plan):
+    try:
+        return(_plan_readers[plan])
+    except KeyError:
+        reader = _generate_reader(plan)
+        _plan_readers[plan] = reader
+        return(reader)
+
+def _get_column_writers(plan):
+    try:
+        return(_plan_column_writers[plan])
+    except KeyError:
+        writers = [(key, _compile_column_writer(node)) for key, node in plan.nodes]
+        _plan_column_writers[plan] = writers
+        return(writers)
+
+def _get_column_reader(plan):
+    try:
+        return(_plan_column_readers[plan])
+    except KeyError:
+        reader = _generate_column_reader(plan)
+        _plan_column_readers[plan] = reader
+        return(reader)
+
+#-------------------------------------------------------------------------------
+class _BinaryWriter:
+    def __init__(self, fp, flush_size):
+        self.fp = fp
+        self.flush_size = flush_size
+        self.buf = bytearray()
+        self.ctx = EncodeContext()
+
+        # ClassPlan --> tag
+        self.class_tags = {}
+
+    def write_root(self, obj):
+        self.buf += MAGIC
+        self.write_obj(obj)
+        self.fp.write(self.buf)
+        self.buf.clear()
+
+    def write_obj(self, obj):
+        buf = self.buf
+        ctx = self.ctx
+
+        ref_id = ctx.get_ref_id(obj)
+        if(ref_id is not None):
+            # This object has already been stored elsewhere.
+            # Instead, just store a reference to the other one
+            ctx.add_ref(ref_id)
+            buf.append(1)
+            write_uvarint(buf, ref_id)
+            return
+
+        ctx.add_obj(obj)
+        plan = get_class_plan(type(obj))
+        self.write_class_tag(plan, 2)
+
+        for key, w in _get_writers(plan):
+            w(getattr(obj, key), self)
+
+        if(len(buf) >= self.flush_size):
+            self.fp.write(buf)
+            buf.clear()
+
+    def write_class_tag(self, plan, offset):
+        """
+        Write the tag of a class, plus offset.
+        The class is defined if this is the first time it is used.
+        """
+        buf = self.buf
+        tag = self.class_tags.get(plan)
+        if(tag is None):
+            # First use of this class. Define its tag
+            tag = len(self.class_tags)
+            self.class_tags[plan] = tag
+            write_uvarint(buf, tag + offset)
+            classid = plan.classid.encode('utf-8')
+            write_uvarint(buf, len(classid))
+            buf += classid
+            buf += bytes.fromhex(plan.fingerprint)
+        else:
+            write_uvarint(buf, tag + offset)
+
+#-------------------------------------------------------------------------------
+class _BinaryReader:
+    def __init__(self, intern=None):
+        # Decoded objects, indexed by ref_id
+        self.objs = []
+
+        # InternTable that decoded values are interned with, or None
+        self.intern = intern
+
+        # Indexed by tag: (class, read_members)
+        self.class_tags = []
+
+    def read_obj(self, data, pos, tmpl):
+        marker = data[pos]
+        if(marker < 0x80):
+            pos += 1
+        else:
+            marker, pos = read_uvarint(data, pos)
+
+        if(marker == 0):
+            return(None, pos)
+
+        if(marker == 1):
+            # Reference to an object that was already decoded
+            ref_id, pos = read_uvarint(data, pos)
+            if(ref_id >= len(self.objs)):
+                raise ValueError("Unresolved reference to object with ref_id %d" % ref_id)
+            obj = self.objs[ref_id]
+            if(not isinstance(obj, tmpl)):
+                raise TypeError("Referenced type '%s' is incompatible with '%s'"
+                    % (get_classid_str(type(obj)), get_classid_str(tmpl)))
+            return(obj, pos)
+
+        cls, read_members, pos = self._get_class(marker - 2, data, pos)
+        if(not issubclass(cls, tmpl)):
+            raise TypeError("Type '%s' is incompatible with '%s'"
+                % (get_classid_str(cls), get_classid_str(tmpl)))
+
+        obj = cls.__new__(cls)
+        self.objs.append(obj)
+        return(obj, read_members(data, pos, obj, self))
+
+    def read_columnar(self, data, pos, tmpl):
+        length, pos = read_uvarint(data, pos)
+        tag, pos = read_uvarint(data, pos)
+        cls, _, pos = self._get_class(tag, data, pos)
+        if(cls is not tmpl.cls):
+            raise TypeError("Type '%s' is incompatible with '%s'"
+                % (get_classid_str(cls), tmpl))
+
+        n_fallback, pos = read_uvarint(data, pos)
+        fallback = []
+        for _ in range(n_fallback):
+            idx, pos = read_uvarint(data, pos)
+            if((idx >= length) or (fallback and (idx <= fallback[-1]))):
+                raise ValueError("Invalid columnar row index %d at offset %d" % (idx, pos))
+            fallback.append(idx)
+
+        objs = [cls.__new__(cls) for _ in range(length - n_fallback)]
+        self.objs.extend(objs)
+        pos = _get_column_reader(get_class_plan(cls))(data, pos, objs, self)
+
+        if(not fallback):
+            return(objs, pos)
+
+        result = [None] * length
+        is_fallback = set(fallback)
+        it = iter(objs)
+        for idx in range(length):
+            if(idx not in is_fallback):
+                result[idx] = next(it)
+        for idx in fallback:
+            result[idx], pos = self.read_obj(data, pos, cls)
+        return(result, pos)
+
+    def _get_class(self, tag, data, pos):
+        """
+        Returns (cls, read_members, pos) of a class tag. If this is the first
+        use of the tag, its definition is read.
+        """
+        if(tag == len(self.class_tags)):
+            pos = self._read_class_def(data, pos)
+        elif(tag > len(self.class_tags)):
+            raise ValueError("Invalid class tag %d at offset %d" % (tag, pos))
+
+        cls, read_members = self.class_tags[tag]
+        return(cls, read_members, pos)
+
+    def _read_class_def(self, data, pos):
+        n, pos = read_uvarint(data, pos)
+        classid = str(data[pos:pos+n], 'utf-8')
+        pos += n
+        fingerprint = bytes(data[pos:pos+8]).hex()
+        pos += 8
+
+        cls = get_registered_class(classid)
+        if(cls is None):
+            raise TypeError("Unknown class '%s'" % classid)
+
+        plan = get_class_plan(cls)
+        if(plan.fingerprint != fingerprint):
+            raise ValueError("Schema of class '%s' does not match the one it was stored with" % classid)
+
+        self.class_tags.append((cls, _get_readers(plan)))
+        return(pos)
+
+#-------------------------------------------------------------------------------
+def dumpb(obj, fp, flush_size=1048576):
+    """
+    Encode EncodableClass obj in the compact binary format, and write it to the
+    binary file-like object fp.
+    Output is written in blocks of roughly flush_size bytes.
+    """
+    _BinaryWriter(fp, flush_size).write_root(obj)
+
+#-------------------------------------------------------------------------------
+def loadb(fp, cls, mapped=False, intern=None):
+    """
+    Decode an object of EncodableClass cls from the compact binary format.
+    fp is a binary file-like object, or a bytes-like object
+
+    If mapped is True, the file fp is memory-mapped rather than read, and
+    objects decoded by a BufferCodec that can be views (memoryview, numpy
+    arrays) refer directly to the mapped file.
+
+    intern is an optional InternTable. (See from_dict())
+    """
+    if(mapped and hasattr(fp, 'fileno')):
+        data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    elif(hasattr(fp, 'read')):
+        data = fp.read()
+    else:
+        data = fp
+
+    if(bytes(data[:len(MAGIC)]) != MAGIC):
+        raise ValueError("Not an EncodableClass binary document")
+
+    reader = _BinaryReader(intern)
+    root, pos = reader.read_obj(data, len(MAGIC), cls)
+    if((root is None) or (type(root) is not cls)):
+        raise ValueError("Data is incompatible with object '%s'" % cls.__name__)
+    if(pos != len(data)):
+        raise ValueError("Extra data at offset %d" % pos)
+    return(root)
@@ -0,0 +1,320 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Codecs for objects backed by a raw buffer
+#
+# Encoding large numeric buffers as lists of Python numbers is slow, and
+# uses a lot of memory. The codecs here store the raw bytes instead:
+#   - Inline, as a base64 string, by default
+#   - In a separate binary "sidecar" file, while a SidecarWriter is active.
+#     Objects are then decoded from views into the memory-mapped sidecar file
+#     while a SidecarReader is active.
+#   - Inline, as raw bytes, in the compact binary format (See dumpb())
+#
+# Encoded form:
+#   {<codec specific info>, "<data>" : base64 string}
+#   {<codec specific info>, "<blob>" : [offset, size]}
+#
+
+import os
+import sys
+import mmap
+import base64
+import contextvars
+from array import array
+
+from ._core import ForeignObjectCodec, _is_mapping
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Sidecar writer/reader that buffer codecs currently use, if any
+_active_writer = contextvars.ContextVar("sidecar_writer", default=None)
+_active_reader = contextvars.ContextVar("sidecar_reader", default=None)
+
+#-------------------------------------------------------------------------------
+class SidecarWriter:
+    """
+    Collects the raw buffers of objects encoded by a BufferCodec into the binary
+    file path (or binary file-like object), rather than storing them inline.
+    
+    Buffers are only redirected while the writer is active:
+        with SidecarWriter("doc.blob"):
+            dump(obj, fp)
+    
+    Each buffer starts at a multiple of alignment bytes, so that views of it
+    are suitably aligned for any item type.
+    """
+    def __init__(self, path, alignment=64):
+        if(hasattr(path, 'write')):
+            self.fp = path
+            self._owns_fp = False
+        else:
+            self.fp = open(path, 'wb')
+            self._owns_fp = True
+        self.alignment = alignment
+        self.offset = 0
+        self._token = None
+    
+    def write(self, buf):
+        """
+        Append buffer buf to the sidecar file.
+        Returns its location: [offset, size]
+        """
+        pad = (-self.offset) % self.alignment
+        if(pad):
+            self.fp.write(bytes(pad))
+            self.offset += pad
+        
+        offset = self.offset
+        size = memoryview(buf).nbytes
+        self.fp.write(buf)
+        self.offset += size
+        return([offset, size])
+    
+    def close(self):
+        if(self._owns_fp):
+            self.fp.close()
+    
+    def __enter__(self):
+        self._token = _active_writer.set(self)
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_writer.reset(self._token)
+        self._token = None
+        self.close()
+
+#-------------------------------------------------------------------------------
+class SidecarReader:
+    """
+    Provides the buffers stored by a SidecarWriter while decoding.
+    path is the sidecar file, which is memory-mapped, or a bytes-like object.
+    
+        with SidecarReader("doc.blob"):
+            obj = load(fp, MyClass)
+    
+    Decoded objects that can be views (memoryview, numpy arrays) refer directly
+    to the mapped file, which therefore stays mapped until they are all freed.
+    """
+    def __init__(self, path):
+        if(isinstance(path, (str, os.PathLike))):
+            with open(path, 'rb') as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty file cannot be mapped
+                    data = b''
+        else:
+            data = path
+        self.data = memoryview(data)
+        self._token = None
+    
+    def view(self, offset, size):
+        """
+        Returns a read-only memoryview of the buffer at offset
+        """
+        if((offset < 0) or (size < 0) or (offset + size > len(self.data))):
+            raise ValueError("Buffer [%d:%d] is outside of the sidecar data" % (offset, offset + size))
+        return(self.data[offset:offset+size].toreadonly())
+    
+    def __enter__(self):
+        self._token = _active_reader.set(self)
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_reader.reset(self._token)
+        self._token = None
+
+#-------------------------------------------------------------------------------
+class BufferCodec(ForeignObjectCodec):
+    """
+    Template for an object that is backed by a raw buffer.
+    
+    Rather than encode and decode, subclasses override to_buffer() and
+    from_buffer().
+    """
+    @classmethod
+    def to_buffer(cls, obj):
+        """
+        Returns (info, buf) for object obj.
+        info is a dictionary of primitive values needed to re-create the
+        object, and buf is a C-contiguous bytes-like object.
+        By default, buf is bytes(obj), with no info.
+        """
+        return({}, bytes(obj))
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        """
+        Create an object of type cls.obj_type from the info and buf returned
+        by to_buffer().
+        buf is a read-only memoryview of the bytes. It may refer to a
+        memory-mapped file, so make a copy if the object must own its data.
+        By default, returns bytes(buf).
+        """
+        return(bytes(buf))
+    
+    @classmethod
+    def encode(cls, obj):
+        info, buf = cls.to_buffer(obj)
+        D = dict(info)
+        writer = _active_writer.get()
+        if(writer is None):
+            D['<data>'] = base64.b64encode(buf).decode('ascii')
+        else:
+            D['<blob>'] = writer.write(buf)
+        return(D)
+    
+    @classmethod
+    def decode(cls, d):
+        if(not _is_mapping(d)):
+            raise TypeError("Expected encoded buffer. Got '%s'" % type(d).__name__)
+        
+        info = dict(d)
+        if('<data>' in info):
+            buf = memoryview(base64.b64decode(info.pop('<data>'))).toreadonly()
+        elif('<blob>' in info):
+            reader = _active_reader.get()
+            if(reader is None):
+                raise ValueError("Buffer is stored in a sidecar file, but no SidecarReader is active")
+            offset, size = info.pop('<blob>')
+            buf = reader.view(offset, size)
+        else:
+            raise ValueError("Encoded buffer has no data")
+        return(cls.from_buffer(info, buf))
+    
+    @classmethod
+    def copy(cls, obj):
+        info, buf = cls.to_buffer(obj)
+        return(cls.from_buffer(dict(info), memoryview(bytes(buf)).toreadonly()))
+
+#-------------------------------------------------------------------------------
+class BytesCodec(BufferCodec):
+    obj_type = bytes
+    
+    @classmethod
+    def to_buffer(cls, obj):
+        return({}, obj)
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        return(bytes(buf))
+    
+    @classmethod
+    def copy(cls, obj):
+        # Immutable
+        return(obj)
+
+#-------------------------------------------------------------------------------
+class ByteArrayCodec(BufferCodec):
+    obj_type = bytearray
+    
+    @classmethod
+    def to_buffer(cls, obj):
+        return({}, obj)
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        return(bytearray(buf))
+    
+    @classmethod
+    def copy(cls, obj):
+        return(bytearray(obj))
+
+#-------------------------------------------------------------------------------
+class MemoryViewCodec(BufferCodec):
+    """
+    Decodes to a read-only view of the stored data, without copying it.
+    Only native item formats are supported.
+    """
+    obj_type = memoryview
+    
+    @classmethod
+    def to_buffer(cls, obj):
+        info = {'format': obj.format, 'shape': list(obj.shape)}
+        if(not obj.c_contiguous):
+            obj = memoryview(obj.tobytes())
+        return(info, obj.cast('B'))
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        if(info['format'] == 'B' and len(info['shape']) == 1):
+            return(buf)
+        return(buf.cast(info['format'], info['shape']))
+
+#-------------------------------------------------------------------------------
+class ArrayCodec(BufferCodec):
+    """
+    Items are stored little-endian.
+    array.array cannot be a view, so decoding makes a single copy of the data.
+    """
+    obj_type = array
+    
+    @classmethod
+    def to_buffer(cls, obj):
+        if(sys.byteorder != 'little'):
+            obj = array(obj.typecode, obj)
+            obj.byteswap()
+        return({'typecode': obj.typecode}, memoryview(obj).cast('B'))
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        a = array(info['typecode'])
+        a.frombytes(buf)
+        if(sys.byteorder != 'little'):
+            a.byteswap()
+        return(a)
+    
+    @classmethod
+    def copy(cls, obj):
+        return(obj[:])
+
+#-------------------------------------------------------------------------------
+class NDArrayCodec(BufferCodec):
+    """
+    numpy.ndarray. Requires numpy to be installed.
+    Decodes to a read-only array that is a view of the stored data.
+    Arrays of Python objects are not supported.
+    """
+    obj_type = (numpy.ndarray if (numpy is not None) else None)
+    
+    @classmethod
+    def to_buffer(cls, obj):
+        if(obj.dtype.hasobject):
+            raise TypeError("Arrays of Python objects cannot be stored as a buffer")
+        obj = numpy.ascontiguousarray(obj)
+        info = {'dtype': obj.dtype.str, 'shape': list(obj.shape)}
+        return(info, memoryview(obj.reshape(-1).view(numpy.uint8)))
+    
+    @classmethod
+    def from_buffer(cls, info, buf):
+        if(numpy is None):
+            raise ImportError("NDArrayCodec requires numpy")
+        a = numpy.frombuffer(buf, dtype=numpy.dtype(info['dtype']))
+        return(a.reshape(info['shape']))
+    
+    @classmethod
+    def copy(cls, obj):
+        return(obj.copy())
@@ -0,0 +1,178 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Deep copy of EncodableClass object graphs
+#
+# Same result as cls.from_dict(obj.to_dict()), but objects are copied directly,
+# without building the intermediate dictionaries. Each class's merged schema is
+# compiled once into a list of member copiers.
+#
+# Shared references and cycles are preserved: each object is copied exactly
+# once. Values that are immutable (primitives, tuples of them, and the values
+# of codecs that set intern_results) are shared with the original rather than
+# copied. Other codec values are copied with ForeignObjectCodec.copy(), and
+# values of other mutable types with copy.deepcopy(), using one deepcopy memo
+# per clone so that they stay shared too.
+#
+# Values are not checked against their templates. Members that are not part
+# of the merged encode_schema are not copied.
+#
+
+import copy
+import weakref
+
+from ._core import EncodableClass, ForeignObjectCodec, TemplateNode, get_class_plan
+
+# Primitive types whose values can be shared
+_IMMUTABLE_TYPES = (int, float, complex, str, bytes, bool, type(None))
+
+# Key of the clone memo that holds the memo of copy.deepcopy()
+_DEEPCOPY_MEMO = '<deepcopy>'
+
+#-------------------------------------------------------------------------------
+# Copiers have the signature:
+#   c(value, memo) -> copied value
+# where memo maps id(obj) --> copy of obj for all objects copied so far,
+# plus the deepcopy memo under _DEEPCOPY_MEMO.
+# A copier of None means that the value is shared.
+#-------------------------------------------------------------------------------
+def _compile_copier(node):
+    kind = node.kind
+    
+    if(kind == TemplateNode.PRIMITIVE):
+        if(node.tmpl in _IMMUTABLE_TYPES):
+            return(None)
+        
+        # Arbitrary value of a mutable type. Copy it the slow way
+        def c(v, memo):
+            try:
+                dc_memo = memo[_DEEPCOPY_MEMO]
+            except KeyError:
+                dc_memo = memo[_DEEPCOPY_MEMO] = {}
+            return(copy.deepcopy(v, dc_memo))
+    
+    elif(kind == TemplateNode.CODEC):
+        codec = node.tmpl
+        if(codec.intern_results and (codec.copy.__func__ is ForeignObjectCodec.copy.__func__)):
+            # Immutable. No need to call copy() at all
+            return(None)
+        codec_copy = codec.copy
+        
+        def c(v, memo):
+            if(v is None):
+                return(None)
+            return(codec_copy(v))
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        c = _copy_obj
+    
+    elif((kind == TemplateNode.LIST) or (kind == TemplateNode.COLUMNAR)):
+        item_c = _compile_copier(node.item)
+        if(item_c is None):
+            def c(v, memo):
+                return(list(v))
+        else:
+            def c(v, memo):
+                return([item_c(item, memo) for item in v])
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_cs = [_compile_copier(n) for n in node.items]
+        if(all(item_c is None for item_c in item_cs)):
+            # Immutable through and through
+            return(None)
+        
+        def c(v, memo):
+            return(tuple([
+                item if (item_c is None) else item_c(item, memo)
+                for item_c, item in zip(item_cs, v)
+            ]))
+    
+    else:
+        key_c = _compile_copier(node.key)
+        val_c = _compile_copier(node.value)
+        if((key_c is None) and (val_c is None)):
+            def c(v, memo):
+                return(dict(v))
+        elif(key_c is None):
+            def c(v, memo):
+                return({k : val_c(item, memo) for k, item in v.items()})
+        else:
+            if(val_c is None):
+                val_c = _share
+            def c(v, memo):
+                return({key_c(k, memo) : val_c(item, memo) for k, item in v.items()})
+    
+    return(c)
+
+def _share(v, memo):
+    return(v)
+
+# ClassPlan --> [(key, copier), ...]
+_plan_copiers = weakref.WeakKeyDictionary()
+
+def _get_copiers(plan):
+    try:
+        return(_plan_copiers[plan])
+    except KeyError:
+        copiers = [(key, _compile_copier(node)) for key, node in plan.nodes]
+        _plan_copiers[plan] = copiers
+        return(copiers)
+
+def _copy_obj(obj, memo):
+    if(obj is None):
+        return(None)
+    
+    new = memo.get(id(obj))
+    if(new is not None):
+        # Already copied. Keep the reference shared
+        return(new)
+    
+    if(not isinstance(obj, EncodableClass)):
+        raise TypeError("Expected an EncodableClass. Got '%s'" % type(obj).__name__)
+    
+    cls = type(obj)
+    new = cls.__new__(cls)
+    memo[id(obj)] = new
+    
+    for key, c in _get_copiers(get_class_plan(cls)):
+        v = getattr(obj, key)
+        if(c is None):
+            setattr(new, key, v)
+        else:
+            setattr(new, key, c(v, memo))
+    return(new)
+
+#-------------------------------------------------------------------------------
+def clone(obj, memo=None):
+    """
+    Returns a deep copy of the EncodableClass object obj, and of everything it
+    references according to its encode_schema.
+    
+    memo is an optional dictionary of id(original) --> copy. Pass the same one
+    to several calls to copy objects that share references as a whole, or
+    inspect it afterwards to find the copy of any original object.
+    Values of mutable primitive types, copied with copy.deepcopy(), are found
+    in the deepcopy memo stored under the key '<deepcopy>' instead.
+    """
+    if(memo is None):
+        memo = {}
+    return(_copy_obj(obj, memo))
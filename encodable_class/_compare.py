@@ -0,0 +1,502 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Structural equality and diff of EncodableClass object graphs
+#
+# Two graphs are equal if their objects can be paired one-to-one, in the order
+# to_dict() visits them, such that paired objects are of the same class and
+# their encode_schema members are equal. This is the same as comparing the
+# to_dict() results of both, but without encoding either side:
+#   - Primitives are equal if they are of the same type and compare equal
+#     (NaN is equal to itself)
+#   - Codec values are equal if their encoded forms are
+#   - Dictionaries are compared regardless of their order
+#   - Shared references and cycles must have the same shape on both sides
+#
+# Differences are reported as paths from the root: tuples of member names,
+# list indexes and dictionary keys.
+#
+# A GraphHasher computes structural hashes of subgraphs, and caches them.
+# Hashes ignore how objects are shared, so graphs with equal hashes may still
+# differ, but graphs with different hashes always do. graph_equal() uses them
+# to return early when a cached hash already tells the graphs apart. Since
+# hashes cannot be invalidated automatically, only use one for graphs that are
+# no longer modified, such as snapshots made with clone().
+#
+
+import hashlib
+import weakref
+
+from ._core import TemplateNode, get_class_plan
+
+#-------------------------------------------------------------------------------
+# Primitive values
+#-------------------------------------------------------------------------------
+def _value_equal(a, b):
+    """
+    Compare values made of primitives, lists, tuples and dicts
+    """
+    if(a is b):
+        return(True)
+    t = type(a)
+    if(t is not type(b)):
+        return(False)
+    
+    if((t is list) or (t is tuple)):
+        if(len(a) != len(b)):
+            return(False)
+        for x, y in zip(a, b):
+            if(not _value_equal(x, y)):
+                return(False)
+        return(True)
+    
+    if(t is dict):
+        if(len(a) != len(b)):
+            return(False)
+        for k, x in a.items():
+            if((k not in b) or (not _value_equal(x, b[k]))):
+                return(False)
+        return(True)
+    
+    if(t is float):
+        # NaN is equal to itself, same as in to_dict() results
+        return((a == b) or ((a != a) and (b != b)))
+    
+    return(a == b)
+
+def _feed_value(hb, v):
+    """
+    Feed a value made of primitives, lists, tuples and dicts to hash hb.
+    Values that are equal according to _value_equal() are fed the same way.
+    """
+    t = type(v)
+    if(t is str):
+        b = v.encode('utf-8', 'surrogatepass')
+        hb.update(b's%d:' % len(b))
+        hb.update(b)
+    elif(t is float):
+        # -0.0 == 0.0
+        hb.update(b'f' + repr(v + 0.0).encode('ascii'))
+    elif((t is int) or (t is bool) or (v is None) or (t is bytes) or (t is complex)):
+        hb.update(t.__name__.encode('ascii') + repr(v).encode('ascii'))
+    elif((t is list) or (t is tuple)):
+        if(t is list):
+            hb.update(b'[')
+            for x in v:
+                _feed_value(hb, x)
+            hb.update(b']')
+        else:
+            hb.update(b'(')
+            for x in v:
+                _feed_value(hb, x)
+            hb.update(b')')
+    elif(t is dict):
+        # Independent of the order of items
+        entries = []
+        for k, x in v.items():
+            eh = hashlib.blake2b(digest_size=16)
+            _feed_value(eh, k)
+            _feed_value(eh, x)
+            entries.append(eh.digest())
+        entries.sort()
+        hb.update(b'{%d:' % len(entries))
+        hb.update(b''.join(entries))
+    else:
+        hb.update(t.__name__.encode('utf-8'))
+        try:
+            hb.update(b'%d' % hash(v))
+        except TypeError:
+            # Unhashable. Only its type is taken into account
+            pass
+
+#-------------------------------------------------------------------------------
+# Comparers have the signature:
+#   c(a, b, st, path)
+# where st is the _CompareState, and path is the location of a and b as a
+# linked list: None for the root, otherwise (parent path, key).
+# Differences are reported with st.differ(path)
+#-------------------------------------------------------------------------------
+def _compile_comparer(node):
+    kind = node.kind
+    
+    if(kind == TemplateNode.PRIMITIVE):
+        if(node.tmpl in (int, str, bool)):
+            def c(a, b, st, path):
+                if((a is not b) and ((type(a) is not type(b)) or (a != b))):
+                    st.differ(path)
+        else:
+            def c(a, b, st, path):
+                if(not _value_equal(a, b)):
+                    st.differ(path)
+    
+    elif(kind == TemplateNode.CODEC):
+        encode = node.tmpl.encode
+        def c(a, b, st, path):
+            if(a is b):
+                return
+            if((a is None) or (b is None) or (not _value_equal(encode(a), encode(b)))):
+                st.differ(path)
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        def c(a, b, st, path):
+            st.compare_obj(a, b, path)
+    
+    elif((kind == TemplateNode.LIST) or (kind == TemplateNode.COLUMNAR)):
+        item_c = _compile_comparer(node.item)
+        def c(a, b, st, path):
+            if((type(a) is not list) or (type(b) is not list) or (len(a) != len(b))):
+                if(not ((a is None) and (b is None))):
+                    st.differ(path)
+                return
+            for idx, (x, y) in enumerate(zip(a, b)):
+                item_c(x, y, st, (path, idx))
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_cs = [_compile_comparer(n) for n in node.items]
+        def c(a, b, st, path):
+            if((type(a) is not tuple) or (type(b) is not tuple) or (len(a) != len(b))):
+                if(not ((a is None) and (b is None))):
+                    st.differ(path)
+                return
+            for idx, (item_c, x, y) in enumerate(zip(item_cs, a, b)):
+                item_c(x, y, st, (path, idx))
+    
+    else:
+        val_c = _compile_comparer(node.value)
+        def c(a, b, st, path):
+            if((type(a) is not dict) or (type(b) is not dict)):
+                if(not ((a is None) and (b is None))):
+                    st.differ(path)
+                return
+            for k, x in a.items():
+                if(k in b):
+                    val_c(x, b[k], st, (path, k))
+                else:
+                    st.differ((path, k))
+            for k in b.keys():
+                if(k not in a):
+                    st.differ((path, k))
+    
+    return(c)
+
+#-------------------------------------------------------------------------------
+# Feeders have the signature:
+#   f(v, hasher, hb, stack, reqs)
+# where hb is the hash of the object that v belongs to, and stack is the
+# _Stack of objects being hashed, which ends with that object.
+# reqs collects the objects higher up in the stack that the object's hash
+# depends on. (See GraphHasher._hash())
+#-------------------------------------------------------------------------------
+def _compile_feeder(node):
+    kind = node.kind
+    
+    if(kind == TemplateNode.PRIMITIVE):
+        def f(v, hasher, hb, stack, reqs):
+            _feed_value(hb, v)
+    
+    elif(kind == TemplateNode.CODEC):
+        encode = node.tmpl.encode
+        def f(v, hasher, hb, stack, reqs):
+            if(v is None):
+                hb.update(b'N')
+            else:
+                _feed_value(hb, encode(v))
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        def f(v, hasher, hb, stack, reqs):
+            hasher._feed_obj(v, hb, stack, reqs)
+    
+    elif((kind == TemplateNode.LIST) or (kind == TemplateNode.COLUMNAR)):
+        item_f = _compile_feeder(node.item)
+        def f(v, hasher, hb, stack, reqs):
+            if(v is None):
+                hb.update(b'N')
+                return
+            hb.update(b'[')
+            for item in v:
+                item_f(item, hasher, hb, stack, reqs)
+            hb.update(b']')
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_fs = [_compile_feeder(n) for n in node.items]
+        def f(v, hasher, hb, stack, reqs):
+            if(v is None):
+                hb.update(b'N')
+                return
+            hb.update(b'(')
+            for item_f, item in zip(item_fs, v):
+                item_f(item, hasher, hb, stack, reqs)
+            hb.update(b')')
+    
+    else:
+        key_f = _compile_feeder(node.key)
+        val_f = _compile_feeder(node.value)
+        def f(v, hasher, hb, stack, reqs):
+            if(v is None):
+                hb.update(b'N')
+                return
+            # Independent of the order of items
+            entries = []
+            for k, item in v.items():
+                eh = hashlib.blake2b(digest_size=16)
+                key_f(k, hasher, eh, stack, reqs)
+                val_f(item, hasher, eh, stack, reqs)
+                entries.append(eh.digest())
+            entries.sort()
+            hb.update(b'{%d:' % len(entries))
+            hb.update(b''.join(entries))
+    
+    return(f)
+
+#-------------------------------------------------------------------------------
+# ClassPlan --> ([(key, comparer), ...], [(key, feeder), ...])
+_plan_functions = weakref.WeakKeyDictionary()
+
+def _get_functions(plan):
+    try:
+        return(_plan_functions[plan])
+    except KeyError:
+        functions = (
+            [(key, _compile_comparer(node)) for key, node in plan.nodes],
+            [(key, _compile_feeder(node)) for key, node in plan.nodes],
+        )
+        _plan_functions[plan] = functions
+        return(functions)
+
+class _Stack:
+    """
+    Objects currently being visited, from the root down
+    """
+    def __init__(self):
+        self.objs = []
+        
+        # id(obj) --> index in objs
+        self.index = {}
+    
+    def push(self, obj):
+        self.index[id(obj)] = len(self.objs)
+        self.objs.append(obj)
+    
+    def pop(self):
+        del self.index[id(self.objs.pop())]
+
+#-------------------------------------------------------------------------------
+class GraphHasher:
+    """
+    Computes structural hashes of EncodableClass object graphs, and caches the
+    hashes of their subgraphs.
+    
+    Graphs that are equal according to graph_equal() have equal hashes.
+    The converse does not hold: shared references are hashed as if each were a
+    separate copy, so graphs that only differ in how they share objects have
+    equal hashes. A reference back to an object that is still being hashed (a cycle)
+    is hashed by how many levels up that object is.
+    
+    Cached hashes are not updated when objects are modified. Use forget() on
+    each modified object, or clear(), if they are.
+    """
+    def __init__(self):
+        # id(obj) --> (obj, digest, reqs)
+        # reqs is a tuple of (distance, ancestor) for every object higher up in
+        # the stack that the hash depends on.
+        self._cache = {}
+        
+        # id(obj) --> ids of the objects whose hash included the hash of obj
+        self._dependents = {}
+    
+    @property
+    def n_cached(self):
+        """
+        Number of objects whose hash is cached
+        """
+        return(len(self._cache))
+    
+    def hash(self, obj):
+        """
+        Returns the hash of the subgraph of obj, as a 16-byte digest
+        """
+        return(self._hash(obj, _Stack())[0])
+    
+    def forget(self, obj):
+        """
+        Discard the cached hash of obj, and of every object whose hash was
+        computed from it, directly or not. Do so for every object that changed.
+        """
+        todo = [id(obj)]
+        while(todo):
+            obj_id = todo.pop()
+            self._cache.pop(obj_id, None)
+            todo.extend(self._dependents.pop(obj_id, ()))
+    
+    def clear(self):
+        """
+        Discard all cached hashes
+        """
+        self._cache.clear()
+        self._dependents.clear()
+    
+    def _hash(self, obj, stack):
+        """
+        Returns (digest, reqs) of obj, whose ancestors are in stack
+        """
+        entry = self._cache.get(id(obj))
+        if(entry is not None):
+            _, digest, reqs = entry
+            
+            # Hashes that depend on ancestors are only valid with the same ones
+            depth = len(stack.objs)
+            for dist, target in reqs:
+                if((dist > depth) or (stack.objs[depth - dist] is not target)):
+                    break
+            else:
+                return(digest, reqs)
+        
+        plan = get_class_plan(type(obj))
+        hb = hashlib.blake2b(digest_size=16)
+        hb.update(plan.classid.encode('utf-8'))
+        
+        # id(ancestor) --> (distance, ancestor)
+        reqs = {}
+        stack.push(obj)
+        try:
+            for key, f in _get_functions(plan)[1]:
+                hb.update(b'.')
+                f(getattr(obj, key), self, hb, stack, reqs)
+        finally:
+            stack.pop()
+        
+        digest = hb.digest()
+        reqs = tuple(reqs.values())
+        self._cache[id(obj)] = (obj, digest, reqs)
+        return(digest, reqs)
+    
+    def _feed_obj(self, v, hb, stack, reqs):
+        """
+        Feed a reference to object v, from the object at the top of stack
+        """
+        if(v is None):
+            hb.update(b'N')
+            return
+        
+        owner = len(stack.objs) - 1
+        idx = stack.index.get(id(v))
+        if(idx is not None):
+            # Cycle back to an object that is still being hashed
+            dist = owner - idx
+            hb.update(b'<%d' % dist)
+            if(dist > 0):
+                reqs[id(v)] = (dist, v)
+            return
+        
+        digest, child_reqs = self._hash(v, stack)
+        self._dependents.setdefault(id(v), set()).add(id(stack.objs[owner]))
+        hb.update(b'O')
+        hb.update(digest)
+        for dist, target in child_reqs:
+            # Distances are relative to the child, one level down
+            if(dist > 1):
+                reqs[id(target)] = (dist - 1, target)
+
+#-------------------------------------------------------------------------------
+class _Different(Exception):
+    pass
+
+def _path_tuple(path):
+    keys = []
+    while(path is not None):
+        path, key = path
+        keys.append(key)
+    return(tuple(reversed(keys)))
+
+class _CompareState:
+    def __init__(self, stop):
+        # If True, stop at the first difference by raising _Different
+        self.stop = stop
+        self.paths = []
+        
+        # Pairing of objects: id(a) --> b, and id(b) --> a
+        self.ab = {}
+        self.ba = {}
+    
+    def differ(self, path):
+        if(self.stop):
+            raise _Different
+        self.paths.append(_path_tuple(path))
+    
+    def compare_obj(self, a, b, path):
+        if((a is None) or (b is None)):
+            if(a is not b):
+                self.differ(path)
+            return
+        
+        pa = self.ab.get(id(a))
+        pb = self.ba.get(id(b))
+        if((pa is not None) or (pb is not None)):
+            # At least one was visited already. Both must be references to
+            # each other's counterpart
+            if((pa is not b) or (pb is not a)):
+                self.differ(path)
+            return
+        
+        if(type(a) is not type(b)):
+            self.differ(path)
+            return
+        self.ab[id(a)] = b
+        self.ba[id(b)] = a
+        
+        if(a is b):
+            # Same object on both sides
+            return
+        
+        for key, c in _get_functions(get_class_plan(type(a)))[0]:
+            c(getattr(a, key), getattr(b, key), self, (path, key))
+
+def graph_equal(a, b, hasher=None):
+    """
+    Check if the EncodableClass object graphs of a and b are structurally
+    equal. Stops at the first difference.
+    
+    If a GraphHasher is given, graphs whose hashes differ are known to be
+    unequal without comparing them. Otherwise, the result is the same as
+    without one.
+    """
+    if((hasher is not None) and (a is not None) and (b is not None)
+       and (hasher.hash(a) != hasher.hash(b))):
+        return(False)
+    
+    st = _CompareState(True)
+    try:
+        st.compare_obj(a, b, None)
+    except _Different:
+        return(False)
+    return(True)
+
+def graph_diff(a, b):
+    """
+    Compare the EncodableClass object graphs of a and b.
+    Returns the list of paths where they differ, or an empty list if they are
+    equal. Each path is a tuple of member names, list indexes and dictionary
+    keys leading from the root to the difference. () is the root itself.
+    """
+    st = _CompareState(False)
+    st.compare_obj(a, b, None)
+    return(st.paths)
@@ -0,0 +1,1981 @@
+# The MIT License (MIT)
+# 
+# Copyright (c) 2016 Alex Mykyta
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Creates a mechanism where Python classes can be converted to/from primitive
+# data types.
+# This is used as an intermediate layer to JSON encoding/decoding
+# 
+
+import weakref
+import hashlib
+import random
+import contextvars
+import collections
+from collections.abc import Mapping
+
+def get_all_subclasses(cls):
+    all_subclasses = []
+    for subclass in cls.__subclasses__():
+        all_subclasses.append(subclass)
+        all_subclasses.extend(get_all_subclasses(subclass))
+    return(list(set(all_subclasses)))
+    
+#-------------------------------------------------------------------------------
+def get_classid_str(cls):
+    return("%s.%s" % (cls.__module__, cls.__name__))
+
+#-------------------------------------------------------------------------------
+def is_in_list(obj, obj_list):
+    """
+    Check if obj is in obj_list explicitly by id
+    Using (obj in obj_list) has false positives if the object overrides its __eq__ operator
+    """
+    for o in obj_list:
+        if(id(o) == id(obj)):
+            return(True)
+    else:
+        return(False)
+
+#-------------------------------------------------------------------------------
+# Class registry
+#-------------------------------------------------------------------------------
+# classid string --> list of weak references to the classes with that
+# classid, in order of definition
+# Populated automatically as EncodableClass and ForeignObjectCodec subclasses
+# are defined. The registry does not keep classes alive: a class that is freed
+# is removed from it. (Compiled plans and subtype tables do refer to the
+# classes they were used with, until invalidate_plans() is called)
+_class_registry = {}
+
+# template class --> {classid : acceptable class, or None}
+# Caches the result of looking up a classid as a subtype of a template
+_subtype_tables = weakref.WeakKeyDictionary()
+
+def register_class(cls):
+    """
+    Add cls to the class registry
+    """
+    classid = get_classid_str(cls)
+    
+    def unregister(ref):
+        classes = _class_registry.get(classid)
+        if(classes is not None):
+            if(ref in classes):
+                classes.remove(ref)
+            if(not classes):
+                del _class_registry[classid]
+    
+    _class_registry.setdefault(classid, []).append(weakref.ref(cls, unregister))
+    
+    # A new class may change the outcome of previous lookups, but only for the
+    # templates it is a subclass of
+    for base in cls.__mro__:
+        table = _subtype_tables.get(base)
+        if(table is not None):
+            table.clear()
+
+def get_registered_class(classid):
+    """
+    Returns the most recently defined class registered with classid, or None
+    """
+    for ref in reversed(_class_registry.get(classid, [])):
+        cls = ref()
+        if(cls is not None):
+            return(cls)
+    return(None)
+
+def get_subtype_table(tmpl):
+    """
+    Returns the (cached) table of classid lookups for template class tmpl
+    """
+    try:
+        return(_subtype_tables[tmpl])
+    except KeyError:
+        table = {}
+        _subtype_tables[tmpl] = table
+        return(table)
+
+def lookup_subtype(tmpl, classid):
+    """
+    Returns the class identified by classid if it is tmpl, or a subclass of tmpl.
+    Otherwise, returns None
+    """
+    table = get_subtype_table(tmpl)
+    try:
+        return(table[classid])
+    except KeyError:
+        pass
+    
+    result = None
+    for ref in reversed(_class_registry.get(classid, [])):
+        cls = ref()
+        if((cls is not None) and issubclass(cls, tmpl)):
+            result = cls
+            break
+    table[classid] = result
+    return(result)
+
+#-------------------------------------------------------------------------------
+class Ref:
+    """
+    Temporary placeholder for unresolved references
+    
+    tmpl is the template class the referenced object must be compatible with,
+    if known.
+    """
+    def __init__(self, ref_id, tmpl = None):
+        self.ref_id = ref_id
+        self.tmpl = tmpl
+        
+#-------------------------------------------------------------------------------
+class PendingTuple:
+    """
+    Temporary placeholder for a tuple that contains unresolved references.
+    Tuples are immutable, so the tuple is only built once all of its items
+    are resolved.
+    """
+    def __init__(self):
+        self.items = []
+        self.n_pending = 0
+        
+        # Where the tuple is to be stored once complete: (container, index)
+        self.slot = None
+
+def is_pending(obj):
+    """
+    Check if obj is a placeholder that will be replaced by a DecodeContext
+    """
+    return((type(obj) == Ref) or (type(obj) == PendingTuple))
+
+#-------------------------------------------------------------------------------
+class DecodeContext(dict):
+    """
+    Maps <ref_id> to decoded objects during a single decode pass.
+    
+    Also keeps track of where placeholders for not-yet-decoded objects were
+    stored (see defer()), and replaces them as soon as the referenced object is
+    added. Objects that are stored directly (ctx[ref_id] = obj) rather than
+    with add_obj() are substituted by resolve_pending().
+    
+    If weak is True, decoded objects are only held by weak reference where
+    possible, so that they can be freed while decoding is still in progress.
+    
+    If intern is an InternTable, the decoders intern the values they decode
+    with it. (See InternTable)
+    """
+    def __init__(self, weak = False, intern = None):
+        dict.__init__(self)
+        
+        self.intern = intern
+        
+        # ref_id --> [(container, index, tmpl), ...]
+        self._pending = {}
+        
+        if(weak):
+            self._weak_objs = weakref.WeakValueDictionary()
+            
+            # ref_ids of all objects that were added as weak references
+            self._weak_ids = set()
+        else:
+            self._weak_objs = None
+            self._weak_ids = None
+        self._n_added = 0
+        
+        # Number of Ref placeholders handed out by get_ref().
+        # Decoders compare it before and after decoding a value to find out
+        # whether the value needs to be searched for placeholders at all
+        self.n_placeholders = 0
+    
+    @property
+    def n_objects(self):
+        """
+        Number of objects decoded
+        """
+        return(self._n_added)
+    
+    @property
+    def n_pending(self):
+        """
+        Number of placeholders still waiting for the object they reference
+        """
+        return(sum(len(v) for v in self._pending.values()))
+    
+    def add_obj(self, ref_id, obj):
+        """
+        Register a decoded object, and resolve any placeholders that refer to it
+        """
+        if(self.get_obj(ref_id) is not None):
+            # An object with the same ID was already decoded??
+            raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+        
+        self._n_added += 1
+        if(self._weak_objs is None):
+            self[ref_id] = obj
+        else:
+            try:
+                self._weak_objs[ref_id] = obj
+                self._weak_ids.add(ref_id)
+            except TypeError:
+                # Object does not support weak references
+                self[ref_id] = obj
+        
+        fixups = self._pending.pop(ref_id, None)
+        if(fixups):
+            for container, index, tmpl in fixups:
+                self._check_ref(obj, tmpl)
+                self._store(container, index, obj)
+    
+    def get_obj(self, ref_id):
+        """
+        Returns the decoded object with ref_id, or None
+        """
+        obj = self.get(ref_id)
+        if((obj is None) and (self._weak_objs is not None)):
+            obj = self._weak_objs.get(ref_id)
+        return(obj)
+    
+    def get_ref(self, ref_id, tmpl):
+        """
+        Returns the decoded object with ref_id if there is one. Otherwise
+        returns a Ref placeholder that shall be passed to defer()
+        """
+        obj = self.get_obj(ref_id)
+        if(obj is None):
+            if((self._weak_ids is not None) and (ref_id in self._weak_ids)):
+                raise ValueError("Object with <ref_id> %d was referenced after it was discarded" % ref_id)
+            self.n_placeholders += 1
+            return(Ref(ref_id, tmpl))
+        self._check_ref(obj, tmpl)
+        return(obj)
+    
+    def defer(self, container, index, placeholder):
+        """
+        Record that placeholder (A Ref or PendingTuple) was stored at:
+            container[index] if container is a list, dict or PendingTuple
+            getattr(container, index) otherwise
+        It will be replaced once resolved.
+        """
+        if(type(container) == PendingTuple):
+            container.n_pending += 1
+        
+        if(type(placeholder) == Ref):
+            self._pending.setdefault(placeholder.ref_id, []).append((container, index, placeholder.tmpl))
+        else:
+            placeholder.slot = (container, index)
+    
+    def resolve_pending(self, objs = None):
+        """
+        Replace the placeholders of objects that are now known.
+        Objects are looked up in objs if given, otherwise in the context itself.
+        """
+        for ref_id in list(self._pending.keys()):
+            if(objs is None):
+                obj = self.get_obj(ref_id)
+            elif(ref_id in objs):
+                obj = objs[ref_id]
+            else:
+                obj = None
+            
+            if(obj is not None):
+                for container, index, tmpl in self._pending.pop(ref_id):
+                    self._check_ref(obj, tmpl)
+                    self._store(container, index, obj)
+    
+    def check_resolved(self):
+        """
+        Raises ValueError if any references were never resolved
+        """
+        for ref_id in self._pending.keys():
+            raise ValueError("Unresolved reference to object with ref_id %d" % ref_id)
+    
+    def _check_ref(self, obj, tmpl):
+        # Verify that the referenced object type is compatible with the template
+        if((tmpl is not None) and (not isinstance(obj, tmpl))):
+            raise TypeError("Referenced type '%s' is incompatible with '%s'"
+                % (get_classid_str(type(obj)), get_classid_str(tmpl)))
+    
+    def _store(self, container, index, value):
+        if(type(container) == PendingTuple):
+            container.items[index] = value
+            container.n_pending -= 1
+            if((container.n_pending == 0) and (container.slot is not None)):
+                # All items of the tuple are resolved. It can be built now
+                parent, parent_index = container.slot
+                self._store(parent, parent_index, tuple(container.items))
+        elif((type(container) == list) or (type(container) == dict)):
+            container[index] = value
+        else:
+            setattr(container, index, value)
+        
+#-------------------------------------------------------------------------------
+class EncodeContext:
+    """
+    Tracks which objects have already been encoded during a single encode pass.
+
+    Objects are keyed by id() so that each lookup is constant time, regardless
+    of how many objects have been encoded so far. Encoded objects are also held
+    by the context so that their id() cannot be reused while it is alive.
+    """
+    def __init__(self):
+        # id(obj) --> ref_id
+        self._ref_ids = {}
+        
+        # Encoded objects, indexed by their ref_id
+        self._objs = []
+        
+        # ref_ids that were referenced at least once after being encoded
+        self._shared = set()
+        
+        # Number of <ref> markers emitted
+        self.n_refs = 0
+    
+    @property
+    def n_objects(self):
+        """
+        Number of distinct objects encoded
+        """
+        return(len(self._objs))
+    
+    @property
+    def n_shared(self):
+        """
+        Number of distinct objects that were referenced more than once
+        """
+        return(len(self._shared))
+    
+    def get_ref_id(self, obj):
+        """
+        Returns the ref_id of obj if it has already been encoded, otherwise None
+        """
+        return(self._ref_ids.get(id(obj)))
+    
+    def add_ref(self, ref_id):
+        """
+        Records that a reference to an already-encoded object was emitted
+        """
+        self.n_refs += 1
+        self._shared.add(ref_id)
+    
+    def add_obj(self, obj):
+        """
+        Registers obj as encoded, and returns its newly assigned ref_id
+        """
+        ref_id = len(self._objs)
+        self._ref_ids[id(obj)] = ref_id
+        self._objs.append(obj)
+        return(ref_id)
+    
+#-------------------------------------------------------------------------------
+# Columnar lists
+#-------------------------------------------------------------------------------
+class Columnar:
+    """
+    Template for a list of EncodableClass objects that is encoded column-wise.
+    
+    Use it in place of a list template:
+        {"items" : Columnar(MyClass)}
+    
+    Rather than one dictionary per object, the list is encoded as a single
+    dictionary holding one list per member of MyClass:
+        {
+            "<columnar>" : classid of MyClass,
+            "<length>" : Length of the list,
+            "<ref_id>" : ref_id of the first object stored in the columns,
+            "<columns>" : {key : [value, ...]},
+            "<rows>" : [[index, encoded item], ...]
+        }
+    
+    Only objects that are exactly of class MyClass, and have not already been
+    encoded elsewhere, are stored in the columns. They are assigned consecutive
+    ref_ids. Everything else (None, subclasses of MyClass, shared references)
+    is encoded normally, and listed in "<rows>" by its index in the list.
+    """
+    def __init__(self, cls):
+        if((not isinstance(cls, type)) or (not issubclass(cls, EncodableClass))):
+            raise TypeError("Columnar() requires an EncodableClass. Got %r" % (cls,))
+        self.cls = cls
+    
+    def __eq__(self, other):
+        return((type(other) == Columnar) and (other.cls is self.cls))
+    
+    def __hash__(self):
+        return(hash((Columnar, self.cls)))
+    
+    def __repr__(self):
+        return("Columnar(%s)" % get_classid_str(self.cls))
+
+def _columnar_split(tmpl, items, ctx):
+    """
+    Split list items for Columnar template tmpl into objects that are stored in
+    the columns, and indexes of the ones that are not.
+    Column objects are registered with EncodeContext ctx.
+    Returns: (rows, fallback_indexes, base_ref_id)
+    """
+    cls = tmpl.cls
+    rows = []
+    fallback = []
+    base = ctx.n_objects
+    for idx, item in enumerate(items):
+        if((type(item) is cls) and (ctx.get_ref_id(item) is None)):
+            ctx.add_obj(item)
+            rows.append(item)
+        else:
+            fallback.append(idx)
+    return(rows, fallback, base)
+
+def _is_mapping(obj):
+    """
+    Check if obj is the encoded form of an object or dict.
+    Besides dicts, read-only mappings (such as MappingProxyType) are accepted
+    """
+    return((type(obj) == dict) or isinstance(obj, Mapping))
+
+#-------------------------------------------------------------------------------
+def _columnar_unpack(tmpl, D, plan, parent_key, depth):
+    """
+    Validate the encoded form of a Columnar list.
+    Returns: (length, base_ref_id, columns, rows, row_indexes)
+        rows is the list of [index, encoded item] that are not in the columns
+        row_indexes is the list index of each object in the columns
+    """
+    if((not _is_mapping(D)) or ('<columnar>' not in D)):
+        raise TypeError("'%s', depth=%d: Expected a columnar list of '%s'"
+            % (parent_key, depth, tmpl.cls.__name__))
+    
+    if(D['<columnar>'] != plan.classid):
+        raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+            % (parent_key, depth, D['<columnar>'], plan.classid))
+    
+    length = D['<length>']
+    rows = D['<rows>']
+    
+    is_row = [False] * length
+    for idx, _ in rows:
+        if((type(idx) != int) or (idx < 0) or (idx >= length) or is_row[idx]):
+            raise ValueError("'%s', depth=%d: Invalid columnar row index %r"
+                % (parent_key, depth, idx))
+        is_row[idx] = True
+    row_indexes = [idx for idx in range(length) if not is_row[idx]]
+    
+    columns = D['<columns>']
+    for key, _ in plan.nodes:
+        if(len(columns[key]) != len(row_indexes)):
+            raise ValueError("'%s', depth=%d: Column '%s' has length %d. Expected %d"
+                % (parent_key, depth, key, len(columns[key]), len(row_indexes)))
+    
+    return(length, D['<ref_id>'], columns, rows, row_indexes)
+
+#-------------------------------------------------------------------------------
+# Reference fix-up
+#
+# Decoders resolve a reference as soon as they read it if the referenced object
+# was already decoded, which is always the case for documents written by
+# to_dict(). Otherwise they store a Ref placeholder, and the DecodeContext
+# counts it. Whoever decoded a value that handed out placeholders searches the
+# value for them, and records where each one was stored with defer(). Once the
+# whole document is decoded, only the recorded places are patched.
+#-------------------------------------------------------------------------------
+def _defer_placeholders(container, index, value, ctx):
+    """
+    Record the placeholders in value, which is stored at container[index] (or
+    attribute index of an object).
+    Lists and dicts are searched. Objects and tuples are not, since they record
+    their own placeholders.
+    """
+    t = type(value)
+    if((t == Ref) or (t == PendingTuple)):
+        ctx.defer(container, index, value)
+    elif(t == list):
+        for i, v in enumerate(value):
+            _defer_placeholders(value, i, v, ctx)
+    elif(t == dict):
+        for k, v in value.items():
+            _defer_placeholders(value, k, v, ctx)
+
+def _defer_members(obj, plan, ctx):
+    """
+    Record the placeholders stored in the members of obj
+    """
+    for key in plan.ref_keys:
+        _defer_placeholders(obj, key, getattr(obj, key), ctx)
+
+def _make_tuple(items, n_placeholders, ctx):
+    """
+    Build a decoded tuple from the list of decoded items.
+    n_placeholders is the ctx.n_placeholders count from before the items were
+    decoded. If any item is a placeholder, a PendingTuple is returned instead.
+    """
+    if(ctx.n_placeholders == n_placeholders):
+        return(tuple(items))
+    
+    pt = PendingTuple()
+    pt.items = items
+    for idx, v in enumerate(items):
+        _defer_placeholders(pt, idx, v, ctx)
+    if(pt.n_pending == 0):
+        return(tuple(items))
+    return(pt)
+
+#-------------------------------------------------------------------------------
+# Template compilers
+#
+# Instead of re-inspecting a template with type() checks for every value,
+# each template is compiled once into a tree of specialized callables.
+# Compiled encoders/decoders have the signature:
+#   f(obj, ctx) -> result
+# where ctx is the EncodeContext, or the _decoded_objs dictionary.
+#
+# The compilers are called by TemplateNode, once the nodes of the template's
+# children are built, and reuse the children's compiled callables. Each part of
+# a template is therefore compiled once per validation level.
+#-------------------------------------------------------------------------------
+def _compile_encoder(node):
+    tmpl, parent_key, depth = node.tmpl, node.parent_key, node.depth
+    kind = node.kind
+
+    if(kind == TemplateNode.LIST):
+        item_enc = node.item.encode
+
+        def enc(obj, ctx):
+            # Expecting a list of items
+            if(type(obj) != list):
+                raise TypeError("'%s', depth=%d: Expected 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            return([item_enc(item, ctx) for item in obj])
+
+    elif(kind == TemplateNode.COLUMNAR):
+        item_enc = node.item.encode
+        
+        def enc(obj, ctx):
+            # Expecting a list of items
+            if(type(obj) != list):
+                raise TypeError("'%s', depth=%d: Expected 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            
+            rows, fallback, base = _columnar_split(tmpl, obj, ctx)
+            
+            columns = {}
+            for key, e in _plan_members(get_class_plan(tmpl.cls), 'encoders'):
+                columns[key] = [e(getattr(row, key), ctx) for row in rows]
+            
+            D = {}
+            D['<columnar>'] = get_classid_str(tmpl.cls)
+            D['<length>'] = len(obj)
+            D['<ref_id>'] = base
+            D['<columns>'] = columns
+            D['<rows>'] = [[idx, item_enc(obj[idx], ctx)] for idx in fallback]
+            return(D)
+        
+    elif(kind == TemplateNode.TUPLE):
+        item_encs = [n.encode for n in node.items]
+
+        def enc(obj, ctx):
+            # Expecting a tuple of items
+            if(type(obj) != tuple):
+                raise TypeError("'%s', depth=%d: Expected 'tuple'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+
+            # Size of tuples must match
+            if(len(item_encs) != len(obj)):
+                raise ValueError("'%s', depth=%d: Tuple len(%d) does not match template len(%d)"
+                    % (parent_key, depth, len(obj), len(item_encs)))
+
+            return(tuple([e(item, ctx) for e, item in zip(item_encs, obj)]))
+
+    elif(kind == TemplateNode.DICT):
+        key_enc = node.key.encode
+        val_enc = node.value.encode
+
+        def enc(obj, ctx):
+            # Expecting a dictionary
+            if(not _is_mapping(obj)):
+                raise TypeError("'%s', depth=%d: Expected 'dict'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+
+            result = {}
+            for obj_k, obj_v in obj.items():
+                result[key_enc(obj_k, ctx)] = val_enc(obj_v, ctx)
+            return(result)
+
+    elif(kind == TemplateNode.CODEC):
+        # Foreign object. Use template codec to translate object.
+        def enc(obj, ctx):
+            # make sure the object is compatible with what the codec wants
+            if(not tmpl.is_compatible(obj)):
+                raise TypeError("'%s', depth=%d: Expected '%s'. Got '%s'"
+                    % (parent_key, depth, tmpl.obj_type.__name__, type(obj).__name__))
+            return(tmpl.encode(obj))
+
+    elif(kind == TemplateNode.ENCODABLE):
+        # Got an EncodableClass
+        def enc(obj, ctx):
+            if(obj is None):
+                # None is OK too.
+                return(None)
+
+            # make sure it is what the template expects
+            if(not isinstance(obj, tmpl)):
+                raise TypeError("'%s', depth=%d: Expected '%s'. Got '%s'"
+                    % (parent_key, depth, tmpl.__name__, type(obj).__name__))
+
+            return(obj.to_dict(ctx))
+
+    else:
+        # Everything else
+        def enc(obj, ctx):
+            # types should match (unless it is None. Thats OK)
+            if((type(obj) is not tmpl) and (obj is not None)):
+                raise TypeError("'%s', depth=%d: Expected '%s'. Got '%s'"
+                    % (parent_key, depth, tmpl.__name__, type(obj).__name__))
+
+            # Pass-through
+            return(obj)
+
+    return(enc)
+
+#-------------------------------------------------------------------------------
+def _compile_decoder(node):
+    tmpl, parent_key, depth = node.tmpl, node.parent_key, node.depth
+    kind = node.kind
+
+    if(kind == TemplateNode.LIST):
+        item_dec = node.item.decode
+
+        def dec(obj, ctx):
+            # Expecting a list of items
+            if(type(obj) != list):
+                raise TypeError("'%s', depth=%d: Expected 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            return([item_dec(item, ctx) for item in obj])
+
+    elif(kind == TemplateNode.COLUMNAR):
+        item_dec = node.item.decode
+        
+        def dec(obj, ctx):
+            cls = tmpl.cls
+            plan = get_class_plan(cls)
+            length, base, columns, rows, row_indexes = _columnar_unpack(tmpl, obj, plan, parent_key, depth)
+            
+            result = [None] * length
+            col_objs = []
+            for n, idx in enumerate(row_indexes):
+                o = cls.__new__(cls)
+                
+                # register the decoded object
+                ref_id = base + n
+                if(ref_id in ctx):
+                    # An object with the same ID was already decoded??
+                    raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+                ctx[ref_id] = o
+                
+                result[idx] = o
+                col_objs.append(o)
+            
+            n_placeholders = ctx.n_placeholders
+            for key, d in _plan_members(plan, 'decoders'):
+                for o, v in zip(col_objs, columns[key]):
+                    setattr(o, key, d(v, ctx))
+            if(ctx.n_placeholders != n_placeholders):
+                for o in col_objs:
+                    _defer_members(o, plan, ctx)
+            
+            for idx, v in rows:
+                result[idx] = item_dec(v, ctx)
+            
+            return(result)
+        
+    elif(kind == TemplateNode.TUPLE):
+        item_decs = [n.decode for n in node.items]
+        has_encodable = node.has_encodable
+
+        def dec(obj, ctx):
+            # Expecting a tuple of items (a list is OK too...)
+            if((type(obj) != tuple) and (type(obj) != list)):
+                raise TypeError("'%s', depth=%d: Expected 'tuple' or 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+
+            # Size of tuples must match
+            if(len(item_decs) != len(obj)):
+                raise ValueError("'%s', depth=%d: Tuple len(%d) does not match template len(%d)"
+                    % (parent_key, depth, len(obj), len(item_decs)))
+
+            if(has_encodable):
+                n_placeholders = ctx.n_placeholders
+                return(_make_tuple([d(item, ctx) for d, item in zip(item_decs, obj)], n_placeholders, ctx))
+            return(tuple([d(item, ctx) for d, item in zip(item_decs, obj)]))
+
+    elif(kind == TemplateNode.DICT):
+        key_dec = node.key.decode
+        val_dec = node.value.decode
+
+        def dec(obj, ctx):
+            # Expecting a dictionary
+            if(not _is_mapping(obj)):
+                raise TypeError("'%s', depth=%d: Expected 'dict'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+
+            result = {}
+            for obj_k, obj_v in obj.items():
+                result[key_dec(obj_k, ctx)] = val_dec(obj_v, ctx)
+            return(result)
+
+    elif(kind == TemplateNode.CODEC):
+        # Foreign object. Use template codec to translate object.
+        if(tmpl.intern_results):
+            def dec(obj, ctx):
+                value = tmpl.decode(obj)
+                table = ctx.intern
+                if(table is None):
+                    return(value)
+                return(table.intern_value(tmpl, value))
+        else:
+            def dec(obj, ctx):
+                return(tmpl.decode(obj))
+
+    elif(kind == TemplateNode.ENCODABLE):
+        # Expecting an EncodableClass
+        subtypes = node.subtypes
+        
+        def dec(obj, ctx):
+            if(obj is None):
+                # None is OK too.
+                return(None)
+
+            # Check if current obj looks like an EncodableClass
+            if((not _is_mapping(obj)) or ('<classtype>' not in obj)):
+                raise TypeError("'%s', depth=%d: Dictionary incompatible with '%s'"
+                    % (parent_key, depth, tmpl.__name__))
+
+            if('<ref_id>' not in obj):
+                raise ValueError("'%s', depth=%d: Missing <ref_id>" % (parent_key, depth))
+
+            if(obj['<classtype>'] == '<ref>'):
+                # This is a reference, not an actual class definition
+                # Returns a Ref placeholder if the object was not decoded yet
+                return(ctx.get_ref(obj['<ref_id>'], tmpl))
+
+            # Not a reference. This is an actual class definition
+
+            # Figure out what specific subtype of tmpl should be created.
+            classid = obj['<classtype>']
+            try:
+                cls = subtypes[classid]
+            except KeyError:
+                cls = lookup_subtype(tmpl, classid)
+            
+            if(cls is None):
+                raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                    % (parent_key, depth, classid, get_classid_str(tmpl)))
+
+            return(cls.from_dict(obj, ctx))
+
+    elif(tmpl is str):
+        def dec(obj, ctx):
+            if((type(obj) is not str) and (obj is not None)):
+                raise TypeError("'%s', depth=%d: Expected 'str'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            
+            table = ctx.intern
+            if(table is None):
+                return(obj)
+            return(table.intern_str(obj))
+
+    else:
+        # Everything else
+        def dec(obj, ctx):
+            # types should match (unless it is None. Thats OK)
+            if((type(obj) is not tmpl) and (obj is not None)):
+                raise TypeError("'%s', depth=%d: Expected '%s'. Got '%s'"
+                    % (parent_key, depth, tmpl.__name__, type(obj).__name__))
+
+            # Pass-through
+            return(obj)
+
+    return(dec)
+
+#-------------------------------------------------------------------------------
+# Validation levels
+#
+# How thoroughly decoded data is checked against the templates:
+#   "full":     Every value is checked.
+#   "sampled":  Objects and small containers are checked fully. Of lists and
+#               dicts with more than SAMPLE_HEAD + SAMPLE_RANDOM items, only the
+#               first SAMPLE_HEAD items, plus SAMPLE_RANDOM others picked at
+#               random, are checked.
+#   "trusted":  Values are not checked. Classes and references are still
+#               resolved.
+# Each level has its own compiled decoders, so that the cheaper levels do not
+# pay for the checks of the others.
+#-------------------------------------------------------------------------------
+VALIDATION_LEVELS = ("full", "sampled", "trusted")
+
+SAMPLE_HEAD = 16
+SAMPLE_RANDOM = 16
+
+# Separate generator so that decoding does not disturb the random module's
+# global sequence
+_sample_rng = random.Random()
+
+def _passthrough(obj, ctx):
+    # Trusted decoder of values that are used as-is
+    return(obj)
+
+def _trusted_str(obj, ctx):
+    # Trusted decoder of str values. Used as-is, unless they are interned
+    table = ctx.intern
+    if(table is None):
+        return(obj)
+    return(table.intern_str(obj))
+
+# Trusted decoders that return values as-is when nothing is interned
+_AS_IS = (_passthrough, _trusted_str)
+
+def _is_as_is(dec, ctx):
+    """
+    Check if trusted decoder dec returns values as-is within ctx
+    """
+    return((dec is _passthrough) or ((dec in _AS_IS) and (ctx.intern is None)))
+
+def _decode_sampled(values, check, trusted, ctx):
+    """
+    Decode the list of values, using decoder check for the sampled items, and
+    the trusted decoder for the rest.
+    Returns the list of decoded values
+    """
+    n = len(values)
+    if(n <= SAMPLE_HEAD + SAMPLE_RANDOM):
+        return([check(v, ctx) for v in values])
+    
+    sampled = list(range(SAMPLE_HEAD))
+    sampled.extend(sorted(_sample_rng.sample(range(SAMPLE_HEAD, n), SAMPLE_RANDOM)))
+    
+    if(_is_as_is(trusted, ctx)):
+        # Nothing to decode. Only check the samples
+        for idx in sampled:
+            check(values[idx], ctx)
+        return(list(values))
+    
+    # Decode in order, since objects must be registered in order of appearance
+    result = []
+    start = 0
+    for idx in sampled:
+        result.extend([trusted(v, ctx) for v in values[start:idx]])
+        result.append(check(values[idx], ctx))
+        start = idx + 1
+    result.extend([trusted(v, ctx) for v in values[start:]])
+    return(result)
+
+def _decode_sampled_obj(cls, D, ctx):
+    """
+    Decode the members of an object of class cls from D, at the "sampled"
+    validation level
+    """
+    if('<ref_id>' not in D):
+        raise ValueError("Missing <ref_id>")
+    ref_id = D['<ref_id>']
+    
+    self = cls.__new__(cls)
+    
+    # register the decoded object
+    if(ref_id in ctx):
+        # An object with the same ID was already decoded??
+        raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+    ctx[ref_id] = self
+    
+    plan = get_class_plan(cls)
+    n_placeholders = ctx.n_placeholders
+    prof = _active_profiler.get()
+    if(prof is None):
+        for key, dec in plan.sampled_decoders:
+            setattr(self, key, dec(D[key], ctx))
+    else:
+        prof.decode_members(self, plan, 'sampled_decoders', D, ctx)
+    if(ctx.n_placeholders != n_placeholders):
+        _defer_members(self, plan, ctx)
+    return(self)
+
+def _decode_trusted_obj(cls, D, ctx):
+    """
+    Decode the members of an object of class cls from D, at the "trusted"
+    validation level
+    """
+    ref_id = D['<ref_id>']
+    
+    self = cls.__new__(cls)
+    
+    # register the decoded object
+    if(ref_id in ctx):
+        # An object with the same ID was already decoded??
+        raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+    ctx[ref_id] = self
+    
+    plan = get_class_plan(cls)
+    n_placeholders = ctx.n_placeholders
+    prof = _active_profiler.get()
+    if(prof is None):
+        for key, dec in plan.trusted_decoders:
+            setattr(self, key, dec(D[key], ctx))
+    else:
+        prof.decode_members(self, plan, 'trusted_decoders', D, ctx)
+    if(ctx.n_placeholders != n_placeholders):
+        _defer_members(self, plan, ctx)
+    return(self)
+
+def _call_interning(ctx, intern, f, *args):
+    """
+    Call f(*args), with the decoders interning the values they decode within
+    DecodeContext ctx with InternTable intern.
+    """
+    prev = ctx.intern
+    ctx.intern = intern
+    try:
+        return(f(*args))
+    finally:
+        ctx.intern = prev
+
+def _decode_at_level(cls, D, _decoded_objs, validation, intern):
+    """
+    Implementation of cls.from_dict() for the validation levels other than
+    "full"
+    """
+    if(validation == "sampled"):
+        decode_obj = _decode_sampled_obj
+    elif(validation == "trusted"):
+        decode_obj = _decode_trusted_obj
+    else:
+        raise ValueError("Unknown validation level '%s'. Expected one of %s"
+            % (validation, ", ".join(VALIDATION_LEVELS)))
+    
+    if(D.get('<classtype>') != get_class_plan(cls).classid):
+        raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+    
+    plain_objs = None
+    if(_decoded_objs is None):
+        ctx = DecodeContext(intern = intern)
+    elif(isinstance(_decoded_objs, DecodeContext)):
+        # Not the root. The caller resolves the references
+        if((intern is not None) and (intern is not _decoded_objs.intern)):
+            return(_call_interning(_decoded_objs, intern, decode_obj, cls, D, _decoded_objs))
+        return(decode_obj(cls, D, _decoded_objs))
+    else:
+        plain_objs = _decoded_objs
+        ctx = _as_decode_context(plain_objs)
+        ctx.intern = intern
+    
+    self = decode_obj(cls, D, ctx)
+    ctx.resolve_pending()
+    ctx.check_resolved()
+    if(plain_objs is not None):
+        plain_objs.update(ctx)
+    return(self)
+
+#-------------------------------------------------------------------------------
+def _compile_sampled_decoder(node):
+    """
+    Compiles the decoder of a template node for the "sampled" validation level
+    """
+    tmpl, parent_key, depth = node.tmpl, node.parent_key, node.depth
+    kind = node.kind
+    
+    if(kind == TemplateNode.LIST):
+        item_check = node.item.decode_sampled
+        item_trusted = node.item.decode_trusted
+        
+        def dec(obj, ctx):
+            # Expecting a list of items
+            if(type(obj) != list):
+                raise TypeError("'%s', depth=%d: Expected 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            return(_decode_sampled(obj, item_check, item_trusted, ctx))
+    
+    elif(kind == TemplateNode.COLUMNAR):
+        item_dec = node.item.decode_sampled
+        
+        def dec(obj, ctx):
+            cls = tmpl.cls
+            plan = get_class_plan(cls)
+            length, base, columns, rows, row_indexes = _columnar_unpack(tmpl, obj, plan, parent_key, depth)
+            
+            result = [None] * length
+            col_objs = []
+            for n, idx in enumerate(row_indexes):
+                o = cls.__new__(cls)
+                
+                # register the decoded object
+                ref_id = base + n
+                if(ref_id in ctx):
+                    # An object with the same ID was already decoded??
+                    raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+                ctx[ref_id] = o
+                
+                result[idx] = o
+                col_objs.append(o)
+            
+            # Columns are homogeneous lists
+            n_placeholders = ctx.n_placeholders
+            for (key, check), (_, trusted) in zip(_plan_members(plan, 'sampled_decoders'), _plan_members(plan, 'trusted_decoders')):
+                for o, v in zip(col_objs, _decode_sampled(columns[key], check, trusted, ctx)):
+                    setattr(o, key, v)
+            if(ctx.n_placeholders != n_placeholders):
+                for o in col_objs:
+                    _defer_members(o, plan, ctx)
+            
+            for idx, v in rows:
+                result[idx] = item_dec(v, ctx)
+            
+            return(result)
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_decs = [n.decode_sampled for n in node.items]
+        has_encodable = node.has_encodable
+        
+        def dec(obj, ctx):
+            # Expecting a tuple of items (a list is OK too...)
+            if((type(obj) != tuple) and (type(obj) != list)):
+                raise TypeError("'%s', depth=%d: Expected 'tuple' or 'list'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            
+            # Size of tuples must match
+            if(len(item_decs) != len(obj)):
+                raise ValueError("'%s', depth=%d: Tuple len(%d) does not match template len(%d)"
+                    % (parent_key, depth, len(obj), len(item_decs)))
+            
+            if(has_encodable):
+                n_placeholders = ctx.n_placeholders
+                return(_make_tuple([d(item, ctx) for d, item in zip(item_decs, obj)], n_placeholders, ctx))
+            return(tuple([d(item, ctx) for d, item in zip(item_decs, obj)]))
+    
+    elif(kind == TemplateNode.DICT):
+        key_check = node.key.decode_sampled
+        val_check = node.value.decode_sampled
+        key_trusted = node.key.decode_trusted
+        val_trusted = node.value.decode_trusted
+        
+        def item_check(item, ctx):
+            return((key_check(item[0], ctx), val_check(item[1], ctx)))
+        
+        def item_trusted(item, ctx):
+            return((key_trusted(item[0], ctx), val_trusted(item[1], ctx)))
+        
+        def dec(obj, ctx):
+            # Expecting a dictionary
+            if(not _is_mapping(obj)):
+                raise TypeError("'%s', depth=%d: Expected 'dict'. Got '%s'"
+                    % (parent_key, depth, type(obj).__name__))
+            trusted = item_trusted
+            if(_is_as_is(key_trusted, ctx) and _is_as_is(val_trusted, ctx)):
+                trusted = _passthrough
+            return(dict(_decode_sampled(list(obj.items()), item_check, trusted, ctx)))
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        # Expecting an EncodableClass
+        subtypes = node.subtypes
+        
+        def dec(obj, ctx):
+            if(obj is None):
+                # None is OK too.
+                return(None)
+            
+            # Check if current obj looks like an EncodableClass
+            if((not _is_mapping(obj)) or ('<classtype>' not in obj)):
+                raise TypeError("'%s', depth=%d: Dictionary incompatible with '%s'"
+                    % (parent_key, depth, tmpl.__name__))
+            
+            if('<ref_id>' not in obj):
+                raise ValueError("'%s', depth=%d: Missing <ref_id>" % (parent_key, depth))
+            
+            if(obj['<classtype>'] == '<ref>'):
+                # Returns a Ref placeholder if the object was not decoded yet
+                return(ctx.get_ref(obj['<ref_id>'], tmpl))
+            
+            # Figure out what specific subtype of tmpl should be created.
+            classid = obj['<classtype>']
+            try:
+                cls = subtypes[classid]
+            except KeyError:
+                cls = lookup_subtype(tmpl, classid)
+            
+            if(cls is None):
+                raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                    % (parent_key, depth, classid, get_classid_str(tmpl)))
+            
+            return(_decode_sampled_obj(cls, obj, ctx))
+    
+    else:
+        # Primitives and foreign objects are checked the same as "full"
+        return(node.decode)
+    
+    return(dec)
+
+#-------------------------------------------------------------------------------
+def _compile_trusted_decoder(node):
+    """
+    Compiles the decoder of a template node for the "trusted" validation level.
+    Returns _passthrough if values described by the template are used as-is,
+    or _trusted_str for strings, which are used as-is unless they are interned.
+    """
+    tmpl, parent_key, depth = node.tmpl, node.parent_key, node.depth
+    kind = node.kind
+    
+    if(kind == TemplateNode.LIST):
+        item_dec = node.item.decode_trusted
+        
+        if(item_dec is _passthrough):
+            def dec(obj, ctx):
+                return(list(obj))
+        elif(item_dec in _AS_IS):
+            def dec(obj, ctx):
+                if(ctx.intern is None):
+                    return(list(obj))
+                return([item_dec(item, ctx) for item in obj])
+        else:
+            def dec(obj, ctx):
+                return([item_dec(item, ctx) for item in obj])
+    
+    elif(kind == TemplateNode.COLUMNAR):
+        item_dec = node.item.decode_trusted
+        
+        def dec(obj, ctx):
+            cls = tmpl.cls
+            plan = get_class_plan(cls)
+            length, base, columns, rows, row_indexes = _columnar_unpack(tmpl, obj, plan, parent_key, depth)
+            
+            result = [None] * length
+            col_objs = []
+            for n, idx in enumerate(row_indexes):
+                o = cls.__new__(cls)
+                ref_id = base + n
+                if(ref_id in ctx):
+                    # An object with the same ID was already decoded??
+                    raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+                ctx[ref_id] = o
+                result[idx] = o
+                col_objs.append(o)
+            
+            n_placeholders = ctx.n_placeholders
+            for key, d in _plan_members(plan, 'trusted_decoders'):
+                if(_is_as_is(d, ctx)):
+                    for o, v in zip(col_objs, columns[key]):
+                        setattr(o, key, v)
+                else:
+                    for o, v in zip(col_objs, columns[key]):
+                        setattr(o, key, d(v, ctx))
+            if(ctx.n_placeholders != n_placeholders):
+                for o in col_objs:
+                    _defer_members(o, plan, ctx)
+            
+            for idx, v in rows:
+                result[idx] = item_dec(v, ctx)
+            
+            return(result)
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_decs = [n.decode_trusted for n in node.items]
+        has_encodable = node.has_encodable
+        
+        if(all(d is _passthrough for d in item_decs)):
+            def dec(obj, ctx):
+                return(tuple(obj))
+        elif(all(d in _AS_IS for d in item_decs)):
+            def dec(obj, ctx):
+                if(ctx.intern is None):
+                    return(tuple(obj))
+                return(tuple([d(item, ctx) for d, item in zip(item_decs, obj)]))
+        elif(has_encodable):
+            def dec(obj, ctx):
+                n_placeholders = ctx.n_placeholders
+                return(_make_tuple([d(item, ctx) for d, item in zip(item_decs, obj)], n_placeholders, ctx))
+        else:
+            def dec(obj, ctx):
+                return(tuple([d(item, ctx) for d, item in zip(item_decs, obj)]))
+    
+    elif(kind == TemplateNode.DICT):
+        key_dec = node.key.decode_trusted
+        val_dec = node.value.decode_trusted
+        
+        if((key_dec is _passthrough) and (val_dec is _passthrough)):
+            def dec(obj, ctx):
+                return(dict(obj))
+        elif((key_dec in _AS_IS) and (val_dec in _AS_IS)):
+            def dec(obj, ctx):
+                if(ctx.intern is None):
+                    return(dict(obj))
+                return({key_dec(k, ctx) : val_dec(v, ctx) for k, v in obj.items()})
+        else:
+            def dec(obj, ctx):
+                return({key_dec(k, ctx) : val_dec(v, ctx) for k, v in obj.items()})
+    
+    elif(kind == TemplateNode.CODEC):
+        # Same as "full"
+        return(node.decode)
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        subtypes = node.subtypes
+        
+        def dec(obj, ctx):
+            if(obj is None):
+                return(None)
+            
+            classid = obj['<classtype>']
+            if(classid == '<ref>'):
+                # Returns a Ref placeholder if the object was not decoded yet
+                return(ctx.get_ref(obj['<ref_id>'], tmpl))
+            
+            try:
+                cls = subtypes[classid]
+            except KeyError:
+                cls = lookup_subtype(tmpl, classid)
+            
+            if(cls is None):
+                raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                    % (parent_key, depth, classid, get_classid_str(tmpl)))
+            
+            return(_decode_trusted_obj(cls, obj, ctx))
+    
+    elif(tmpl is str):
+        return(_trusted_str)
+    
+    else:
+        return(_passthrough)
+    
+    return(dec)
+
+#-------------------------------------------------------------------------------
+# Interning
+#-------------------------------------------------------------------------------
+class InternTable:
+    """
+    Collapses equal values decoded from documents into one shared object.
+    
+    Pass it to from_dict(), load() or loadb() as intern=table. As they are
+    decoded, every str member value, dict key and list/tuple item is replaced
+    by the first equal string the table has seen. So are values decoded by a
+    ForeignObjectCodec that sets intern_results to True.
+    
+    A table can be reused across decodes, so that several documents share their
+    values. get_stats() reports how effective it was.
+    """
+    def __init__(self):
+        # str --> str
+        self._strs = {}
+        self._str_counts = [0, 0]
+        
+        # codec --> {(type, value) : value}
+        self._values = {}
+        
+        # codec --> [lookups, hits]
+        self._value_counts = {}
+    
+    def intern_str(self, s):
+        """
+        Returns the shared string equal to s
+        """
+        if(s is None):
+            return(None)
+        v = self._strs.setdefault(s, s)
+        counts = self._str_counts
+        counts[0] += 1
+        if(v is not s):
+            counts[1] += 1
+        return(v)
+    
+    def intern_value(self, codec, value):
+        """
+        Returns the shared value equal to value, a result of codec.decode()
+        Values of different types never collapse, even if they compare equal.
+        """
+        if(value is None):
+            return(None)
+        try:
+            table = self._values[codec]
+            counts = self._value_counts[codec]
+        except KeyError:
+            table = self._values[codec] = {}
+            counts = self._value_counts[codec] = [0, 0]
+        
+        v = table.setdefault((type(value), value), value)
+        counts[0] += 1
+        if(v is not value):
+            counts[1] += 1
+        return(v)
+    
+    @property
+    def lookups(self):
+        return(self._str_counts[0] + sum(c[0] for c in self._value_counts.values()))
+    
+    @property
+    def hits(self):
+        return(self._str_counts[1] + sum(c[1] for c in self._value_counts.values()))
+    
+    @property
+    def hit_rate(self):
+        """
+        Fraction of values that were replaced by a shared one
+        """
+        if(self.lookups == 0):
+            return(0.0)
+        return(self.hits / self.lookups)
+    
+    def get_stats(self):
+        """
+        Returns {name : {"lookups", "hits", "unique", "hit_rate"}}
+        name is "str" for strings, or the classid of a codec
+        """
+        def entry(counts, unique):
+            lookups, hits = counts
+            return({
+                "lookups" : lookups,
+                "hits" : hits,
+                "unique" : unique,
+                "hit_rate" : (hits / lookups) if lookups else 0.0,
+            })
+        
+        stats = {"str" : entry(self._str_counts, len(self._strs))}
+        for codec, counts in self._value_counts.items():
+            stats[get_classid_str(codec)] = entry(counts, len(self._values[codec]))
+        return(stats)
+    
+    def clear(self):
+        self.__init__()
+
+def _compile_interner(tmpl):
+    """
+    Compiles the interner for a template: f(value, table) --> value
+    Returns None if nothing described by the template is interned.
+    
+    Interning does not descend into EncodableClass objects. Each decoded object
+    is interned separately.
+    """
+    if(type(tmpl) == list):
+        item_int = _compile_interner(tmpl[0])
+        if(item_int is None):
+            return(None)
+        
+        def f(obj, table):
+            for i, v in enumerate(obj):
+                obj[i] = item_int(v, table)
+            return(obj)
+    
+    elif(type(tmpl) == tuple):
+        item_ints = [_compile_interner(t) for t in tmpl]
+        if(all(i is None for i in item_ints)):
+            return(None)
+        
+        def f(obj, table):
+            return(tuple([
+                v if (i is None) else i(v, table)
+                for i, v in zip(item_ints, obj)
+            ]))
+    
+    elif(type(tmpl) == dict):
+        tmpl_k, tmpl_v = list(tmpl.items())[0]
+        key_int = _compile_interner(tmpl_k)
+        val_int = _compile_interner(tmpl_v)
+        if((key_int is None) and (val_int is None)):
+            return(None)
+        
+        if(key_int is None):
+            def f(obj, table):
+                for k, v in obj.items():
+                    obj[k] = val_int(v, table)
+                return(obj)
+        elif(val_int is None):
+            def f(obj, table):
+                return({key_int(k, table) : v for k, v in obj.items()})
+        else:
+            def f(obj, table):
+                return({key_int(k, table) : val_int(v, table) for k, v in obj.items()})
+    
+    elif(tmpl is str):
+        def f(obj, table):
+            return(table.intern_str(obj))
+    
+    elif(isinstance(tmpl, type) and issubclass(tmpl, ForeignObjectCodec) and tmpl.intern_results):
+        def f(obj, table):
+            return(table.intern_value(tmpl, obj))
+    
+    else:
+        return(None)
+    
+    return(f)
+
+def intern_objects(objs, table):
+    """
+    Intern the members of all objects in objs with InternTable table.
+    Decoders intern as they go, so this is only needed for objects that were
+    decoded or built without the table.
+    """
+    plans = {}
+    for obj in objs:
+        cls = type(obj)
+        try:
+            interners = plans[cls]
+        except KeyError:
+            interners = plans[cls] = get_class_plan(cls).interners
+        for key, f in interners:
+            setattr(obj, key, f(getattr(obj, key), table))
+
+#-------------------------------------------------------------------------------
+def _template_key(tmpl):
+    """
+    Returns a hashable key that identifies the structure of template tmpl.
+    Raises TypeError if part of it is not hashable
+    """
+    t = type(tmpl)
+    if(t == list):
+        return(('[',) + tuple([_template_key(item) for item in tmpl]))
+    if(t == tuple):
+        return(('(',) + tuple([_template_key(item) for item in tmpl]))
+    if(t == dict):
+        return(('{',) + tuple([(_template_key(k), _template_key(v)) for k, v in tmpl.items()]))
+    hash(tmpl)
+    return(tmpl)
+
+# (template key, parent_key, depth) --> TemplateNode
+# Used by do_encode() and do_decode(), whose callers pass a template each time.
+# Holds at most TEMPLATE_CACHE_SIZE nodes. The least recently used ones are
+# dropped first
+_template_nodes = collections.OrderedDict()
+TEMPLATE_CACHE_SIZE = 256
+
+def _get_template_node(tmpl, parent_key, depth):
+    try:
+        key = (_template_key(tmpl), parent_key, depth)
+        node = _template_nodes[key]
+    except TypeError:
+        # Unhashable template. Compile it every time
+        return(TemplateNode(tmpl, parent_key, depth))
+    except KeyError:
+        node = TemplateNode(tmpl, parent_key, depth)
+        _template_nodes[key] = node
+        if(len(_template_nodes) > TEMPLATE_CACHE_SIZE):
+            _template_nodes.popitem(last=False)
+        return(node)
+    _template_nodes.move_to_end(key)
+    return(node)
+
+#-------------------------------------------------------------------------------
+def do_encode(obj, tmpl, parent_key, _encoded_objs, depth = 1):
+    """
+    Encode value obj according to template tmpl
+    """
+    return(_get_template_node(tmpl, parent_key, depth).encode(obj, _encoded_objs))
+
+#-------------------------------------------------------------------------------
+def _as_decode_context(objs):
+    """
+    Returns objs as a DecodeContext.
+    A plain dict of already decoded objects by <ref_id> is copied into a new
+    DecodeContext.
+    """
+    if(isinstance(objs, DecodeContext)):
+        return(objs)
+    if(not isinstance(objs, dict)):
+        raise TypeError("_decoded_objs must be a DecodeContext or a dict. Got '%s'"
+            % type(objs).__name__)
+    ctx = DecodeContext()
+    dict.update(ctx, objs)
+    return(ctx)
+
+#-------------------------------------------------------------------------------
+def do_decode(obj, tmpl, parent_key, _decoded_objs, depth = 1):
+    """
+    Decode value obj according to template tmpl.
+    
+    If _decoded_objs is a plain dict rather than a DecodeContext, references
+    in obj are resolved before returning, and the objects that were decoded are
+    added to it.
+    """
+    dec = _get_template_node(tmpl, parent_key, depth).decode
+    if(isinstance(_decoded_objs, DecodeContext)):
+        return(dec(obj, _decoded_objs))
+    
+    ctx = _as_decode_context(_decoded_objs)
+    value = do_resolve_ref(tmpl, dec(obj, ctx), ctx)
+    _decoded_objs.update(ctx)
+    return(value)
+
+#-------------------------------------------------------------------------------
+def do_resolve_ref(tmpl, obj, _decoded_objs):
+    """
+    Resolve the references left in obj, a value returned by do_decode(), once
+    all objects it refers to are in the DecodeContext _decoded_objs.
+    Returns the resolved value
+    """
+    _decoded_objs = _as_decode_context(_decoded_objs)
+    holder = [obj]
+    _defer_placeholders(holder, 0, obj, _decoded_objs)
+    _decoded_objs.resolve_pending()
+    _decoded_objs.check_resolved()
+    return(holder[0])
+
+#-------------------------------------------------------------------------------
+class TemplateNode:
+    """
+    Pre-processed form of a template.
+    
+    Used by encoders and decoders that need to walk the structure of a template
+    themselves, rather than going through the compiled encode/decode callables.
+    
+    kind is one of the TemplateNode.* kind constants:
+        LIST:       item is the node of the list's items
+        TUPLE:      items is a list of nodes, one for each tuple position
+        DICT:       key and value are the nodes of the dict's keys and values
+        COLUMNAR:   tmpl is a Columnar template. item is the node of the list's
+                    items
+        CODEC:      tmpl is a ForeignObjectCodec
+        ENCODABLE:  tmpl is an EncodableClass. subtypes is its subtype table
+                    (See get_subtype_table())
+        PRIMITIVE:  Anything else. tmpl is the expected type
+    
+    has_encodable is True if values described by the node can contain an
+    EncodableClass object somewhere inside them.
+    encode and decode are the compiled encoder and decoder for the template.
+    decode_sampled and decode_trusted are the decoders for the other
+    validation levels (See VALIDATION_LEVELS)
+    """
+    LIST = "list"
+    TUPLE = "tuple"
+    DICT = "dict"
+    COLUMNAR = "columnar"
+    CODEC = "codec"
+    ENCODABLE = "encodable"
+    PRIMITIVE = "primitive"
+    
+    def __init__(self, tmpl, parent_key, depth = 1):
+        self.tmpl = tmpl
+        self.parent_key = parent_key
+        self.depth = depth
+        
+        if(type(tmpl) == list):
+            # Template list must have exactly one item
+            if(len(tmpl) != 1):
+                raise ValueError("'%s', depth=%d: Templates for lists must have exactly one item in them"
+                    % (parent_key, depth))
+            self.kind = TemplateNode.LIST
+            self.item = TemplateNode(tmpl[0], parent_key, depth+1)
+            self.has_encodable = self.item.has_encodable
+            
+        elif(type(tmpl) == tuple):
+            self.kind = TemplateNode.TUPLE
+            self.items = [TemplateNode(t, parent_key, depth+1) for t in tmpl]
+            self.has_encodable = any(n.has_encodable for n in self.items)
+            
+        elif(type(tmpl) == dict):
+            # Template dict must have exactly one key:value pair
+            if(len(tmpl) != 1):
+                raise ValueError("'%s', depth=%d: Templates for dicts must have exactly one key:value pair"
+                    % (parent_key, depth))
+            self.kind = TemplateNode.DICT
+            tmpl_k, tmpl_v = list(tmpl.items())[0]
+            self.key = TemplateNode(tmpl_k, parent_key, depth+1)
+            self.value = TemplateNode(tmpl_v, parent_key, depth+1)
+            self.has_encodable = self.key.has_encodable or self.value.has_encodable
+            
+        elif(type(tmpl) == Columnar):
+            self.kind = TemplateNode.COLUMNAR
+            self.item = TemplateNode(tmpl.cls, parent_key, depth+1)
+            self.has_encodable = True
+            
+        elif(not isinstance(tmpl, type)):
+            raise TypeError("'%s', depth=%d: Unsupported type '%s'"
+                        % (parent_key, depth, type(tmpl).__name__))
+            
+        elif(issubclass(tmpl, ForeignObjectCodec)):
+            self.kind = TemplateNode.CODEC
+            self.has_encodable = False
+            
+        elif(issubclass(tmpl, EncodableClass)):
+            self.kind = TemplateNode.ENCODABLE
+            self.has_encodable = True
+            self.subtypes = get_subtype_table(tmpl)
+            
+        else:
+            self.kind = TemplateNode.PRIMITIVE
+            self.has_encodable = False
+        
+        # Compiled from the callables of the child nodes built above
+        self.encode = _compile_encoder(self)
+        self.decode = _compile_decoder(self)
+        self.decode_trusted = _compile_trusted_decoder(self)
+        self.decode_sampled = _compile_sampled_decoder(self)
+
+#-------------------------------------------------------------------------------
+def get_template_str(tmpl):
+    """
+    Returns a canonical string representation of a template
+    """
+    if(type(tmpl) == list):
+        return("[%s]" % ",".join([get_template_str(t) for t in tmpl]))
+    elif(type(tmpl) == tuple):
+        return("(%s)" % ",".join([get_template_str(t) for t in tmpl]))
+    elif(type(tmpl) == dict):
+        return("{%s}" % ",".join(["%s:%s" % (get_template_str(k), get_template_str(v))
+                                  for k, v in tmpl.items()]))
+    elif(type(tmpl) == Columnar):
+        return("Columnar(%s)" % get_classid_str(tmpl.cls))
+    elif(isinstance(tmpl, type)):
+        return(get_classid_str(tmpl))
+    else:
+        return(repr(tmpl))
+
+#-------------------------------------------------------------------------------
+# Per-class plans
+#-------------------------------------------------------------------------------
+class ClassPlan:
+    """
+    Compiled encode/decode pipeline for one EncodableClass.
+
+    Built from the class's merged encode_schema the first time the class is
+    encoded or decoded, and cached until a schema is changed.
+    """
+    def __init__(self, cls):
+        self.cls = cls
+        self.classid = get_classid_str(cls)
+
+        # Collapse all schemas from parent classes into one
+        self.schema = cls._merge_schemas()
+        
+        # (class, its own encode_schema or None) for each EncodableClass in
+        # the MRO. The plan is stale once any of them is reassigned
+        self.schema_sources = tuple([
+            (c, c.__dict__.get('encode_schema'))
+            for c in cls.__mro__ if issubclass(c, EncodableClass)
+        ])
+
+        self.nodes = []
+        self.encoders = []
+        self.decoders = []
+        self.sampled_decoders = []
+        self.trusted_decoders = []
+        # Members that can hold references to other objects
+        self.ref_keys = []
+        self.interners = []
+        for key, template in self.schema.items():
+            node = TemplateNode(template, key)
+            self.nodes.append((key, node))
+            self.encoders.append((key, node.encode))
+            self.decoders.append((key, node.decode))
+            self.sampled_decoders.append((key, node.decode_sampled))
+            self.trusted_decoders.append((key, node.decode_trusted))
+            if(node.has_encodable):
+                self.ref_keys.append(key)
+            interner = _compile_interner(template)
+            if(interner is not None):
+                self.interners.append((key, interner))
+        self.node_map = dict(self.nodes)
+        
+        # True if any member can contain EncodableClass objects
+        self.has_encodable = any(node.has_encodable for _, node in self.nodes)
+        
+        # Identifies the merged schema. Formats that rely on the member order
+        # and templates use this to detect schema changes
+        schema_str = ";".join(["%s=%s" % (key, get_template_str(template))
+                               for key, template in self.schema.items()])
+        self.fingerprint = hashlib.sha1(schema_str.encode('utf-8')).hexdigest()[:16]
+
+_class_plans = {}
+
+# Profiler recording the encodes/decodes of the current context, if any.
+# (See Profiler)
+_active_profiler = contextvars.ContextVar("profiler", default=None)
+
+def _plan_members(plan, attr):
+    """
+    Returns the list of (key, member encoder/decoder) attr of plan, as wrapped
+    by the active Profiler, if any
+    """
+    prof = _active_profiler.get()
+    if(prof is None):
+        return(getattr(plan, attr))
+    return(prof.get_members(plan, attr))
+
+def get_class_plan(cls):
+    """
+    Returns the compiled ClassPlan for cls.
+    A new one is compiled if the encode_schema of cls or any of its bases was
+    reassigned since.
+    """
+    plan = _class_plans.get(cls)
+    if(plan is not None):
+        for c, schema in plan.schema_sources:
+            if(c.__dict__.get('encode_schema') is not schema):
+                break
+        else:
+            return(plan)
+    
+    plan = ClassPlan(cls)
+    _class_plans[cls] = plan
+    return(plan)
+
+def invalidate_plans():
+    """
+    Discards all compiled plans, and cached subtype lookups.
+    Reassigning a class's encode_schema is detected automatically. Call this
+    explicitly if a schema dictionary is modified in-place, or to release
+    classes that are no longer used otherwise.
+    """
+    _class_plans.clear()
+    _template_nodes.clear()
+    for table in _subtype_tables.values():
+        table.clear()
+
+#-------------------------------------------------------------------------------
+class ForeignObjectCodec:
+    """
+    Template for an object that is not an EncodableClass, nor is it a primitive datatype
+    This is used to define encode/decode methods for any other types.
+    """
+    obj_type = type
+    
+    # Set to True if decode() returns immutable, hashable values, so that equal
+    # ones can be shared when decoding with an InternTable
+    intern_results = False
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        register_class(cls)
+    
+    @classmethod
+    def is_compatible(cls, obj):
+        """
+        Checks if obj is compatible with cls.obj_type.
+        Override if comparison is more complex than just type-matching.
+        """
+        if(type(obj) != cls.obj_type):
+            return(False)
+        return(True)
+            
+    @classmethod
+    def encode(cls, obj):
+        """
+        Convert the object obj of type cls.obj_type to a primitive datatype
+        that can be used later to re-create the object.
+        """
+        return("NULL")
+    
+    @classmethod
+    def decode(cls, d):
+        """
+        Create an object of type cls.obj_type from d
+        """
+        return(None)
+    
+    @classmethod
+    def copy(cls, obj):
+        """
+        Returns an independent copy of obj, for clone().
+        Values of codecs with intern_results set are immutable, so they are
+        shared. Otherwise, obj is encoded and decoded again. Override if there
+        is a faster way.
+        """
+        if(cls.intern_results):
+            return(obj)
+        return(cls.decode(cls.encode(obj)))
+
+#-------------------------------------------------------------------------------
+class EncodableClass:
+    
+    """
+    This class enables an object to be encoded and rebuilt to/from a set of primitive datatypes
+    in a controlled manner.
+    
+    The class parameter, "encode_schema" strictly defines the type structure of the class contents
+    
+    encode_schema is a dictionary of class members to encode, and their template:
+        {key : template}
+    
+        key: The name of the class member
+        template: Minimal representation of the type of the member's contents
+        
+        Allowed aggregate data types in template:
+            List: Describes a list where each item in the list is of the same type
+            Tuple: Describes a tuple of fixed size, containing the matching type items
+            Dict: Describes a dictionary where the keys all have the same type, as well as the values
+                FYI: dictionary keys are always encoded as strings with JSON, so other datatypes will
+                     not work here.
+            Columnar: Describes a list of EncodableClass objects that is encoded one column per
+                member rather than one dictionary per object. (See Columnar)
+        
+        Examples:
+            A String:
+                {"my_string" : str}
+            List of integers:
+                {"my_list" : [int]}
+            List of mixed tuples:
+                {"my_complex_list" : [(int, str, MyClass)]}
+            Dictionary where the key is a string, and value is a subclass:
+                {"my_dict" : {str, MyClass}}
+            Large list of records, encoded column-wise:
+                {"my_records" : Columnar(MyRecord)}
+    """
+    encode_schema = {}
+    
+    # Subclasses get a __dict__ as usual, unless they define __slots__ too.
+    # (See SlottedClass)
+    __slots__ = ()
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        register_class(cls)
+    
+    def to_dict(self, _encoded_objs=None):
+        """
+        Encodes the class, and all its child members to a dictionary
+        Only encodes strictly according to what is defined in encode_schema
+        
+        The _encoded_objs parameter is an EncodeContext that tracks which objs
+        have already been encoded. A new one is created if not provided. Pass one
+        in explicitly to inspect its statistics once the encode is done.
+        """
+        
+        if(_encoded_objs is None):
+            _encoded_objs = EncodeContext()
+        
+        D = {}
+        ref_id = _encoded_objs.get_ref_id(self)
+        if(ref_id is not None):
+            # This object has already been encoded elsewhere.
+            # Instead, just store a reference to the other one
+            _encoded_objs.add_ref(ref_id)
+            D['<classtype>'] = '<ref>'
+            D['<ref_id>'] = ref_id
+            
+        else:
+            # First time encountering this object.
+            
+            # Since it will be encoded here, register it with the context
+            ref_id = _encoded_objs.add_obj(self)
+            
+            plan = get_class_plan(type(self))
+            
+            D['<classtype>'] = plan.classid
+            D['<ref_id>'] = ref_id
+            
+            prof = _active_profiler.get()
+            if(prof is None):
+                for key, enc in plan.encoders:
+                    D[key] = enc(getattr(self,key), _encoded_objs)
+            else:
+                prof.encode_members(self, plan, D, _encoded_objs)
+        
+        return(D)
+    
+    @classmethod
+    def from_dict(cls, D, _decoded_objs=None, validation="full", intern=None):
+        """
+        Construct a class from a dictionary.
+        Class members are populated based on what is defined in encode_schema
+        
+        D is not modified, and may be any read-only mapping, such as a
+        MappingProxyType. Decoded objects do not share containers with D.
+        
+        The _decoded_objs parameter is for internal use only
+        (The DecodeContext that tracks which objs have been decoded, for ref
+        resolution.) If it is a plain dict of already decoded objects instead,
+        D is decoded as a root, and the objects it contains are added to it.
+        
+        validation selects how thoroughly D is checked against encode_schema:
+        "full", "sampled" or "trusted". (See VALIDATION_LEVELS)
+        Use "trusted" only for data that is known to be valid, such as
+        documents this program wrote itself.
+        
+        If intern is an InternTable, equal strings (and results of codecs that
+        allow it) are collapsed into one shared object. (See InternTable)
+        """
+        if(validation != "full"):
+            return(_decode_at_level(cls, D, _decoded_objs, validation, intern))
+        
+        plain_objs = None
+        if(_decoded_objs is None):
+            # Allocate new context
+            _decoded_objs = DecodeContext(intern = intern)
+            is_root = True
+        elif(isinstance(_decoded_objs, DecodeContext)):
+            if((intern is not None) and (intern is not _decoded_objs.intern)):
+                return(_call_interning(_decoded_objs, intern, cls.from_dict, D, _decoded_objs))
+            is_root = False
+        else:
+            # References can only be resolved within a DecodeContext
+            plain_objs = _decoded_objs
+            _decoded_objs = _as_decode_context(plain_objs)
+            _decoded_objs.intern = intern
+            is_root = True
+        
+        plan = get_class_plan(cls)
+        
+        if(('<classtype>' not in D) or (D['<classtype>'] != plan.classid)):
+            raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+        
+        if('<ref_id>' not in D):
+            raise ValueError("Missing <ref_id>")
+            
+        ref_id = D['<ref_id>']
+        
+        self = cls.__new__(cls)
+        
+        # register the decoded object
+        if(ref_id in _decoded_objs):
+            # An object with the same ID was already decoded??
+            raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+        _decoded_objs[ref_id] = self
+        
+        # Decode contents of self
+        n_placeholders = _decoded_objs.n_placeholders
+        prof = _active_profiler.get()
+        if(prof is None):
+            for key, dec in plan.decoders:
+                setattr(self, key, dec(D[key], _decoded_objs))
+        else:
+            prof.decode_members(self, plan, 'decoders', D, _decoded_objs)
+        
+        if(_decoded_objs.n_placeholders != n_placeholders):
+            # Some members refer to objects that are not decoded yet.
+            # Record where the placeholders were stored
+            _defer_members(self, plan, _decoded_objs)
+        
+        if(is_root):
+            # This is the root object. Finished decoding everything
+            # Now, patch the placeholders of forward references
+            _decoded_objs.resolve_pending()
+            _decoded_objs.check_resolved()
+            
+            if(plain_objs is not None):
+                plain_objs.update(_decoded_objs)
+            
+        return(self)
+    
+    @classmethod
+    def _merge_schemas(cls):
+        """
+        Combines own encode_schema with all parent classes
+        Returns merged result
+        """
+        schema = {}
+        for base_t in cls.__bases__:
+            if(issubclass(base_t, EncodableClass)):
+                schema.update(base_t._merge_schemas())
+            
+        schema.update(cls.encode_schema)
+        return(schema)
+
+register_class(EncodableClass)
@@ -0,0 +1,310 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Change tracking, and delta encoding
+#
+# A ChangeTracker records which members of TrackedClass objects were assigned
+# since the last snapshot or delta. delta() then only encodes those members,
+# so its cost is proportional to the size of the edit rather than the size of
+# the whole graph.
+#
+# Objects are identified by stable ref_ids: the <ref_id> they were given in
+# the snapshot, or in the delta that first contained them. Objects that are
+# already known are only ever encoded as references. New objects are encoded
+# in full, the same way to_dict() does.
+#
+# A tracker only hears about the objects it knows. Each of those holds a
+# WeakSet of the trackers that know it, so an assignment only notifies them,
+# and objects that no tracker knows pay a single dictionary lookup. Decoding
+# new objects therefore never notifies anyone. Neither does applying a delta
+# to known ones.
+#
+# Delta format:
+#   {
+#       "<delta>" : Sequence number of the delta, starting at 1
+#       "<n_objects>" : Number of objects known before the delta
+#       "<changes>" : [[ref_id, {key : encoded value, ...}], ...]
+#   }
+#
+
+import weakref
+import contextvars
+
+from ._core import EncodableClass, EncodeContext, DecodeContext
+from ._core import get_class_plan
+from ._iterative import from_dict_iterative, decode_member_iterative
+
+# Instance attribute that holds the WeakSet of ChangeTrackers that know an
+# object
+_TRACKERS_ATTR = '_encodable_trackers'
+
+# Trackers that know objects without a __dict__ to hold _TRACKERS_ATTR
+# (See SlottedClass). Only consulted by mark_dirty()
+_slotted_trackers = weakref.WeakSet()
+
+# True while a delta is being applied. Assignments are not reported
+_applying = contextvars.ContextVar("applying_delta", default=False)
+
+def _get_trackers(obj):
+    d = getattr(obj, '__dict__', None)
+    if(d is None):
+        return([t for t in _slotted_trackers if t.knows(obj)])
+    return(d.get(_TRACKERS_ATTR, ()))
+
+#-------------------------------------------------------------------------------
+class TrackedClass(EncodableClass):
+    """
+    EncodableClass that reports assignments to its encode_schema members to
+    the ChangeTrackers that know the object.
+    
+    Changes made in-place to a member's contents (list.append() for example)
+    cannot be detected. Report those with mark_dirty()
+    """
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        trackers = self.__dict__.get(_TRACKERS_ATTR)
+        if(trackers and (name in get_class_plan(type(self)).node_map) and (not _applying.get())):
+            for tracker in trackers:
+                tracker.mark_dirty(self, name)
+
+#-------------------------------------------------------------------------------
+def mark_dirty(obj, key):
+    """
+    Report to the ChangeTrackers that know obj that its member key was changed
+    """
+    for tracker in list(_get_trackers(obj)):
+        tracker.mark_dirty(obj, key)
+
+#-------------------------------------------------------------------------------
+class ChangeTracker:
+    """
+    Tracks changes to the graph of objects reachable from root, and encodes
+    them as deltas against the last snapshot.
+    
+    Writing:
+        tracker = ChangeTracker(root)
+        save(tracker.snapshot())
+        ... modify objects ...
+        save(tracker.delta())
+    
+    Reading:
+        tracker = ChangeTracker.load(MyClass, snapshot)
+        for delta in deltas:
+            tracker.apply(delta)
+        root = tracker.root
+    
+    The tracker keeps every object it has assigned a ref_id to, so that ref_ids
+    are never reused. Only those objects are tracked. Call close() (or use it
+    as a context manager) to stop tracking.
+    """
+    def __init__(self, root):
+        self.root = root
+        
+        # ref_id assignments of all known objects. Kept across deltas
+        self.ctx = None
+        
+        # ref_id --> object. Only needed once deltas are applied
+        self._decoded_objs = None
+        
+        self.n_deltas = 0
+        
+        # ref_id --> set of changed keys
+        self._dirty = {}
+    
+    @classmethod
+    def load(cls, obj_cls, D):
+        """
+        Decode a snapshot of an object of EncodableClass obj_cls, and return a
+        tracker for it, ready to apply deltas.
+        """
+        decoded = DecodeContext()
+        root = from_dict_iterative(obj_cls, D, decoded)
+        
+        self = cls(root)
+        self._decoded_objs = decoded
+        self.ctx = EncodeContext()
+        for ref_id in range(len(decoded)):
+            if(self.ctx.add_obj(decoded[ref_id]) != ref_id):
+                raise ValueError("Snapshot <ref_id> values are not consecutive")
+        self._track(0)
+        return(self)
+    
+    def close(self):
+        """
+        Stop tracking changes
+        """
+        self._untrack()
+        self._dirty.clear()
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    #---------------------------------------------------------------------------
+    def _track(self, start):
+        """
+        Start tracking the objects of self.ctx from ref_id start on
+        """
+        for obj in self.ctx._objs[start:]:
+            d = getattr(obj, '__dict__', None)
+            if(d is None):
+                _slotted_trackers.add(self)
+                continue
+            trackers = d.get(_TRACKERS_ATTR)
+            if(trackers is None):
+                trackers = d[_TRACKERS_ATTR] = weakref.WeakSet()
+            trackers.add(self)
+    
+    def _untrack(self):
+        """
+        Stop tracking all objects
+        """
+        if(self.ctx is None):
+            return
+        for obj in self.ctx._objs:
+            trackers = getattr(obj, '__dict__', {}).get(_TRACKERS_ATTR)
+            if(trackers is not None):
+                trackers.discard(self)
+        _slotted_trackers.discard(self)
+    
+    def knows(self, obj):
+        """
+        True if obj was assigned a ref_id by this tracker
+        """
+        return((self.ctx is not None) and (self.ctx.get_ref_id(obj) is not None))
+    
+    def mark_dirty(self, obj, key):
+        """
+        Record that member key of obj was changed.
+        Ignored if obj is not known to the tracker. New objects are encoded in
+        full by the first delta that refers to them.
+        """
+        if(self.ctx is None):
+            return
+        ref_id = self.ctx.get_ref_id(obj)
+        if(ref_id is None):
+            return
+        keys = self._dirty.get(ref_id)
+        if(keys is None):
+            self._dirty[ref_id] = {key}
+        else:
+            keys.add(key)
+    
+    @property
+    def is_dirty(self):
+        """
+        True if there may be changes since the last snapshot or delta
+        """
+        return(bool(self._dirty))
+    
+    def snapshot(self):
+        """
+        Encode the entire graph, the same way as root.to_dict().
+        ref_ids of objects in the snapshot are their stable ref_ids.
+        """
+        self._untrack()
+        self.ctx = EncodeContext()
+        self._decoded_objs = None
+        self.n_deltas = 0
+        D = self.root.to_dict(self.ctx)
+        self._dirty.clear()
+        self._track(0)
+        return(D)
+    
+    def delta(self):
+        """
+        Encode the changes since the last snapshot or delta
+        """
+        if(self.ctx is None):
+            raise RuntimeError("No snapshot to encode a delta against")
+        
+        ctx = self.ctx
+        n_known = ctx.n_objects
+        dirty = self._dirty
+        self._dirty = {}
+        
+        changes = []
+        for ref_id, keys in dirty.items():
+            obj = ctx._objs[ref_id]
+            plan = get_class_plan(type(obj))
+            members = {}
+            for key, enc in plan.encoders:
+                if(key in keys):
+                    members[key] = enc(getattr(obj, key), ctx)
+            if(members):
+                changes.append([ref_id, members])
+        
+        # Objects encoded in full by this delta are known from now on
+        self._track(n_known)
+        
+        self.n_deltas += 1
+        D = {}
+        D['<delta>'] = self.n_deltas
+        D['<n_objects>'] = n_known
+        D['<changes>'] = changes
+        return(D)
+    
+    def apply(self, D):
+        """
+        Apply a delta produced by delta(). Deltas must be applied in the order
+        they were produced.
+        """
+        if(self._decoded_objs is None):
+            # Tracker was created from live objects
+            self._decoded_objs = DecodeContext()
+            for ref_id, obj in enumerate(self.ctx._objs):
+                self._decoded_objs.add_obj(ref_id, obj)
+        
+        if(D.get('<delta>') != self.n_deltas + 1):
+            raise ValueError("Expected delta %d. Got %r" % (self.n_deltas + 1, D.get('<delta>')))
+        if(D['<n_objects>'] != self.ctx.n_objects):
+            raise ValueError("Delta does not apply to this graph. Expected %d objects. Got %d"
+                % (D['<n_objects>'], self.ctx.n_objects))
+        
+        decoded = self._decoded_objs
+        token = _applying.set(True)
+        try:
+            for ref_id, members in D['<changes>']:
+                obj = decoded.get_obj(ref_id)
+                if(obj is None):
+                    raise ValueError("Delta refers to unknown object with ref_id %d" % ref_id)
+                node_map = get_class_plan(type(obj)).node_map
+                for key, value in members.items():
+                    if(key not in node_map):
+                        raise ValueError("'%s' is not a member of '%s'" % (key, type(obj).__name__))
+                    decode_member_iterative(obj, key, value, decoded)
+        finally:
+            _applying.reset(token)
+        decoded.check_resolved()
+        
+        # Objects defined by the delta are known from now on
+        n_known = self.ctx.n_objects
+        n_objects = len(decoded)
+        for ref_id in range(n_known, n_objects):
+            obj = decoded.get_obj(ref_id)
+            if((obj is None) or (self.ctx.add_obj(obj) != ref_id)):
+                raise ValueError("Delta <ref_id> values are not consecutive")
+        self._track(n_known)
+        
+        self.n_deltas = D['<delta>']
@@ -0,0 +1,425 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Schema-header documents
+#
+# Same structure as the dictionaries of to_dict(), except that class names are
+# only stored once, in a class table at the top of the document:
+#   {
+#       "<classes>" : [[classid, fingerprint], ...],
+#       "<root>" : The root object
+#   }
+# fingerprint identifies the merged schema of the class that the document was
+# written with. (See ClassPlan.fingerprint)
+#
+# Within the document:
+#   Objects:        {"<class>" : index in the class table, "<ref_id>" : ref_id,
+#                    members...}
+#   References:     {"<ref>" : ref_id}
+#   Columnar lists: Same as to_dict(), but "<columnar>" is an index in the
+#                   class table
+#
+
+import weakref
+
+from ._core import EncodeContext, DecodeContext, TemplateNode
+from ._core import VALIDATION_LEVELS, get_class_plan, get_classid_str
+from ._core import get_registered_class
+from ._core import _columnar_split, _columnar_unpack, _is_mapping
+from ._core import _defer_members, _defer_placeholders, _make_tuple
+
+#-------------------------------------------------------------------------------
+# Encoders
+#
+# Values that cannot contain EncodableClass objects are encoded by the
+# regular compiled encoders. Everything else is compiled into encoders with
+# the signature:
+#   e(value, st)
+# where st is the _HeaderEncoder
+#-------------------------------------------------------------------------------
+def _compile_encoder(node):
+    kind = node.kind
+    check = node.encode
+    
+    if(not node.has_encodable):
+        def e(v, st):
+            return(check(v, st.ctx))
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        tmpl = node.tmpl
+        def e(v, st):
+            if(v is None):
+                return(None)
+            if(not isinstance(v, tmpl)):
+                # Report the error
+                check(v, st.ctx)
+            return(st.encode_obj(v))
+    
+    elif(kind == TemplateNode.LIST):
+        item_e = _compile_encoder(node.item)
+        def e(v, st):
+            if(type(v) != list):
+                check(v, st.ctx)
+            return([item_e(item, st) for item in v])
+    
+    elif(kind == TemplateNode.COLUMNAR):
+        tmpl = node.tmpl
+        item_e = _compile_encoder(node.item)
+        def e(v, st):
+            if(type(v) != list):
+                check(v, st.ctx)
+            plan = get_class_plan(tmpl.cls)
+            rows, fallback, base = _columnar_split(tmpl, v, st.ctx)
+            
+            columns = {}
+            for key, member_e, nested in _get_encoders(plan):
+                if(nested):
+                    columns[key] = [member_e(getattr(row, key), st) for row in rows]
+                else:
+                    columns[key] = [member_e(getattr(row, key), st.ctx) for row in rows]
+            
+            D = {}
+            D['<columnar>'] = st.get_index(plan)
+            D['<length>'] = len(v)
+            D['<ref_id>'] = base
+            D['<columns>'] = columns
+            D['<rows>'] = [[idx, item_e(v[idx], st)] for idx in fallback]
+            return(D)
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_es = [_compile_encoder(n) for n in node.items]
+        def e(v, st):
+            if((type(v) != tuple) or (len(v) != len(item_es))):
+                check(v, st.ctx)
+            return(tuple([item_e(item, st) for item_e, item in zip(item_es, v)]))
+    
+    else:
+        key_e = _compile_encoder(node.key)
+        val_e = _compile_encoder(node.value)
+        def e(v, st):
+            if(not _is_mapping(v)):
+                check(v, st.ctx)
+            return({key_e(k, st) : val_e(item, st) for k, item in v.items()})
+    
+    return(e)
+
+# ClassPlan --> [(key, encoder, nested), ...]
+# If nested is False, encoder is the regular compiled encoder of the member
+_plan_encoders = weakref.WeakKeyDictionary()
+
+def _get_encoders(plan):
+    try:
+        return(_plan_encoders[plan])
+    except KeyError:
+        encoders = []
+        for (key, node), (_, enc) in zip(plan.nodes, plan.encoders):
+            if(node.has_encodable):
+                encoders.append((key, _compile_encoder(node), True))
+            else:
+                encoders.append((key, enc, False))
+        _plan_encoders[plan] = encoders
+        return(encoders)
+
+class _HeaderEncoder:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        
+        # ClassPlan --> index in the class table
+        self.class_index = {}
+        
+        # [[classid, fingerprint], ...]
+        self.classes = []
+    
+    def get_index(self, plan):
+        """
+        Returns the class table index of a class. It is added to the table the
+        first time it is used.
+        """
+        idx = self.class_index.get(plan)
+        if(idx is None):
+            idx = len(self.classes)
+            self.class_index[plan] = idx
+            self.classes.append([plan.classid, plan.fingerprint])
+        return(idx)
+    
+    def encode_obj(self, obj):
+        ctx = self.ctx
+        ref_id = ctx.get_ref_id(obj)
+        if(ref_id is not None):
+            # This object has already been encoded elsewhere.
+            # Instead, just store a reference to the other one
+            ctx.add_ref(ref_id)
+            return({'<ref>': ref_id})
+        
+        ref_id = ctx.add_obj(obj)
+        plan = get_class_plan(type(obj))
+        D = {'<class>': self.get_index(plan), '<ref_id>': ref_id}
+        for key, e, nested in _get_encoders(plan):
+            if(nested):
+                D[key] = e(getattr(obj, key), self)
+            else:
+                D[key] = e(getattr(obj, key), ctx)
+        return(D)
+
+def to_header_dict(obj, _encoded_objs=None):
+    """
+    Same as obj.to_dict(), but produces a schema-header document, where each
+    classid is only stored once.
+    """
+    if(_encoded_objs is None):
+        _encoded_objs = EncodeContext()
+    encoder = _HeaderEncoder(_encoded_objs)
+    root = encoder.encode_obj(obj)
+    
+    D = {}
+    D['<classes>'] = encoder.classes
+    D['<root>'] = root
+    return(D)
+
+#-------------------------------------------------------------------------------
+# Decoders
+#
+# Same as the encoders, with the signature:
+#   d(value, st)
+# where st is the _HeaderDecoder.
+# References to objects that are not decoded yet are handled the same way as
+# from_dict() does.
+#-------------------------------------------------------------------------------
+def _compile_decoder(node, level):
+    kind = node.kind
+    check = node.decode
+    
+    if(not node.has_encodable):
+        dec = getattr(node, level)
+        def d(v, st):
+            return(dec(v, st.ctx))
+    
+    elif(kind == TemplateNode.ENCODABLE):
+        tmpl = node.tmpl
+        def d(v, st):
+            if(v is None):
+                return(None)
+            if(not _is_mapping(v)):
+                raise TypeError("'%s', depth=%d: Dictionary incompatible with '%s'"
+                    % (node.parent_key, node.depth, tmpl.__name__))
+            
+            if('<ref>' in v):
+                # Returns a Ref placeholder if the object was not decoded yet
+                return(st.ctx.get_ref(v['<ref>'], tmpl))
+            
+            if('<class>' not in v):
+                raise TypeError("'%s', depth=%d: Dictionary incompatible with '%s'"
+                    % (node.parent_key, node.depth, tmpl.__name__))
+            return(st.decode_obj(st.get_class(v['<class>'], node), v))
+    
+    elif(kind == TemplateNode.LIST):
+        item_d = _compile_decoder(node.item, level)
+        def d(v, st):
+            if(type(v) != list):
+                # Report the error
+                check(v, st.ctx)
+            return([item_d(item, st) for item in v])
+    
+    elif(kind == TemplateNode.COLUMNAR):
+        item_d = _compile_decoder(node.item, level)
+        def d(v, st):
+            return(st.decode_columnar(node, item_d, v))
+    
+    elif(kind == TemplateNode.TUPLE):
+        item_ds = [_compile_decoder(n, level) for n in node.items]
+        def d(v, st):
+            if(((type(v) != tuple) and (type(v) != list)) or (len(v) != len(item_ds))):
+                check(v, st.ctx)
+            n_placeholders = st.ctx.n_placeholders
+            return(_make_tuple([item_d(item, st) for item_d, item in zip(item_ds, v)], n_placeholders, st.ctx))
+    
+    else:
+        key_d = _compile_decoder(node.key, level)
+        val_d = _compile_decoder(node.value, level)
+        def d(v, st):
+            if(not _is_mapping(v)):
+                check(v, st.ctx)
+            return({key_d(k, st) : val_d(item, st) for k, item in v.items()})
+    
+    return(d)
+
+# Validation level --> {ClassPlan --> [(key, decoder, nested), ...]}
+# If nested is False, decoder is the regular compiled decoder of the member
+_plan_decoders = {}
+
+def _get_decoders(plan, level):
+    table = _plan_decoders.get(level)
+    if(table is None):
+        table = _plan_decoders[level] = weakref.WeakKeyDictionary()
+    try:
+        return(table[plan])
+    except KeyError:
+        decoders = []
+        for key, node in plan.nodes:
+            if(node.has_encodable):
+                decoders.append((key, _compile_decoder(node, level), True))
+            else:
+                decoders.append((key, getattr(node, level), False))
+        table[plan] = decoders
+        return(decoders)
+
+class _HeaderDecoder:
+    def __init__(self, classes, validation, intern):
+        if(validation not in VALIDATION_LEVELS):
+            raise ValueError("Unknown validation level '%s'. Expected one of %s"
+                % (validation, ", ".join(VALIDATION_LEVELS)))
+        
+        # TemplateNode attribute of the decoder for the validation level
+        level = {
+            "full": "decode",
+            "sampled": "decode_sampled",
+            "trusted": "decode_trusted",
+        }[validation]
+        
+        self.ctx = DecodeContext(intern = intern)
+        
+        # Indexed by class table index: (cls, plan, decoders)
+        self.classes = []
+        if(type(classes) != list):
+            raise TypeError("Expected a class table. Got '%s'" % type(classes).__name__)
+        for entry in classes:
+            classid, fingerprint = entry
+            cls = get_registered_class(classid)
+            if(cls is None):
+                raise TypeError("Unknown class '%s'" % classid)
+            plan = get_class_plan(cls)
+            if(plan.fingerprint != fingerprint):
+                raise ValueError("Schema of class '%s' does not match the one it was stored with" % classid)
+            self.classes.append((cls, plan, _get_decoders(plan, level)))
+    
+    def get_class(self, idx, node):
+        """
+        Returns the (cls, plan, decoders) of a class table index. The class
+        must be compatible with the template of node
+        """
+        if((type(idx) != int) or (idx < 0) or (idx >= len(self.classes))):
+            raise ValueError("'%s', depth=%d: Invalid class index %r"
+                % (node.parent_key, node.depth, idx))
+        entry = self.classes[idx]
+        if(not issubclass(entry[0], node.tmpl)):
+            raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                % (node.parent_key, node.depth, entry[1].classid, get_classid_str(node.tmpl)))
+        return(entry)
+    
+    def decode_obj(self, entry, D):
+        """
+        Decode the definition D of an object of the class table entry
+        """
+        cls, plan, decoders = entry
+        ctx = self.ctx
+        if('<ref_id>' not in D):
+            raise ValueError("Missing <ref_id>")
+        ref_id = D['<ref_id>']
+        
+        obj = cls.__new__(cls)
+        
+        # register the decoded object
+        if(ref_id in ctx):
+            # An object with the same ID was already decoded??
+            raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+        ctx[ref_id] = obj
+        
+        n_placeholders = ctx.n_placeholders
+        for key, d, nested in decoders:
+            if(nested):
+                setattr(obj, key, d(D[key], self))
+            else:
+                setattr(obj, key, d(D[key], ctx))
+        if(ctx.n_placeholders != n_placeholders):
+            _defer_members(obj, plan, ctx)
+        return(obj)
+    
+    def decode_columnar(self, node, item_d, value):
+        ctx = self.ctx
+        if((not _is_mapping(value)) or ('<columnar>' not in value)):
+            raise TypeError("'%s', depth=%d: Expected a columnar list of '%s'"
+                % (node.parent_key, node.depth, node.tmpl.cls.__name__))
+        
+        cls, plan, decoders = self.get_class(value['<columnar>'], node.item)
+        if(cls is not node.tmpl.cls):
+            raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                % (node.parent_key, node.depth, plan.classid, get_classid_str(node.tmpl.cls)))
+        
+        # Validate the rest the same way as a to_dict() columnar list
+        value = dict(value)
+        value['<columnar>'] = plan.classid
+        length, base, columns, rows, row_indexes = _columnar_unpack(
+            node.tmpl, value, plan, node.parent_key, node.depth)
+        
+        result = [None] * length
+        col_objs = []
+        for n, idx in enumerate(row_indexes):
+            obj = cls.__new__(cls)
+            
+            # register the decoded object
+            ref_id = base + n
+            if(ref_id in ctx):
+                # An object with the same ID was already decoded??
+                raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+            ctx[ref_id] = obj
+            
+            result[idx] = obj
+            col_objs.append(obj)
+        
+        n_placeholders = ctx.n_placeholders
+        for key, d, nested in decoders:
+            if(nested):
+                for obj, v in zip(col_objs, columns[key]):
+                    setattr(obj, key, d(v, self))
+            else:
+                for obj, v in zip(col_objs, columns[key]):
+                    setattr(obj, key, d(v, ctx))
+        if(ctx.n_placeholders != n_placeholders):
+            for obj in col_objs:
+                _defer_members(obj, plan, ctx)
+        
+        for idx, v in rows:
+            result[idx] = item_d(v, self)
+        
+        return(result)
+
+def from_header_dict(cls, D, validation="full", intern=None):
+    """
+    Same as cls.from_dict(), for a schema-header document made by
+    to_header_dict().
+    The classes of the document are looked up once, from its class table, and
+    are rejected if their schema changed since the document was written.
+    """
+    if((not _is_mapping(D)) or ('<classes>' not in D) or ('<root>' not in D)):
+        raise ValueError("Not a schema-header document")
+    
+    decoder = _HeaderDecoder(D['<classes>'], validation, intern)
+    root = D['<root>']
+    idx = root.get('<class>') if _is_mapping(root) else None
+    if((type(idx) != int) or (idx < 0) or (idx >= len(decoder.classes))
+       or (decoder.classes[idx][0] is not cls)):
+        raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+    
+    obj = decoder.decode_obj(decoder.classes[idx], root)
+    decoder.ctx.resolve_pending()
+    decoder.ctx.check_resolved()
+    return(obj)
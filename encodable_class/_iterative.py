@@ -0,0 +1,540 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Non-recursive encode/decode engine
+#
+# EncodableClass.to_dict() and from_dict() recurse once per level of nesting,
+# so very deep object graphs (long linked chains, for example) exceed Python's
+# recursion limit. The functions here produce the same results, but walk the
+# graph with an explicit work stack instead of the Python call stack.
+#
+# Members that cannot contain EncodableClass objects are still handled by the
+# compiled encoders/decoders directly, without going through the work stack.
+#
+
+from ._core import EncodeContext, DecodeContext, Ref, PendingTuple, TemplateNode
+from ._core import get_class_plan, get_classid_str, lookup_subtype
+from ._core import _columnar_split, _columnar_unpack, _is_mapping
+
+# Work stack frame kinds
+_OBJ = 0
+_LIST = 1
+_TUPLE = 2
+_DICT = 3
+_COLUMNAR = 4
+
+#-------------------------------------------------------------------------------
+# Encoder
+#-------------------------------------------------------------------------------
+def _encode_obj(obj, ctx, stack):
+    """
+    Start encoding EncodableClass obj.
+    Returns its dictionary, which is filled in once the pushed frame is done.
+    """
+    ref_id = ctx.get_ref_id(obj)
+    if(ref_id is not None):
+        # This object has already been encoded elsewhere.
+        # Instead, just store a reference to the other one
+        ctx.add_ref(ref_id)
+        return({'<classtype>': '<ref>', '<ref_id>': ref_id})
+
+    ref_id = ctx.add_obj(obj)
+    plan = get_class_plan(type(obj))
+    D = {'<classtype>': plan.classid, '<ref_id>': ref_id}
+    if(plan.has_encodable):
+        stack.append((_OBJ, D, iter(plan.nodes), obj))
+    else:
+        # Nothing to descend into. Encode it right away
+        for key, enc in plan.encoders:
+            D[key] = enc(getattr(obj, key), ctx)
+    return(D)
+
+def _encode_start(node, value, ctx, stack, parent, parent_key):
+    """
+    Start encoding value, which is described by a node that may contain
+    EncodableClass objects.
+    Returns the encoded value. If a frame was pushed, it is filled in later.
+    """
+    kind = node.kind
+    if(kind == TemplateNode.ENCODABLE):
+        if(value is None):
+            return(None)
+        if(not isinstance(value, node.tmpl)):
+            # Report the error
+            node.encode(value, ctx)
+        return(_encode_obj(value, ctx, stack))
+
+    elif(kind == TemplateNode.LIST):
+        if(type(value) != list):
+            node.encode(value, ctx)
+        result = []
+        stack.append((_LIST, result, iter(value), node.item))
+        return(result)
+
+    elif(kind == TemplateNode.COLUMNAR):
+        if(type(value) != list):
+            node.encode(value, ctx)
+        rows, fallback, base = _columnar_split(node.tmpl, value, ctx)
+        plan = get_class_plan(node.tmpl.cls)
+
+        columns = {}
+        for key, _ in plan.nodes:
+            columns[key] = [None] * len(rows)
+        encoded_rows = [[idx, None] for idx in fallback]
+
+        result = {}
+        result['<columnar>'] = plan.classid
+        result['<length>'] = len(value)
+        result['<ref_id>'] = base
+        result['<columns>'] = columns
+        result['<rows>'] = encoded_rows
+        stack.append((_COLUMNAR, None, _iter_columnar_encode(node, plan, value, rows, columns, encoded_rows), None))
+        return(result)
+
+    elif(kind == TemplateNode.TUPLE):
+        if((type(value) != tuple) or (len(value) != len(node.items))):
+            node.encode(value, ctx)
+        # Built as a list, then converted once complete
+        result = [None] * len(value)
+        stack.append((_TUPLE, result, enumerate(zip(node.items, value)), (parent, parent_key)))
+        return(None)
+
+    else:
+        if(type(value) != dict):
+            node.encode(value, ctx)
+        result = {}
+        stack.append((_DICT, result, iter(value.items()), node))
+        return(result)
+
+def _iter_columnar_encode(node, plan, value, rows, columns, encoded_rows):
+    """
+    Yields (node, value, container, index) for every value of a columnar list
+    that is still to be encoded, in the same order as the compiled encoder
+    """
+    for key, n in plan.nodes:
+        column = columns[key]
+        for idx, row in enumerate(rows):
+            yield(n, getattr(row, key), column, idx)
+    for slot in encoded_rows:
+        yield(node.item, value[slot[0]], slot, 1)
+
+def to_dict_iterative(obj, _encoded_objs=None):
+    """
+    Same as obj.to_dict(), without recursion
+    """
+    if(_encoded_objs is None):
+        _encoded_objs = EncodeContext()
+    ctx = _encoded_objs
+
+    stack = []
+    root = _encode_obj(obj, ctx, stack)
+
+    while(stack):
+        kind, target, it, aux = stack[-1]
+        depth = len(stack)
+
+        if(kind == _OBJ):
+            for key, node in it:
+                value = getattr(aux, key)
+                if(node.has_encodable):
+                    target[key] = _encode_start(node, value, ctx, stack, target, key)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    target[key] = node.encode(value, ctx)
+            else:
+                stack.pop()
+
+        elif(kind == _LIST):
+            if(aux.kind == TemplateNode.ENCODABLE):
+                # Most common case. List of objects
+                tmpl = aux.tmpl
+                for value in it:
+                    if((value is None) or (not isinstance(value, tmpl))):
+                        target.append(_encode_start(aux, value, ctx, stack, target, len(target)))
+                        continue
+                    target.append(_encode_obj(value, ctx, stack))
+                    if(len(stack) != depth):
+                        break
+                else:
+                    stack.pop()
+            else:
+                for value in it:
+                    target.append(_encode_start(aux, value, ctx, stack, target, len(target)))
+                    if(len(stack) != depth):
+                        break
+                else:
+                    stack.pop()
+
+        elif(kind == _TUPLE):
+            for idx, (node, value) in it:
+                if(node.has_encodable):
+                    target[idx] = _encode_start(node, value, ctx, stack, target, idx)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    target[idx] = node.encode(value, ctx)
+            else:
+                stack.pop()
+                parent, parent_key = aux
+                parent[parent_key] = tuple(target)
+
+        elif(kind == _COLUMNAR):
+            for node, value, container, idx in it:
+                if(node.has_encodable):
+                    container[idx] = _encode_start(node, value, ctx, stack, container, idx)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    container[idx] = node.encode(value, ctx)
+            else:
+                stack.pop()
+
+        else:
+            key_node = aux.key
+            value_node = aux.value
+            for k, value in it:
+                k = key_node.encode(k, ctx)
+                if(value_node.has_encodable):
+                    target[k] = _encode_start(value_node, value, ctx, stack, target, k)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    target[k] = value_node.encode(value, ctx)
+            else:
+                stack.pop()
+
+    return(root)
+
+#-------------------------------------------------------------------------------
+# Decoder
+#
+# Only objects, and lists, tuples and dicts that may contain objects, get a
+# frame on the work stack. Everything else is decoded in place by the compiled
+# decoders. Decoded values are stored directly. The only placeholders are the
+# Refs handed out for references to objects that are not decoded yet, and the
+# PendingTuples that hold such Refs. Both are recorded with ctx.defer() where
+# they are created.
+#-------------------------------------------------------------------------------
+class _DecodeStack(list):
+    """
+    Work stack of the decoder.
+    Also caches the member layout of each class decoded so far. Plans cannot
+    change while decoding.
+    """
+    def __init__(self):
+        list.__init__(self)
+        
+        # class --> (leading, rest)
+        # leading is the list of (key, decoder) of the members before the
+        # first one that may contain EncodableClass objects. These are decoded
+        # right away. rest is the list of (key, node, start) of the other
+        # members, which are decoded by the object's frame. start is the
+        # _START function of the node, or None if the member is decoded by
+        # node.decode
+        self.layouts = {}
+    
+    def get_layout(self, cls):
+        try:
+            return(self.layouts[cls])
+        except KeyError:
+            pass
+        plan = get_class_plan(cls)
+        n = 0
+        for _, node in plan.nodes:
+            if(node.has_encodable):
+                break
+            n += 1
+        rest = [
+            (key, node, _START[node.kind] if node.has_encodable else None)
+            for key, node in plan.nodes[n:]
+        ]
+        layout = self.layouts[cls] = (plan.decoders[:n], rest)
+        return(layout)
+
+def _decode_store(container, index, value):
+    """
+    Store a decoded value in container[index], or the attribute of an object
+    """
+    if(type(container) == PendingTuple):
+        container.items[index] = value
+    elif((type(container) == list) or (type(container) == dict)):
+        container[index] = value
+    else:
+        setattr(container, index, value)
+
+def _decode_obj(cls, D, ctx, stack):
+    """
+    Start decoding an object of exactly class cls from dictionary D.
+    Returns the object. Its members are filled in once the pushed frame is done.
+    """
+    leading, rest = stack.get_layout(cls)
+
+    if('<ref_id>' not in D):
+        raise ValueError("Missing <ref_id>")
+
+    obj = cls.__new__(cls)
+
+    # register the decoded object
+    ctx.add_obj(D['<ref_id>'], obj)
+
+    # Members with nothing to descend into are decoded right away
+    for key, dec in leading:
+        setattr(obj, key, dec(D[key], ctx))
+    if(rest):
+        stack.append((_OBJ, obj, iter(rest), D))
+    return(obj)
+
+def _decode_ref_or_obj(node, value, ctx, stack, parent, parent_key):
+    """
+    Start decoding value according to an ENCODABLE node.
+    Returns the object, or a Ref placeholder that was recorded as stored in
+    parent[parent_key] (or the attribute of an object)
+    """
+    if(value is None):
+        return(None)
+    
+    try:
+        classid = value['<classtype>']
+        ref_id = value['<ref_id>']
+    except (TypeError, KeyError):
+        # Let the regular decoder report the error
+        return(node.decode(value, ctx))
+    
+    if(classid == '<ref>'):
+        # This is a reference, not an actual class definition
+        result = ctx.get_ref(ref_id, node.tmpl)
+        if(type(result) == Ref):
+            ctx.defer(parent, parent_key, result)
+        return(result)
+    
+    # Figure out what specific subtype of tmpl should be created.
+    try:
+        cls = node.subtypes[classid]
+    except KeyError:
+        cls = lookup_subtype(node.tmpl, classid)
+    
+    if(cls is None):
+        raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+            % (node.parent_key, node.depth, classid, get_classid_str(node.tmpl)))
+    
+    return(_decode_obj(cls, value, ctx, stack))
+
+def _decode_objs(item_node, it, result, ctx, stack):
+    """
+    Decode the items of a list of objects, from it, an iterator of
+    (index, value), into the list result. Stops after an item that pushed a
+    frame.
+    Returns True if there are no items left
+    """
+    depth = len(stack)
+    last = len(result) - 1
+    for idx, value in it:
+        result[idx] = _decode_ref_or_obj(item_node, value, ctx, stack, result, idx)
+        if(len(stack) != depth):
+            return(idx == last)
+    return(True)
+
+def _start_list(node, value, ctx, stack, parent, parent_key):
+    if(type(value) != list):
+        node.decode(value, ctx)
+    result = [None] * len(value)
+    if(node.item.kind == TemplateNode.ENCODABLE):
+        # References and objects without members to descend into need no
+        # frame. Push one for the remaining items only if an item did
+        it = enumerate(value)
+        depth = len(stack)
+        if(not _decode_objs(node.item, it, result, ctx, stack)):
+            stack.insert(depth, (_LIST, result, it, node.item))
+    elif(value):
+        stack.append((_LIST, result, enumerate(value), node.item))
+    return(result)
+
+def _start_dict(node, value, ctx, stack, parent, parent_key):
+    if(not _is_mapping(value)):
+        node.decode(value, ctx)
+    result = {}
+    if(value):
+        stack.append((_DICT, result, iter(value.items()), node))
+    return(result)
+
+def _start_columnar(node, value, ctx, stack, parent, parent_key):
+    cls = node.tmpl.cls
+    plan = get_class_plan(cls)
+    length, base, columns, rows, row_indexes = _columnar_unpack(
+        node.tmpl, value, plan, node.parent_key, node.depth)
+
+    result = [None] * length
+    col_objs = []
+    for n, idx in enumerate(row_indexes):
+        obj = cls.__new__(cls)
+        ctx.add_obj(base + n, obj)
+        result[idx] = obj
+        col_objs.append(obj)
+    stack.append((_COLUMNAR, None, _iter_columnar_decode(node, plan, columns, rows, col_objs, result), None))
+    return(result)
+
+def _start_tuple(node, value, ctx, stack, parent, parent_key):
+    if(((type(value) != tuple) and (type(value) != list)) or (len(value) != len(node.items))):
+        node.decode(value, ctx)
+    result = PendingTuple()
+    result.items = [None] * len(value)
+    stack.append((_TUPLE, result, enumerate(zip(node.items, value)), (parent, parent_key)))
+    return(None)
+
+# node kind --> f(node, value, ctx, stack, parent, parent_key)
+# Starts decoding value according to a node that may contain EncodableClass
+# objects, and pushes a frame for the value's contents if needed.
+# Returns the decoded value, which the caller stores in parent[parent_key] (or
+# the attribute of an object). Tuples are stored there by their frame once
+# complete, and None is returned in the meantime.
+_START = {
+    TemplateNode.ENCODABLE : _decode_ref_or_obj,
+    TemplateNode.LIST : _start_list,
+    TemplateNode.DICT : _start_dict,
+    TemplateNode.COLUMNAR : _start_columnar,
+    TemplateNode.TUPLE : _start_tuple,
+}
+
+def _decode_start(node, value, ctx, stack, parent, parent_key):
+    """
+    Start decoding value according to a node that may contain EncodableClass
+    objects. (See _START)
+    """
+    return(_START[node.kind](node, value, ctx, stack, parent, parent_key))
+
+def _iter_columnar_decode(node, plan, columns, rows, col_objs, result):
+    """
+    Yields (node, value, container, index) for every value of a columnar list
+    that is still to be decoded
+    """
+    for key, n in plan.nodes:
+        for obj, value in zip(col_objs, columns[key]):
+            yield(n, value, obj, key)
+    for idx, value in rows:
+        yield(node.item, value, result, idx)
+
+def from_dict_iterative(cls, D, ctx=None):
+    """
+    Same as cls.from_dict(D), without recursion.
+    If ctx is given, it is the DecodeContext that decoded objects are added to.
+    """
+    if(('<classtype>' not in D) or (D['<classtype>'] != get_class_plan(cls).classid)):
+        raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+
+    if(ctx is None):
+        ctx = DecodeContext()
+    stack = _DecodeStack()
+    root = _decode_obj(cls, D, ctx, stack)
+    _run_decoder(ctx, stack)
+    ctx.check_resolved()
+    return(root)
+
+def decode_member_iterative(obj, key, value, ctx):
+    """
+    Decode value, the encoded form of obj's member key, and assign it.
+    ctx is the DecodeContext of objects that value may refer to. Objects
+    defined in value are added to it.
+    """
+    node = get_class_plan(type(obj)).node_map[key]
+    if(node.has_encodable):
+        stack = _DecodeStack()
+        setattr(obj, key, _decode_start(node, value, ctx, stack, obj, key))
+        _run_decoder(ctx, stack)
+    else:
+        setattr(obj, key, node.decode(value, ctx))
+
+def _run_decoder(ctx, stack):
+    """
+    Run the decoder until the work stack is empty
+    """
+    while(stack):
+        kind, target, it, aux = stack[-1]
+        depth = len(stack)
+
+        if(kind == _OBJ):
+            for key, node, start in it:
+                if(start is None):
+                    setattr(target, key, node.decode(aux[key], ctx))
+                else:
+                    setattr(target, key, start(node, aux[key], ctx, stack, target, key))
+                    if(len(stack) != depth):
+                        break
+            else:
+                stack.pop()
+
+        elif(kind == _LIST):
+            if(aux.kind == TemplateNode.ENCODABLE):
+                # Most common case. List of objects
+                if(_decode_objs(aux, it, target, ctx, stack)):
+                    # Frames pushed by the last item are above this one
+                    del stack[depth - 1]
+            else:
+                for idx, value in it:
+                    target[idx] = _decode_start(aux, value, ctx, stack, target, idx)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    stack.pop()
+
+        elif(kind == _TUPLE):
+            for idx, (node, value) in it:
+                if(node.has_encodable):
+                    target.items[idx] = _decode_start(node, value, ctx, stack, target, idx)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    target.items[idx] = node.decode(value, ctx)
+            else:
+                stack.pop()
+                parent, parent_key = aux
+                if(target.n_pending == 0):
+                    _decode_store(parent, parent_key, tuple(target.items))
+                else:
+                    # Still holds placeholders. Replaced once they are resolved
+                    ctx.defer(parent, parent_key, target)
+                    _decode_store(parent, parent_key, target)
+
+        elif(kind == _COLUMNAR):
+            for node, value, container, idx in it:
+                if(node.has_encodable):
+                    _decode_store(container, idx, _decode_start(node, value, ctx, stack, container, idx))
+                    if(len(stack) != depth):
+                        break
+                else:
+                    _decode_store(container, idx, node.decode(value, ctx))
+            else:
+                stack.pop()
+
+        else:
+            key_node = aux.key
+            value_node = aux.value
+            for k, value in it:
+                k = key_node.decode(k, ctx)
+                if(value_node.has_encodable):
+                    target[k] = _decode_start(value_node, value, ctx, stack, target, k)
+                    if(len(stack) != depth):
+                        break
+                else:
+                    target[k] = value_node.decode(value, ctx)
+            else:
+                stack.pop()
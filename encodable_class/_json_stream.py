@@ -0,0 +1,1018 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Streaming JSON reader/writer for EncodableClass objects
+#
+# The writer walks the object graph using the class plans and writes JSON text
+# as it goes, without building the intermediate dictionary returned by
+# to_dict(). Output is identical to:
+#   json.dump(obj.to_dict(), fp, **kwargs)
+#
+# The reader parses JSON text incrementally from a file, and builds objects
+# directly from the parser's events, without building the intermediate
+# dictionary passed to from_dict().
+#
+
+import re
+import codecs
+from json.encoder import encode_basestring, encode_basestring_ascii, INFINITY
+from json.decoder import scanstring, JSONDecodeError
+
+from ._core import EncodeContext, DecodeContext, PendingTuple, TemplateNode
+from ._core import get_class_plan, get_classid_str, lookup_subtype, is_pending
+from ._core import _columnar_unpack, VALIDATION_LEVELS
+
+# Site of objects that are written as part of a columnar list
+_COLUMNAR_SITE = object()
+
+#-------------------------------------------------------------------------------
+class JSONStreamWriter:
+    """
+    Produces the JSON text of an EncodableClass graph as a sequence of chunks.
+
+    Formatting options have the same meaning as the ones of json.dump()
+    """
+    def __init__(self, indent=None, separators=None, sort_keys=False,
+                 ensure_ascii=True, allow_nan=True):
+
+        if((indent is not None) and (not isinstance(indent, str))):
+            indent = ' ' * indent
+        self.indent = indent
+
+        if(separators is not None):
+            self.item_separator, self.key_separator = separators
+        elif(indent is not None):
+            self.item_separator, self.key_separator = (',', ': ')
+        else:
+            self.item_separator, self.key_separator = (', ', ': ')
+
+        if(ensure_ascii):
+            self.encode_str = encode_basestring_ascii
+        else:
+            self.encode_str = encode_basestring
+
+        self.sort_keys = sort_keys
+        self.allow_nan = allow_nan
+
+        # Encode state. Reset for each call to iterencode()
+        self.ctx = None
+        self._sites = None
+        self._columnar = None
+        self._field_orders = {}
+
+    def iterencode(self, obj):
+        """
+        Yields the JSON text of EncodableClass obj in chunks
+        """
+        if(self.sort_keys):
+            # Members are written in a different order than to_dict() encodes
+            # them. In order to produce identical output, <ref_id> numbering
+            # and the location where each object is fully written must be
+            # determined in to_dict() order first.
+            self.ctx = EncodeContext()
+            self._sites = {}
+            self._columnar = {}
+            self._scan_obj(obj, None)
+        else:
+            self.ctx = EncodeContext()
+            self._sites = None
+
+        try:
+            yield from self._iter_obj(obj, 0, None)
+        finally:
+            self._sites = None
+            self._columnar = None
+
+    #---------------------------------------------------------------------------
+    # Ref-id pre-pass (sort_keys only)
+    #---------------------------------------------------------------------------
+    def _scan_obj(self, obj, site):
+        if(self.ctx.get_ref_id(obj) is not None):
+            return
+        self.ctx.add_obj(obj)
+        self._sites[id(obj)] = site
+
+        plan = get_class_plan(type(obj))
+        obj_id = id(obj)
+        for key, node in plan.nodes:
+            if(node.has_encodable):
+                self._scan_value(node, getattr(obj, key), (obj_id, key), None, None)
+
+    def _scan_value(self, node, value, owner, container, index):
+        if(node.kind == TemplateNode.ENCODABLE):
+            if(value is not None):
+                self._scan_obj(value, (owner, container, index))
+        elif(node.kind == TemplateNode.LIST):
+            for i, v in enumerate(value):
+                self._scan_value(node.item, v, owner, id(value), i)
+        elif(node.kind == TemplateNode.TUPLE):
+            for i, (n, v) in enumerate(zip(node.items, value)):
+                if(n.has_encodable):
+                    self._scan_value(n, v, owner, id(value), i)
+        elif(node.kind == TemplateNode.DICT):
+            for k, v in value.items():
+                self._scan_value(node.value, v, owner, id(value), k)
+        elif(node.kind == TemplateNode.COLUMNAR):
+            # Columnar lists are written exactly as encoded, so encode them now.
+            # Objects encoded along with it are never written anywhere else.
+            n_objs = self.ctx.n_objects
+            self._columnar[(owner, container, index)] = node.encode(value, self.ctx)
+            for o in self.ctx._objs[n_objs:]:
+                self._sites[id(o)] = _COLUMNAR_SITE
+
+    #---------------------------------------------------------------------------
+    # Writers
+    #---------------------------------------------------------------------------
+    def _begin(self, level):
+        """
+        Returns the (opening, separator, closing) whitespace of a non-empty
+        container whose contents are at nesting level+1
+        """
+        if(self.indent is None):
+            return('', self.item_separator, '')
+        newline_indent = '\n' + self.indent * (level + 1)
+        return(newline_indent, self.item_separator + newline_indent, '\n' + self.indent * level)
+
+    def _iter_obj(self, obj, level, site):
+        ctx = self.ctx
+        plan = get_class_plan(type(obj))
+
+        if(self._sites is None):
+            # Encoding in to_dict() order
+            ref_id = ctx.get_ref_id(obj)
+            is_ref = (ref_id is not None)
+            if(is_ref):
+                ctx.add_ref(ref_id)
+            else:
+                ref_id = ctx.add_obj(obj)
+        else:
+            ref_id = ctx.get_ref_id(obj)
+            is_ref = (self._sites[id(obj)] != site)
+            if(is_ref):
+                ctx.add_ref(ref_id)
+
+        if(is_ref):
+            fields = [('<classtype>', None), ('<ref_id>', None)]
+        else:
+            fields = self._get_field_order(plan)
+
+        opening, separator, closing = self._begin(level)
+        yield '{' + opening
+
+        obj_id = id(obj)
+        first = True
+        for key, node in fields:
+            if(first):
+                first = False
+            else:
+                yield separator
+            yield self.encode_str(key) + self.key_separator
+
+            if(key == '<classtype>'):
+                if(is_ref):
+                    yield self.encode_str('<ref>')
+                else:
+                    yield self.encode_str(plan.classid)
+            elif(key == '<ref_id>'):
+                yield int.__repr__(ref_id)
+            elif(node.has_encodable):
+                yield from self._iter_value(node, getattr(obj, key), level+1, (obj_id, key), None, None)
+            else:
+                yield from self._iter_primitive(node.encode(getattr(obj, key), ctx), level+1)
+
+        yield closing + '}'
+
+    def _get_field_order(self, plan):
+        try:
+            return(self._field_orders[plan])
+        except KeyError:
+            pass
+
+        fields = [('<classtype>', None), ('<ref_id>', None)]
+        fields.extend(plan.nodes)
+        if(self.sort_keys):
+            fields.sort(key=lambda f: f[0])
+        self._field_orders[plan] = fields
+        return(fields)
+
+    def _iter_value(self, node, value, level, owner, container, index):
+        """
+        Yields a value that may contain EncodableClass objects
+        """
+        if(node.kind == TemplateNode.ENCODABLE):
+            if(value is None):
+                yield 'null'
+            else:
+                # Run the template's encoder checks without encoding
+                if(not isinstance(value, node.tmpl)):
+                    node.encode(value, self.ctx)
+                yield from self._iter_obj(value, level, (owner, container, index))
+
+        elif(node.kind == TemplateNode.LIST):
+            if(type(value) != list):
+                node.encode(value, self.ctx)
+            if(not value):
+                yield '[]'
+                return
+
+            opening, separator, closing = self._begin(level)
+            yield '[' + opening
+            item = node.item
+            container = id(value)
+            for i, v in enumerate(value):
+                if(i):
+                    yield separator
+                yield from self._iter_value(item, v, level+1, owner, container, i)
+            yield closing + ']'
+
+        elif(node.kind == TemplateNode.COLUMNAR):
+            if(self._columnar is None):
+                yield from self._iter_primitive(node.encode(value, self.ctx), level)
+            else:
+                yield from self._iter_primitive(self._columnar[(owner, container, index)], level)
+
+        elif(node.kind == TemplateNode.TUPLE):
+            if((type(value) != tuple) or (len(value) != len(node.items))):
+                node.encode(value, self.ctx)
+            if(not value):
+                yield '[]'
+                return
+
+            opening, separator, closing = self._begin(level)
+            yield '[' + opening
+            container = id(value)
+            for i, (n, v) in enumerate(zip(node.items, value)):
+                if(i):
+                    yield separator
+                if(n.has_encodable):
+                    yield from self._iter_value(n, v, level+1, owner, container, i)
+                else:
+                    yield from self._iter_primitive(n.encode(v, self.ctx), level+1)
+            yield closing + ']'
+
+        elif(node.kind == TemplateNode.DICT):
+            if(type(value) != dict):
+                node.encode(value, self.ctx)
+            if(not value):
+                yield '{}'
+                return
+
+            # Keys never contain EncodableClass objects that can be written to JSON
+            items = [(node.key.encode(k, self.ctx), k, v) for k, v in value.items()]
+            if(self.sort_keys):
+                items.sort(key=lambda item: item[0])
+
+            opening, separator, closing = self._begin(level)
+            yield '{' + opening
+            container = id(value)
+            first = True
+            for k_enc, k, v in items:
+                if(first):
+                    first = False
+                else:
+                    yield separator
+                yield self._key_str(k_enc) + self.key_separator
+                if(node.value.has_encodable):
+                    yield from self._iter_value(node.value, v, level+1, owner, container, k)
+                else:
+                    yield from self._iter_primitive(node.value.encode(v, self.ctx), level+1)
+            yield closing + '}'
+
+    def _iter_primitive(self, o, level):
+        """
+        Yields an already-encoded primitive value
+        """
+        if(isinstance(o, str)):
+            yield self.encode_str(o)
+        elif(o is None):
+            yield 'null'
+        elif(o is True):
+            yield 'true'
+        elif(o is False):
+            yield 'false'
+        elif(isinstance(o, int)):
+            yield int.__repr__(o)
+        elif(isinstance(o, float)):
+            yield self._float_str(o)
+        elif(isinstance(o, (list, tuple))):
+            if(not o):
+                yield '[]'
+                return
+            opening, separator, closing = self._begin(level)
+            yield '[' + opening
+            first = True
+            for v in o:
+                if(first):
+                    first = False
+                else:
+                    yield separator
+                yield from self._iter_primitive(v, level+1)
+            yield closing + ']'
+        elif(isinstance(o, dict)):
+            if(not o):
+                yield '{}'
+                return
+            if(self.sort_keys):
+                items = sorted(o.items())
+            else:
+                items = o.items()
+            opening, separator, closing = self._begin(level)
+            yield '{' + opening
+            first = True
+            for k, v in items:
+                if(first):
+                    first = False
+                else:
+                    yield separator
+                yield self._key_str(k) + self.key_separator
+                yield from self._iter_primitive(v, level+1)
+            yield closing + '}'
+        else:
+            raise TypeError("Object of type %s is not JSON serializable" % type(o).__name__)
+
+    def _float_str(self, o):
+        if(o != o):
+            text = 'NaN'
+        elif(o == INFINITY):
+            text = 'Infinity'
+        elif(o == -INFINITY):
+            text = '-Infinity'
+        else:
+            return(float.__repr__(o))
+
+        if(not self.allow_nan):
+            raise ValueError("Out of range float values are not JSON compliant: %r" % o)
+        return(text)
+
+    def _key_str(self, k):
+        if(isinstance(k, str)):
+            pass
+        elif(isinstance(k, float)):
+            k = self._float_str(k)
+        elif(k is True):
+            k = 'true'
+        elif(k is False):
+            k = 'false'
+        elif(k is None):
+            k = 'null'
+        elif(isinstance(k, int)):
+            k = int.__repr__(k)
+        else:
+            raise TypeError("keys must be str, int, float, bool or None, not %s" % type(k).__name__)
+        return(self.encode_str(k))
+
+#-------------------------------------------------------------------------------
+def iterencode(obj, **kwargs):
+    """
+    Encode EncodableClass obj to JSON, yielding the text in chunks as it is produced.
+    Accepts the same formatting options as json.dump()
+    """
+    return(JSONStreamWriter(**kwargs).iterencode(obj))
+
+#-------------------------------------------------------------------------------
+def dump(obj, fp, buffer_size=65536, **kwargs):
+    """
+    Encode EncodableClass obj as JSON directly into the file-like object fp.
+
+    Output is identical to json.dump(obj.to_dict(), fp, **kwargs), but the
+    intermediate dictionary is never built.
+    Chunks are collected until buffer_size characters are pending before
+    being written to fp.
+    """
+    buf = []
+    buf_len = 0
+    for chunk in iterencode(obj, **kwargs):
+        buf.append(chunk)
+        buf_len += len(chunk)
+        if(buf_len >= buffer_size):
+            fp.write(''.join(buf))
+            buf = []
+            buf_len = 0
+    if(buf):
+        fp.write(''.join(buf))
+
+################################################################################
+# Reader
+################################################################################
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+_NUMBER_CHARS = re.compile(r'[0-9+\-.eE]*')
+_CONSTANTS = {
+    'true': True,
+    'false': False,
+    'null': None,
+    'NaN': float('nan'),
+    'Infinity': INFINITY,
+    '-Infinity': -INFINITY,
+}
+
+# Parser events
+EV_START_MAP = '{'
+EV_END_MAP = '}'
+EV_START_ARRAY = '['
+EV_END_ARRAY = ']'
+EV_KEY = 'key'
+EV_VALUE = 'value'
+
+#-------------------------------------------------------------------------------
+class JSONTokenizer:
+    """
+    Splits JSON text read from a file-like object into tokens.
+    The file is read in chunks of chunk_size as more text is needed.
+    
+    next() returns (kind, value) tuples, where kind is one of:
+        '{', '}', '[', ']', ':', ',': Punctuation. value is None
+        'string': value is the decoded string
+        'value': value is the decoded number, boolean or None
+        'eof': End of the file was reached
+    """
+    def __init__(self, fp, chunk_size=65536):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self._decoder = None
+    
+    def _fill(self):
+        """
+        Read the next chunk of the file into the buffer.
+        Returns False if the end of the file was already reached
+        """
+        if(self.eof):
+            return(False)
+        
+        chunk = self.fp.read(self.chunk_size)
+        if(not chunk):
+            self.eof = True
+        
+        if(isinstance(chunk, bytes)):
+            if(self._decoder is None):
+                self._decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = self._decoder.decode(chunk, final=self.eof)
+        
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return(not self.eof)
+    
+    def next(self):
+        # Skip whitespace
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if(self.pos < len(self.buf)):
+                break
+            if(not self._fill()):
+                return(('eof', None))
+        
+        c = self.buf[self.pos]
+        if(c in '{}[]:,'):
+            self.pos += 1
+            return((c, None))
+        
+        if(c == '"'):
+            while True:
+                try:
+                    s, end = scanstring(self.buf, self.pos + 1, True)
+                except JSONDecodeError:
+                    # String may continue in the next chunk
+                    if(self._fill()):
+                        continue
+                    raise
+                self.pos = end
+                return(('string', s))
+        
+        # Make sure the whole number is in the buffer
+        while((_NUMBER_CHARS.match(self.buf, self.pos).end() == len(self.buf)) and self._fill()):
+            pass
+        
+        m = _NUMBER.match(self.buf, self.pos)
+        if(m is not None):
+            integer, frac, exp = m.groups()
+            self.pos = m.end()
+            if(frac or exp):
+                return(('value', float(integer + (frac or '') + (exp or ''))))
+            return(('value', int(integer)))
+        
+        # Longest constant is 9 characters
+        while((len(self.buf) - self.pos < 9) and self._fill()):
+            pass
+        for name, value in _CONSTANTS.items():
+            if(self.buf.startswith(name, self.pos)):
+                self.pos += len(name)
+                return(('value', value))
+        
+        raise JSONDecodeError("Expecting value", self.buf, self.pos)
+
+#-------------------------------------------------------------------------------
+_ST_VALUE = 0
+_ST_FIRST_ITEM = 1
+_ST_KEY = 2
+_ST_FIRST_KEY = 3
+_ST_AFTER_VALUE = 4
+
+def iter_events(tokenizer):
+    """
+    Yields (event, value) parser events for one JSON value read from tokenizer.
+        EV_START_MAP, EV_END_MAP, EV_START_ARRAY, EV_END_ARRAY: value is None
+        EV_KEY: value is the key string of the map item that follows
+        EV_VALUE: value is a string, number, boolean or None
+    """
+    stack = []
+    state = _ST_VALUE
+    while True:
+        if((state == _ST_AFTER_VALUE) and (not stack)):
+            # Got one complete value
+            return
+        
+        kind, value = tokenizer.next()
+        
+        if((state == _ST_VALUE) or (state == _ST_FIRST_ITEM)):
+            if((state == _ST_FIRST_ITEM) and (kind == ']')):
+                stack.pop()
+                yield((EV_END_ARRAY, None))
+                state = _ST_AFTER_VALUE
+            elif(kind == '{'):
+                stack.append('{')
+                yield((EV_START_MAP, None))
+                state = _ST_FIRST_KEY
+            elif(kind == '['):
+                stack.append('[')
+                yield((EV_START_ARRAY, None))
+                state = _ST_FIRST_ITEM
+            elif((kind == 'string') or (kind == 'value')):
+                yield((EV_VALUE, value))
+                state = _ST_AFTER_VALUE
+            else:
+                raise JSONDecodeError("Expecting value", tokenizer.buf, tokenizer.pos)
+        
+        elif((state == _ST_KEY) or (state == _ST_FIRST_KEY)):
+            if((state == _ST_FIRST_KEY) and (kind == '}')):
+                stack.pop()
+                yield((EV_END_MAP, None))
+                state = _ST_AFTER_VALUE
+            elif(kind == 'string'):
+                yield((EV_KEY, value))
+                if(tokenizer.next()[0] != ':'):
+                    raise JSONDecodeError("Expecting ':' delimiter", tokenizer.buf, tokenizer.pos)
+                state = _ST_VALUE
+            else:
+                raise JSONDecodeError("Expecting property name enclosed in double quotes",
+                    tokenizer.buf, tokenizer.pos)
+        
+        else:
+            if(kind == ','):
+                if(stack[-1] == '{'):
+                    state = _ST_KEY
+                else:
+                    state = _ST_VALUE
+            elif((kind == '}') and (stack[-1] == '{')):
+                stack.pop()
+                yield((EV_END_MAP, None))
+            elif((kind == ']') and (stack[-1] == '[')):
+                stack.pop()
+                yield((EV_END_ARRAY, None))
+            else:
+                raise JSONDecodeError("Expecting ',' delimiter", tokenizer.buf, tokenizer.pos)
+
+def iter_value_events(value):
+    """
+    Yields the parser events of an already-parsed value
+    """
+    if(type(value) == dict):
+        yield((EV_START_MAP, None))
+        for k, v in value.items():
+            yield((EV_KEY, k))
+            yield from iter_value_events(v)
+        yield((EV_END_MAP, None))
+    elif(type(value) == list):
+        yield((EV_START_ARRAY, None))
+        for v in value:
+            yield from iter_value_events(v)
+        yield((EV_END_ARRAY, None))
+    else:
+        yield((EV_VALUE, value))
+
+#-------------------------------------------------------------------------------
+class JSONStreamReader:
+    """
+    Decodes EncodableClass objects from JSON text that is read incrementally
+    from the file-like object fp.
+    
+    Objects are built as soon as their part of the text is parsed.
+    References to objects that appear later in the document are filled in as
+    soon as the referenced object is decoded.
+    
+    validation selects how thoroughly values are checked against the
+    templates. (See VALIDATION_LEVELS)
+    
+    intern is an optional InternTable that decoded values are interned with.
+    """
+    def __init__(self, fp, chunk_size=65536, validation="full", intern=None):
+        self.tokenizer = JSONTokenizer(fp, chunk_size)
+        
+        if(validation not in VALIDATION_LEVELS):
+            raise ValueError("Unknown validation level '%s'. Expected one of %s"
+                % (validation, ", ".join(VALIDATION_LEVELS)))
+        
+        # TemplateNode attribute of the decoder for the validation level
+        self._decoder_attr = {
+            "full": "decode",
+            "sampled": "decode_sampled",
+            "trusted": "decode_trusted",
+        }[validation]
+        
+        self.intern = intern
+        
+        # DecodeContext of the current decode
+        self.ctx = None
+        
+        # Root object of the document once decoded
+        self.root = None
+    
+    def load(self, cls):
+        """
+        Decode the document as an object of EncodableClass cls
+        """
+        self.ctx = DecodeContext(intern = self.intern)
+        events = iter_events(self.tokenizer)
+        self._expect_root(cls, events)
+        
+        gen = self._iter_object(cls, events, None, True, None)
+        self.root = self._run(gen)
+        self._finish()
+        return(self.root)
+    
+    def iter_items(self, cls, key, retain=True):
+        """
+        Decode the document as an object of EncodableClass cls, yielding the
+        elements of its list member key one at a time as they are decoded,
+        rather than storing them in the list.
+        
+        Once done, self.root is the root object, with an empty list for key.
+        
+        Elements that are themselves references to objects later in the
+        document are yielded at the end, once the document is fully decoded.
+        
+        If retain is False, decoded objects are only weakly held by the decoder
+        so that elements can be freed once the caller is done with them. In
+        that case, the document must not reference objects inside an element
+        that has already been discarded.
+        """
+        node = get_class_plan(cls).node_map.get(key)
+        if((node is None) or (node.kind != TemplateNode.LIST)):
+            raise ValueError("'%s' is not a list member of '%s'" % (key, cls.__name__))
+        
+        self.ctx = DecodeContext(weak = not retain, intern = self.intern)
+        self._late_items = []
+        events = iter_events(self.tokenizer)
+        self._expect_root(cls, events)
+        
+        self.root = yield from self._iter_object(cls, events, None, True, key)
+        self._finish()
+        
+        late_items = self._late_items
+        self._late_items = None
+        yield from late_items
+    
+    #---------------------------------------------------------------------------
+    def _expect_root(self, cls, events):
+        if(next(events)[0] != EV_START_MAP):
+            raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+    
+    def _finish(self):
+        if(self.tokenizer.next()[0] != 'eof'):
+            raise JSONDecodeError("Extra data", self.tokenizer.buf, self.tokenizer.pos)
+        self.ctx.check_resolved()
+    
+    def _run(self, gen):
+        """
+        Run an _iter_object() generator that has nothing to yield.
+        Returns the decoded object
+        """
+        try:
+            next(gen)
+        except StopIteration as e:
+            return(e.value)
+        raise RuntimeError("Unexpected item yielded")
+    
+    def _read_raw(self, events, first):
+        """
+        Read a complete value, starting with the event first, as primitive data
+        """
+        event, value = first
+        if(event == EV_VALUE):
+            return(value)
+        elif(event == EV_START_ARRAY):
+            result = []
+            while True:
+                item = next(events)
+                if(item[0] == EV_END_ARRAY):
+                    return(result)
+                result.append(self._read_raw(events, item))
+        else:
+            result = {}
+            while True:
+                event, key = next(events)
+                if(event == EV_END_MAP):
+                    return(result)
+                result[key] = self._read_raw(events, next(events))
+    
+    def _decode(self, node, events, first):
+        """
+        Decode a complete value, starting with the event first, according to
+        the template node.
+        Returns the value, which may be a placeholder (See is_pending())
+        """
+        event, value = first
+        kind = node.kind
+        ctx = self.ctx
+        
+        if(not node.has_encodable):
+            # Nothing inside can be referenced. Decode the whole value at once,
+            # at the selected validation level
+            if(event != EV_VALUE):
+                value = self._read_raw(events, first)
+            return(getattr(node, self._decoder_attr)(value, ctx))
+        
+        elif(kind == TemplateNode.ENCODABLE):
+            if(event != EV_START_MAP):
+                # Not an object. Let the regular decoder handle None, or report the error
+                return(node.decode(self._read_raw(events, first), ctx))
+            return(self._run(self._iter_object(node.tmpl, events, node, False, None)))
+        
+        elif(kind == TemplateNode.LIST):
+            if(event != EV_START_ARRAY):
+                # Report the error
+                return(node.decode(self._read_raw(events, first), ctx))
+            
+            result = []
+            item_node = node.item
+            while True:
+                item = next(events)
+                if(item[0] == EV_END_ARRAY):
+                    return(result)
+                v = self._decode(item_node, events, item)
+                result.append(v)
+                if(is_pending(v)):
+                    ctx.defer(result, len(result)-1, v)
+        
+        elif(kind == TemplateNode.COLUMNAR):
+            # Columns can only be split into objects once all of them are read
+            return(self._decode_columnar(node, self._read_raw(events, first)))
+        
+        elif(kind == TemplateNode.TUPLE):
+            if(event != EV_START_ARRAY):
+                # Report the error
+                return(node.decode(self._read_raw(events, first), ctx))
+            
+            pt = PendingTuple()
+            n_items = len(node.items)
+            while True:
+                item = next(events)
+                if(item[0] == EV_END_ARRAY):
+                    break
+                idx = len(pt.items)
+                if(idx == n_items):
+                    # Too many items. Skip over the rest so the length can be reported
+                    self._read_raw(events, item)
+                    idx += 1
+                    while(next(events)[0] != EV_END_ARRAY):
+                        idx += 1
+                    pt.items.extend([None] * (idx - n_items))
+                    break
+                v = self._decode(node.items[idx], events, item)
+                pt.items.append(v)
+                if(is_pending(v)):
+                    ctx.defer(pt, idx, v)
+            
+            # Size of tuples must match
+            if(len(pt.items) != n_items):
+                raise ValueError("'%s', depth=%d: Tuple len(%d) does not match template len(%d)"
+                    % (node.parent_key, node.depth, len(pt.items), n_items))
+            
+            if(pt.n_pending == 0):
+                return(tuple(pt.items))
+            return(pt)
+        
+        else:
+            if(event != EV_START_MAP):
+                # Report the error
+                return(node.decode(self._read_raw(events, first), ctx))
+            
+            result = {}
+            while True:
+                event, k = next(events)
+                if(event == EV_END_MAP):
+                    return(result)
+                k = getattr(node.key, self._decoder_attr)(k, ctx)
+                v = self._decode(node.value, events, next(events))
+                result[k] = v
+                if(is_pending(v)):
+                    ctx.defer(result, k, v)
+    
+    def _decode_columnar(self, node, value):
+        """
+        Decode a columnar list, from its already-parsed value
+        """
+        ctx = self.ctx
+        cls = node.tmpl.cls
+        plan = get_class_plan(cls)
+        length, base, columns, rows, row_indexes = _columnar_unpack(
+            node.tmpl, value, plan, node.parent_key, node.depth)
+        
+        result = [None] * length
+        col_objs = []
+        for n, idx in enumerate(row_indexes):
+            obj = cls.__new__(cls)
+            ctx.add_obj(base + n, obj)
+            result[idx] = obj
+            col_objs.append(obj)
+        
+        for key, n in plan.nodes:
+            for obj, v in zip(col_objs, columns[key]):
+                if(n.has_encodable):
+                    events = iter_value_events(v)
+                    v = self._decode(n, events, next(events))
+                    if(is_pending(v)):
+                        ctx.defer(obj, key, v)
+                else:
+                    v = getattr(n, self._decoder_attr)(v, ctx)
+                setattr(obj, key, v)
+        
+        for idx, v in rows:
+            events = iter_value_events(v)
+            v = self._decode(node.item, events, next(events))
+            result[idx] = v
+            if(is_pending(v)):
+                ctx.defer(result, idx, v)
+        
+        return(result)
+    
+    def _iter_object(self, tmpl, events, node, exact, items_key):
+        """
+        Generator that decodes an object of EncodableClass tmpl. The opening
+        EV_START_MAP event has already been consumed.
+        
+        node is the TemplateNode being decoded, or None for the root object.
+        If exact is True, the object must be exactly of class tmpl.
+        If items_key is not None, elements of that list member are yielded
+        rather than stored.
+        
+        Returns the decoded object, or a Ref placeholder
+        """
+        ctx = self.ctx
+        obj = None
+        plan = None
+        classtype = None
+        ref_id = None
+        
+        # Members that came before <classtype>
+        early_members = []
+        
+        # Members that were decoded
+        seen = set()
+        
+        while True:
+            event, key = next(events)
+            if(event == EV_END_MAP):
+                break
+            
+            if(key == '<classtype>'):
+                classtype = self._read_raw(events, next(events))
+                if(classtype == '<ref>'):
+                    continue
+                
+                plan, obj = self._new_object(tmpl, classtype, node, exact)
+                if(ref_id is not None):
+                    ctx.add_obj(ref_id, obj)
+                for early_key, raw in early_members:
+                    self._decode_member(obj, plan, early_key, iter_value_events(raw), seen)
+                early_members = None
+            
+            elif(key == '<ref_id>'):
+                ref_id = self._read_raw(events, next(events))
+                if(obj is not None):
+                    # register the decoded object
+                    ctx.add_obj(ref_id, obj)
+            
+            elif(obj is None):
+                # Don't know what kind of object this is yet
+                early_members.append((key, self._read_raw(events, next(events))))
+            
+            elif(key == items_key):
+                yield from self._iter_items(obj, plan.node_map[key], events)
+                seen.add(key)
+            
+            else:
+                self._decode_member(obj, plan, key, events, seen)
+        
+        if(classtype is None):
+            if(node is None):
+                raise ValueError("Dictionary is incompatible with object '%s'" % tmpl.__name__)
+            raise TypeError("'%s', depth=%d: Dictionary incompatible with '%s'"
+                % (node.parent_key, node.depth, tmpl.__name__))
+        
+        if(ref_id is None):
+            if(node is None):
+                raise ValueError("Missing <ref_id>")
+            raise ValueError("'%s', depth=%d: Missing <ref_id>" % (node.parent_key, node.depth))
+        
+        if(classtype == '<ref>'):
+            if(node is None):
+                raise ValueError("Dictionary is incompatible with object '%s'" % tmpl.__name__)
+            
+            # This is a reference, not an actual class definition
+            return(ctx.get_ref(ref_id, tmpl))
+        
+        for key, _ in plan.nodes:
+            if(key not in seen):
+                raise KeyError(key)
+        
+        return(obj)
+    
+    def _new_object(self, tmpl, classtype, node, exact):
+        if(exact):
+            if(classtype != get_class_plan(tmpl).classid):
+                raise ValueError("Dictionary is incompatible with object '%s'" % tmpl.__name__)
+            cls = tmpl
+        else:
+            # Figure out what specific subtype of tmpl should be created.
+            cls = lookup_subtype(tmpl, classtype)
+            if(cls is None):
+                raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                    % (node.parent_key, node.depth, classtype, get_classid_str(tmpl)))
+        
+        return(get_class_plan(cls), cls.__new__(cls))
+    
+    def _decode_member(self, obj, plan, key, events, seen):
+        node = plan.node_map.get(key)
+        if(node is None):
+            # Not part of the schema. Skip it
+            self._read_raw(events, next(events))
+            return
+        
+        v = self._decode(node, events, next(events))
+        setattr(obj, key, v)
+        if(is_pending(v)):
+            self.ctx.defer(obj, key, v)
+        seen.add(key)
+    
+    def _iter_items(self, obj, node, events):
+        first = next(events)
+        if(first[0] != EV_START_ARRAY):
+            # Report the error
+            node.decode(self._read_raw(events, first), self.ctx)
+        
+        item_node = node.item
+        while True:
+            item = next(events)
+            if(item[0] == EV_END_ARRAY):
+                break
+            v = self._decode(item_node, events, item)
+            if(is_pending(v)):
+                # Can't hand out a placeholder. Hold on to it until resolved
+                self._late_items.append(v)
+                self.ctx.defer(self._late_items, len(self._late_items)-1, v)
+            else:
+                yield v
+        
+        setattr(obj, node.parent_key, [])
+
+#-------------------------------------------------------------------------------
+def load(fp, cls, chunk_size=65536, validation="full", intern=None):
+    """
+    Decode an object of EncodableClass cls from JSON text read incrementally
+    from the file-like object fp.
+    
+    Equivalent to cls.from_dict(json.load(fp), validation=validation,
+    intern=intern), but the intermediate dictionary is never built.
+    """
+    return(JSONStreamReader(fp, chunk_size, validation, intern).load(cls))
+
+#-------------------------------------------------------------------------------
+def iterload(fp, cls, key, retain=True, chunk_size=65536, validation="full"):
+    """
+    Decode an object of EncodableClass cls from JSON text read incrementally
+    from the file-like object fp, and yield the elements of its list member key
+    one at a time. See JSONStreamReader.iter_items()
+    """
+    return(JSONStreamReader(fp, chunk_size, validation).iter_items(cls, key, retain))
@@ -0,0 +1,344 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Lazy decoding
+#
+# from_dict_lazy() only creates the root object. Each object's members are
+# decoded from the dictionary the first time they are accessed, so the cost
+# of decoding is proportional to how much of the document is actually used.
+#
+# Objects inside a decoded member are created right away, but are lazy too.
+# References are resolved on demand. If the referenced object has not been
+# reached yet, the document is scanned just far enough to find its definition.
+#
+# Only objects of LazyClass subclasses can be lazy. The members of other
+# objects are decoded as soon as the object is created.
+#
+
+from ._core import EncodableClass, TemplateNode
+from ._core import get_class_plan, get_classid_str, lookup_subtype
+from ._core import _columnar_unpack, _is_mapping
+
+# Instance attribute that holds the _LazyState of an object
+# (See LazyClass.__getattr__)
+_LAZY_ATTR = '_encodable_lazy'
+
+#-------------------------------------------------------------------------------
+class LazyClass(EncodableClass):
+    """
+    EncodableClass whose objects, when decoded by from_dict_lazy(), only decode
+    their members once they are first accessed.
+    
+    Objects of other classes are decoded by from_dict_lazy() as usual.
+    """
+    __slots__ = ()
+    
+    def __getattr__(self, name):
+        # Only called if name was not found the normal way.
+        try:
+            lazy = object.__getattribute__(self, _LAZY_ATTR)
+        except AttributeError:
+            lazy = None
+        
+        if((lazy is not None) and lazy.is_pending(name)):
+            return(lazy.decode_member(self, name))
+        
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+#-------------------------------------------------------------------------------
+class _ColumnarRow:
+    """
+    Raw members of one object stored in a columnar list
+    """
+    __slots__ = ('columns', 'n')
+
+    def __init__(self, columns, n):
+        self.columns = columns
+        self.n = n
+
+    def __getitem__(self, key):
+        return(self.columns[key][self.n])
+
+#-------------------------------------------------------------------------------
+class _LazyState:
+    """
+    Members of an object that have not been decoded yet.
+    Members that are not decoded yet are the ones missing from the object's
+    __dict__
+    """
+    __slots__ = ('raw', 'plan', 'ctx', 'n_pending')
+
+    def __init__(self, raw, plan, ctx):
+        # Raw dictionary (or _ColumnarRow) the object's members are decoded from
+        self.raw = raw
+        self.plan = plan
+        self.ctx = ctx
+        self.n_pending = len(plan.nodes)
+
+    def is_pending(self, key):
+        return(key in self.plan.node_map)
+
+    def decode_member(self, obj, key):
+        value = self.ctx.decode(self.plan.node_map[key], self.raw[key])
+        setattr(obj, key, value)
+        self.n_pending -= 1
+        if(self.n_pending == 0):
+            # Fully decoded. No longer needed
+            del obj.__dict__[_LAZY_ATTR]
+        return(value)
+
+    def decode_all(self, obj):
+        for key, _ in self.plan.nodes:
+            if(key not in obj.__dict__):
+                self.decode_member(obj, key)
+        # Members that were assigned before being accessed were never decoded
+        obj.__dict__.pop(_LAZY_ATTR, None)
+
+#-------------------------------------------------------------------------------
+class LazyDecodeContext:
+    """
+    Tracks the objects of one lazily decoded document.
+    """
+    def __init__(self, root_raw):
+        # ref_id --> object
+        self.objs = {}
+
+        # Values are not interned
+        self.intern = None
+
+        # ref_id --> (raw, classid) of definitions found by the scanner, that
+        # have no object yet
+        self._found = {}
+        self._scanner = self._scan(root_raw)
+
+    @property
+    def n_objects(self):
+        """
+        Number of objects created so far
+        """
+        return(len(self.objs))
+
+    def get_obj(self, ref_id, cls, raw):
+        """
+        Returns the object for definition ref_id. It is created if needed.
+        """
+        obj = self.objs.get(ref_id)
+        if(obj is not None):
+            if(type(obj) is not cls):
+                raise ValueError("An object with the same <ref_id> : %d has already been decoded" % ref_id)
+            return(obj)
+
+        obj = cls.__new__(cls)
+        plan = get_class_plan(cls)
+        self.objs[ref_id] = obj
+        self._found.pop(ref_id, None)
+        if(plan.nodes):
+            lazy = False
+            if(isinstance(obj, LazyClass)):
+                try:
+                    obj.__dict__[_LAZY_ATTR] = _LazyState(raw, plan, self)
+                    lazy = True
+                except AttributeError:
+                    # No __dict__ (SlottedClass)
+                    pass
+            if(not lazy):
+                # Decode its members now
+                for key, node in plan.nodes:
+                    setattr(obj, key, self.decode(node, raw[key]))
+        return(obj)
+
+    def get_ref(self, ref_id, tmpl):
+        """
+        Returns the object referenced by ref_id, which must be compatible with
+        template class tmpl.
+        """
+        obj = self.objs.get(ref_id)
+        if(obj is None):
+            # Not reached yet. Find its definition
+            while(ref_id not in self._found):
+                if(next(self._scanner, None) is None):
+                    raise ValueError("Unresolved reference to object with ref_id %d" % ref_id)
+
+            raw, classid = self._found[ref_id]
+            cls = lookup_subtype(tmpl, classid)
+            if(cls is None):
+                raise TypeError("Referenced type '%s' is incompatible with '%s'"
+                    % (classid, get_classid_str(tmpl)))
+            return(self.get_obj(ref_id, cls, raw))
+
+        if(not isinstance(obj, tmpl)):
+            raise TypeError("Referenced type '%s' is incompatible with '%s'"
+                % (get_classid_str(type(obj)), get_classid_str(tmpl)))
+        return(obj)
+
+    def _scan(self, root_raw):
+        """
+        Generator that walks the raw document, and records the object
+        definitions it finds. Yields once per definition.
+        """
+        stack = [root_raw]
+        while(stack):
+            value = stack.pop()
+            if(_is_mapping(value)):
+                if('<columnar>' in value):
+                    n_rows = value['<length>'] - len(value['<rows>'])
+                    for n in range(n_rows):
+                        ref_id = value['<ref_id>'] + n
+                        if(ref_id not in self.objs):
+                            self._found[ref_id] = (_ColumnarRow(value['<columns>'], n), value['<columnar>'])
+                        yield(ref_id)
+                elif(('<classtype>' in value) and (value['<classtype>'] != '<ref>')):
+                    ref_id = value['<ref_id>']
+                    if(ref_id not in self.objs):
+                        self._found[ref_id] = (value, value['<classtype>'])
+                    yield(ref_id)
+                stack.extend(reversed(list(value.values())))
+            elif(type(value) == list):
+                stack.extend(reversed(value))
+
+    #---------------------------------------------------------------------------
+    def decode(self, node, value):
+        """
+        Decode a value according to a template node. Objects in it are created
+        without decoding their members.
+        """
+        if(not node.has_encodable):
+            return(node.decode(value, self))
+
+        kind = node.kind
+        if(kind == TemplateNode.ENCODABLE):
+            if(value is None):
+                return(None)
+            if((not _is_mapping(value)) or ('<classtype>' not in value) or ('<ref_id>' not in value)):
+                # Report the error
+                return(node.decode(value, {}))
+            if(value['<classtype>'] == '<ref>'):
+                return(self.get_ref(value['<ref_id>'], node.tmpl))
+
+            classid = value['<classtype>']
+            try:
+                cls = node.subtypes[classid]
+            except KeyError:
+                cls = lookup_subtype(node.tmpl, classid)
+            if(cls is None):
+                raise TypeError("'%s', depth=%d: Type '%s' is incompatible with '%s'"
+                    % (node.parent_key, node.depth, classid, get_classid_str(node.tmpl)))
+            return(self.get_obj(value['<ref_id>'], cls, value))
+
+        elif(kind == TemplateNode.LIST):
+            if(type(value) != list):
+                node.decode(value, {})
+            item = node.item
+            return([self.decode(item, v) for v in value])
+
+        elif(kind == TemplateNode.TUPLE):
+            if(((type(value) != tuple) and (type(value) != list)) or (len(value) != len(node.items))):
+                node.decode(value, {})
+            return(tuple([self.decode(n, v) for n, v in zip(node.items, value)]))
+
+        elif(kind == TemplateNode.DICT):
+            if(not _is_mapping(value)):
+                node.decode(value, {})
+            result = {}
+            for k, v in value.items():
+                result[node.key.decode(k, self)] = self.decode(node.value, v)
+            return(result)
+
+        else:
+            cls = node.tmpl.cls
+            plan = get_class_plan(cls)
+            length, base, columns, rows, row_indexes = _columnar_unpack(
+                node.tmpl, value, plan, node.parent_key, node.depth)
+
+            result = [None] * length
+            for n, idx in enumerate(row_indexes):
+                result[idx] = self.get_obj(base + n, cls, _ColumnarRow(columns, n))
+            for idx, v in rows:
+                result[idx] = self.decode(node.item, v)
+            return(result)
+
+#-------------------------------------------------------------------------------
+def from_dict_lazy(cls, D):
+    """
+    Same as cls.from_dict(D), except that members of each LazyClass object are
+    only decoded once they are accessed. D is not modified, and must not be
+    modified while any object is still not fully decoded.
+    """
+    plan = get_class_plan(cls)
+    if(('<classtype>' not in D) or (D['<classtype>'] != plan.classid)):
+        raise ValueError("Dictionary is incompatible with object '%s'" % cls.__name__)
+
+    if('<ref_id>' not in D):
+        raise ValueError("Missing <ref_id>")
+
+    ctx = LazyDecodeContext(D)
+    return(ctx.get_obj(D['<ref_id>'], cls, D))
+
+#-------------------------------------------------------------------------------
+def is_lazy(obj):
+    """
+    Returns True if obj has members that are not decoded yet
+    """
+    return(_LAZY_ATTR in getattr(obj, '__dict__', {}))
+
+#-------------------------------------------------------------------------------
+def materialize(obj):
+    """
+    Decode all remaining members of obj, and of every object reachable from it
+    """
+    stack = [obj]
+    seen = set()
+    while(stack):
+        o = stack.pop()
+        if(id(o) in seen):
+            continue
+        seen.add(id(o))
+
+        state = getattr(o, '__dict__', {}).get(_LAZY_ATTR)
+        if(state is not None):
+            state.decode_all(o)
+
+        for key, node in get_class_plan(type(o)).nodes:
+            if(node.has_encodable):
+                _push_objects(node, getattr(o, key), stack)
+
+def _push_objects(node, value, stack):
+    """
+    Push all objects within value, described by node, onto stack
+    """
+    if(value is None):
+        return
+    kind = node.kind
+    if(kind == TemplateNode.ENCODABLE):
+        stack.append(value)
+    elif((kind == TemplateNode.LIST) or (kind == TemplateNode.COLUMNAR)):
+        if(node.item.has_encodable):
+            for v in value:
+                _push_objects(node.item, v, stack)
+    elif(kind == TemplateNode.TUPLE):
+        for n, v in zip(node.items, value):
+            if(n.has_encodable):
+                _push_objects(n, v, stack)
+    elif(kind == TemplateNode.DICT):
+        if(node.value.has_encodable):
+            for v in value.values():
+                _push_objects(node.value, v, stack)
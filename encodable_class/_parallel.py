@@ -0,0 +1,291 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Parallel encoding
+#
+# to_dict_parallel() splits large list and dict members of the root object into
+# chunks, and encodes them in a process pool. The result is identical to
+# to_dict().
+#
+# to_dict() numbers objects in the order it first reaches them, so all objects
+# that are first reached within a chunk get a contiguous range of <ref_id>s.
+# The work is done in two rounds by workers that are forked from the calling
+# process, and therefore already have all the objects:
+#   1. Each worker lists the objects reachable from its chunk, in the order
+#      to_dict() would reach them. The lists are merged in chunk order, which
+#      numbers every object exactly like to_dict() does.
+#   2. Each worker encodes its chunk, given the numbers of the objects in it.
+#      Objects numbered before the chunk's range are encoded as references.
+#
+# Objects are identified across processes by id(). Forked workers have an
+# identical copy of the parent's memory, so these match.
+#
+# Forking while other threads are running could leave locks they hold locked
+# forever in the workers, so this falls back to to_dict() if there are any.
+#
+
+import gc
+import pickle
+import threading
+import multiprocessing
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from ._core import EncodeContext, TemplateNode
+from ._core import get_class_plan
+
+#-------------------------------------------------------------------------------
+def _scan(value, node, ctx):
+    """
+    Register all objects within value, described by node, with EncodeContext
+    ctx in the same order as to_dict() first reaches them.
+    """
+    stack = [(node, value)]
+    while(stack):
+        node, value = stack.pop()
+        if(value is None):
+            continue
+        kind = node.kind
+        if(kind == TemplateNode.ENCODABLE):
+            if(ctx.get_ref_id(value) is not None):
+                continue
+            ctx.add_obj(value)
+            plan = get_class_plan(type(value))
+            if(plan.has_encodable):
+                members = [(n, getattr(value, key)) for key, n in plan.nodes if n.has_encodable]
+                stack.extend(reversed(members))
+        elif(kind == TemplateNode.LIST):
+            stack.extend((node.item, v) for v in reversed(value))
+        elif(kind == TemplateNode.TUPLE):
+            stack.extend(reversed([(n, v) for n, v in zip(node.items, value) if n.has_encodable]))
+        elif(kind == TemplateNode.DICT):
+            stack.extend((node.value, v) for v in reversed(list(value.values())))
+        elif(kind == TemplateNode.COLUMNAR):
+            # Objects stored in the columns come first, then their members
+            # column by column, then everything else.
+            cls = node.tmpl.cls
+            rows = []
+            others = []
+            for v in value:
+                if((type(v) is cls) and (ctx.get_ref_id(v) is None)):
+                    ctx.add_obj(v)
+                    rows.append(v)
+                else:
+                    others.append((node.item, v))
+            pending = []
+            for key, n in get_class_plan(cls).nodes:
+                if(n.has_encodable):
+                    pending.extend((n, getattr(row, key)) for row in rows)
+            pending.extend(others)
+            stack.extend(reversed(pending))
+
+#-------------------------------------------------------------------------------
+class _ReplayContext(EncodeContext):
+    """
+    EncodeContext that hands out <ref_id>s that were already assigned.
+    ref_ids is a dictionary of id(obj) --> <ref_id>
+    Objects are considered encoded once the encode has progressed past their
+    <ref_id>.
+    """
+    def __init__(self, ref_ids, next_ref_id):
+        EncodeContext.__init__(self)
+        self.ref_ids = ref_ids
+        self.next_ref_id = next_ref_id
+    
+    @property
+    def n_objects(self):
+        return(self.next_ref_id)
+    
+    def get_ref_id(self, obj):
+        ref_id = self.ref_ids.get(id(obj))
+        if((ref_id is not None) and (ref_id < self.next_ref_id)):
+            return(ref_id)
+        return(None)
+    
+    def add_obj(self, obj):
+        if(self.ref_ids.get(id(obj)) != self.next_ref_id):
+            raise RuntimeError("Object graph changed while being encoded")
+        self.next_ref_id += 1
+        return(self.next_ref_id - 1)
+
+#-------------------------------------------------------------------------------
+# Workers
+#-------------------------------------------------------------------------------
+# Set in each worker by _init_worker(): (root object, [(key, items), ...])
+# One entry per segment of the root's members that is scanned separately.
+_worker_state = None
+
+def _init_worker(obj, segments):
+    global _worker_state
+    _worker_state = (obj, segments)
+    
+    # Workers only read the object graph, and create nothing cyclic. Collecting
+    # would scan the whole graph repeatedly, and touch pages shared with the
+    # parent. This only affects the worker process.
+    gc.disable()
+
+def _segment_node(obj, key, items):
+    node = get_class_plan(type(obj)).node_map[key]
+    if(items is None):
+        # Entire member
+        return(node)
+    if(node.kind == TemplateNode.LIST):
+        return(node.item)
+    return(node.value)
+
+def _scan_segment(idx):
+    """
+    Returns the id() of all objects reachable from segment idx, in order
+    """
+    obj, segments = _worker_state
+    key, items = segments[idx]
+    node = _segment_node(obj, key, items)
+    
+    ctx = EncodeContext()
+    ctx.add_obj(obj)
+    if(items is None):
+        _scan(getattr(obj, key), node, ctx)
+    else:
+        if(get_class_plan(type(obj)).node_map[key].kind == TemplateNode.DICT):
+            items = [v for k, v in items]
+        for v in items:
+            _scan(v, node, ctx)
+    return(array('Q', map(id, ctx._objs[1:])))
+
+def _encode_segment(idx, base, obj_ids, ref_ids):
+    """
+    Encodes the items of segment idx. obj_ids and ref_ids are the id() and
+    <ref_id> of each object reachable from it.
+    """
+    obj, segments = _worker_state
+    key, items = segments[idx]
+    node = _segment_node(obj, key, items)
+    
+    ref_id_map = dict(zip(obj_ids, ref_ids))
+    ref_id_map[id(obj)] = 0
+    ctx = _ReplayContext(ref_id_map, base)
+    
+    enc = node.encode
+    member_node = get_class_plan(type(obj)).node_map[key]
+    if(member_node.kind == TemplateNode.DICT):
+        # Chunk of a dict's (key, value) pairs
+        key_enc = member_node.key.encode
+        result = [(key_enc(k, ctx), enc(v, ctx)) for k, v in items]
+    else:
+        result = [enc(v, ctx) for v in items]
+    # Unpickled by the caller rather than by the executor, see below
+    return(pickle.dumps((result, ctx.n_objects), pickle.HIGHEST_PROTOCOL))
+
+#-------------------------------------------------------------------------------
+def to_dict_parallel(obj, max_workers=None, chunk_size=5000):
+    """
+    Same as obj.to_dict(), but list and dict members of obj that have more than
+    chunk_size items are encoded in chunks of chunk_size items, by a pool of
+    max_workers processes.
+    
+    Workers are forked from the calling process. On platforms that cannot fork,
+    or if other threads are running, this is the same as obj.to_dict()
+    """
+    plan = get_class_plan(type(obj))
+    
+    # Split the root's members into segments
+    segments = []
+    chunked = {}
+    for key, node in plan.nodes:
+        if(not node.has_encodable):
+            continue
+        value = getattr(obj, key)
+        if((node.kind in (TemplateNode.LIST, TemplateNode.DICT))
+           and (type(value) in (list, dict)) and (len(value) > chunk_size)):
+            if(type(value) == list):
+                items = value
+            else:
+                items = list(value.items())
+            chunked[key] = []
+            for start in range(0, len(items), chunk_size):
+                chunked[key].append(len(segments))
+                segments.append((key, items[start:start+chunk_size]))
+        else:
+            segments.append((key, None))
+    
+    if((not chunked) or ('fork' not in multiprocessing.get_all_start_methods())
+       or (threading.active_count() > 1)):
+        return(obj.to_dict())
+    
+    # Fork workers do not pickle initargs. They inherit them
+    with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'),
+                             initializer=_init_worker, initargs=(obj, segments)) as executor:
+        # Round 1: number all objects
+        scans = [executor.submit(_scan_segment, idx) for idx in range(len(segments))]
+        order = {id(obj): None}
+        bounds = []
+        for future in scans:
+            obj_ids = future.result()
+            base = len(order)
+            # Objects already reached by an earlier segment keep their place
+            order.update(dict.fromkeys(obj_ids))
+            bounds.append((base, len(order), obj_ids))
+        ref_id_map = dict(zip(order, range(len(order))))
+        del order
+        
+        # Round 2: encode the chunks
+        encodes = {}
+        for key, seg_idxs in chunked.items():
+            for idx in seg_idxs:
+                base, end, obj_ids = bounds[idx]
+                ref_ids = array('Q', map(ref_id_map.__getitem__, obj_ids))
+                encodes[idx] = executor.submit(_encode_segment, idx, base, obj_ids, ref_ids)
+        
+        # Encode everything else here, the same way as to_dict()
+        ctx = _ReplayContext(ref_id_map, 0)
+        D = {}
+        D['<classtype>'] = plan.classid
+        D['<ref_id>'] = ctx.add_obj(obj)
+        seg_idx = 0
+        for key, node in plan.nodes:
+            if(key in chunked):
+                D[key] = None
+                seg_idx = chunked[key][-1] + 1
+                ctx.next_ref_id = bounds[seg_idx - 1][1]
+            elif(node.has_encodable):
+                ctx.next_ref_id = bounds[seg_idx][0]
+                D[key] = node.encode(getattr(obj, key), ctx)
+                if(ctx.n_objects != bounds[seg_idx][1]):
+                    raise RuntimeError("Object graph changed while being encoded")
+                seg_idx += 1
+            else:
+                D[key] = node.encode(getattr(obj, key), ctx)
+        
+        # Collect the chunks
+        for key, seg_idxs in chunked.items():
+            results = []
+            for idx in seg_idxs:
+                items, n_objects = pickle.loads(encodes[idx].result())
+                if(n_objects != bounds[idx][1]):
+                    raise RuntimeError("Object graph changed while being encoded")
+                results.extend(items)
+            if(type(getattr(obj, key)) == list):
+                D[key] = results
+            else:
+                D[key] = dict(results)
+    
+    return(D)
@@ -0,0 +1,302 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Profiling of to_dict() and from_dict()
+#
+# A Profiler is active in the context (thread or task) that started it. While
+# it is, the encode/decode paths of _core hand each object to it, and it
+# decodes/encodes the members with its own wrapped copies of the plan's
+# compiled encoders/decoders, which record statistics. Nothing is patched, so
+# other threads, and encodes/decodes outside the Profiler, are unaffected.
+#
+# Statistics are kept per classid, and per schema key of each class:
+#   count       Number of calls
+#   time        Cumulative time, including objects nested inside
+#   self_time   Time excluding objects nested inside
+#   size        Approximate size, in bytes of compact JSON, of the primitive
+#               data produced (encode) or consumed (decode), not counting
+#               objects nested inside. The size of a class includes its keys.
+#
+
+import weakref
+from time import perf_counter
+
+from ._core import _active_profiler
+
+#-------------------------------------------------------------------------------
+def _primitive_size(v):
+    """
+    Approximate size of primitive data v as compact JSON, not counting
+    EncodableClass objects nested in it
+    """
+    t = type(v)
+    if(t is str):
+        return(len(v) + 2)
+    elif((t is int) or (t is float)):
+        return(len(repr(v)))
+    elif((t is list) or (t is tuple)):
+        return(sum([_primitive_size(i) for i in v]) + len(v) + 1)
+    elif(t is dict):
+        if('<classtype>' in v):
+            if(v['<classtype>'] == '<ref>'):
+                return(len('{"<classtype>":"<ref>","<ref_id>":}') + len(repr(v['<ref_id>'])))
+            # Counted by the object's own keys
+            return(0)
+        return(sum([_primitive_size(k) + _primitive_size(i) + 2 for k, i in v.items()]) + 1)
+    elif(v is None):
+        return(4)
+    elif(t is bool):
+        return(5 if v else 4)
+    return(len(repr(v)))
+
+def _envelope_size(D):
+    """
+    Size of the <classtype> and <ref_id> entries of an object's dictionary,
+    unless it is a reference (counted by the member that holds it)
+    """
+    classtype = D.get('<classtype>')
+    if((classtype is None) or (classtype == '<ref>')):
+        return(0)
+    return(len('{"<classtype>":"","<ref_id>":}') + len(classtype) + len(repr(D.get('<ref_id>'))))
+
+class _Stats:
+    __slots__ = ('count', 'time', 'self_time', 'size', 'key_size')
+    
+    def __init__(self, key=None):
+        self.count = 0
+        self.time = 0.0
+        self.self_time = 0.0
+        self.size = 0
+        
+        # Size of '"key":' plus a separator
+        if(key is None):
+            self.key_size = 0
+        else:
+            self.key_size = len(key) + 4
+    
+    def as_dict(self):
+        return({
+            "count" : self.count,
+            "time" : self.time,
+            "self_time" : self.self_time,
+            "size" : self.size,
+        })
+
+class _ClassStats(_Stats):
+    __slots__ = ('keys',)
+    
+    def __init__(self):
+        _Stats.__init__(self)
+        # key --> _Stats
+        self.keys = {}
+    
+    def as_dict(self):
+        d = _Stats.as_dict(self)
+        d["keys"] = dict((key, s.as_dict()) for key, s in self.keys.items())
+        return(d)
+
+#-------------------------------------------------------------------------------
+class Profiler:
+    """
+    Records where the time of to_dict() and from_dict() goes, per class and
+    per schema key.
+    
+        with Profiler() as prof:
+            D = obj.to_dict()
+        print(prof.format_report())
+    
+    If measure_size is False, the size of the primitive data is not measured,
+    which makes profiling a lot less intrusive.
+    
+    Only encodes/decodes run in the context that started the Profiler are
+    recorded, and only one Profiler can be active in a context at a time.
+    It covers to_dict() and from_dict() at all validation levels, not the
+    other codecs.
+    """
+    def __init__(self, measure_size=True):
+        self.measure_size = measure_size
+        
+        # "encode"/"decode" --> {classid : _ClassStats}
+        self.stats = {"encode" : {}, "decode" : {}}
+        
+        # Accumulated time of objects nested in each object being timed
+        self._stack = [0.0]
+        
+        # plan --> {attribute : [(key, wrapped encoder/decoder), ...]}
+        self._members = weakref.WeakKeyDictionary()
+        self._token = None
+    
+    #---------------------------------------------------------------------------
+    def start(self):
+        if(_active_profiler.get() is not None):
+            raise RuntimeError("Another Profiler is already active")
+        self._token = _active_profiler.set(self)
+    
+    def stop(self):
+        if(_active_profiler.get() is not self):
+            return
+        _active_profiler.reset(self._token)
+        self._token = None
+    
+    def __enter__(self):
+        self.start()
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+    
+    #---------------------------------------------------------------------------
+    def report(self):
+        """
+        Returns the statistics as:
+            {
+                "encode" : {classid : {"count", "time", "self_time", "size",
+                                       "keys" : {key : {"count", "time",
+                                                        "self_time", "size"}}}},
+                "decode" : (Same as "encode")
+            }
+        """
+        return(dict(
+            (direction, dict((classid, s.as_dict()) for classid, s in stats.items()))
+            for direction, stats in self.stats.items()
+        ))
+    
+    def format_report(self, limit=20):
+        """
+        Returns the report as text. For each direction, lists the limit classes
+        and keys with the most self time
+        """
+        lines = []
+        for direction, stats in self.stats.items():
+            if(not stats):
+                continue
+            rows = []
+            for classid, cs in stats.items():
+                rows.append((classid, cs))
+                for key, ks in cs.keys.items():
+                    rows.append(("%s.%s" % (classid, key), ks))
+            rows.sort(key=lambda r: r[1].self_time, reverse=True)
+            
+            lines.append("%s:" % direction)
+            lines.append("    %-50s %10s %10s %10s %12s" % ("", "count", "time", "self_time", "size"))
+            for name, s in rows[:limit]:
+                lines.append("    %-50s %10d %10.4f %10.4f %12d" % (name, s.count, s.time, s.self_time, s.size))
+        return("\n".join(lines))
+    
+    #---------------------------------------------------------------------------
+    def _get_class_stats(self, direction, classid):
+        try:
+            return(self.stats[direction][classid])
+        except KeyError:
+            s = self.stats[direction][classid] = _ClassStats()
+            return(s)
+    
+    def get_members(self, plan, attr):
+        """
+        Returns the list of (key, member encoder/decoder) attr of plan, wrapped
+        to record statistics
+        """
+        try:
+            return(self._members[plan][attr])
+        except KeyError:
+            pass
+        
+        is_encode = (attr == "encoders")
+        cs = self._get_class_stats("encode" if is_encode else "decode", plan.classid)
+        wrapped = []
+        for key, f in getattr(plan, attr):
+            ks = cs.keys.get(key)
+            if(ks is None):
+                ks = cs.keys[key] = _Stats(key)
+            wrapped.append((key, self._wrap_member(f, cs, ks, is_encode)))
+        self._members.setdefault(plan, {})[attr] = wrapped
+        return(wrapped)
+    
+    def _wrap_member(self, f, cs, ks, is_encode):
+        stack = self._stack
+        measure_size = self.measure_size
+        
+        def wrapper(value, ctx):
+            if(measure_size and not is_encode):
+                size = _primitive_size(value) + ks.key_size
+                ks.size += size
+                cs.size += size
+            nested = stack[-1]
+            t = perf_counter()
+            try:
+                result = f(value, ctx)
+            finally:
+                elapsed = perf_counter() - t
+                ks.count += 1
+                ks.time += elapsed
+                ks.self_time += elapsed - (stack[-1] - nested)
+            if(measure_size and is_encode):
+                size = _primitive_size(result) + ks.key_size
+                ks.size += size
+                cs.size += size
+            return(result)
+        return(wrapper)
+    
+    def _time_obj(self, direction, plan, D, call):
+        """
+        Time call(), which encodes/decodes the members of an object of plan.
+        D is the object's dictionary
+        """
+        cs = self._get_class_stats(direction, plan.classid)
+        if(self.measure_size and (direction == "decode")):
+            cs.size += _envelope_size(D)
+        
+        stack = self._stack
+        stack.append(0.0)
+        t = perf_counter()
+        try:
+            call()
+        finally:
+            elapsed = perf_counter() - t
+            nested = stack.pop()
+            stack[-1] += elapsed
+            cs.count += 1
+            cs.time += elapsed
+            cs.self_time += elapsed - nested
+        if(self.measure_size and (direction == "encode")):
+            cs.size += _envelope_size(D)
+    
+    def encode_members(self, obj, plan, D, ctx):
+        """
+        Called by to_dict() to encode the members of obj into D
+        """
+        encoders = self.get_members(plan, "encoders")
+        def call():
+            for key, enc in encoders:
+                D[key] = enc(getattr(obj, key), ctx)
+        self._time_obj("encode", plan, D, call)
+    
+    def decode_members(self, obj, plan, attr, D, ctx):
+        """
+        Called by from_dict() to decode the members of obj from D, using the
+        decoders attr of plan
+        """
+        decoders = self.get_members(plan, attr)
+        def call():
+            for key, dec in decoders:
+                setattr(obj, key, dec(D[key], ctx))
+        self._time_obj("decode", plan, D, call)
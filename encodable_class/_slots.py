@@ -0,0 +1,88 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Compact EncodableClass objects
+#
+# Each instance of a regular class carries a __dict__, which takes more memory
+# than the members themselves for small objects. Subclasses of SlottedClass
+# store their members in __slots__ instead, generated from encode_schema.
+#
+
+from ._core import EncodableClass
+
+#-------------------------------------------------------------------------------
+def _get_slots(cls):
+    """
+    Returns the set of slot names defined by cls and its bases
+    """
+    slots = set()
+    for c in cls.__mro__:
+        s = c.__dict__.get('__slots__', ())
+        if(type(s) == str):
+            s = (s,)
+        slots.update(s)
+    return(slots)
+
+class SlottedMeta(type):
+    """
+    Metaclass for SlottedClass.
+    Unless the class body defines __slots__ itself, generates __slots__ for all
+    members of the merged encode_schema that are not already provided by a base
+    class.
+    """
+    def __new__(mcls, name, bases, namespace, **kwargs):
+        if('__slots__' not in namespace):
+            schema = {}
+            for base_t in bases:
+                if(issubclass(base_t, EncodableClass)):
+                    schema.update(base_t._merge_schemas())
+            schema.update(namespace.get('encode_schema', {}))
+            
+            inherited = set()
+            for base_t in bases:
+                inherited.update(_get_slots(base_t))
+            
+            namespace['__slots__'] = tuple([key for key in schema if key not in inherited])
+        
+        return(type.__new__(mcls, name, bases, namespace, **kwargs))
+
+#-------------------------------------------------------------------------------
+class SlottedClass(EncodableClass, metaclass=SlottedMeta):
+    """
+    EncodableClass whose instances store the members of encode_schema in
+    __slots__ rather than a __dict__:
+    
+        class Point(SlottedClass):
+            encode_schema = {"x" : float, "y" : float}
+    
+    Instances have no __dict__, so they cannot hold attributes that are not in
+    encode_schema, unless a subclass lists them in its own __slots__. Since
+    the slots are fixed when the class is created, encode_schema must not be
+    changed afterwards, and members cannot have defaults as class attributes.
+    
+    All bases must also use __slots__ for instances to have no __dict__.
+    Subclassing a regular EncodableClass works, but keeps its __dict__.
+    
+    Objects decoded by from_dict_lazy() are decoded eagerly (members only)
+    since slots have no room for the lazy decode state.
+    """
+    __slots__ = ('__weakref__',)
@@ -0,0 +1,375 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Append-only store of EncodableClass records, as JSON Lines
+#
+# Each record is one independent object graph, stored as the UTF-8 JSON of its
+# to_dict() form on a line of its own. Appending a record only writes its line,
+# regardless of how many records the store holds.
+#
+#   Data:       path
+#               One line per record
+#   Index:      path + ".idx"
+#               little-endian u64 offset of each record's line, in order
+#
+# The index is only a cache to avoid scanning the data when opening the store.
+# Its entries are written after the data they point to is synced, and only
+# every index_interval records, so it can lag behind the data. The index
+# itself is only synced by flush(index=True), close() and compact(); entries
+# lost in a crash only make the next open scan more of the data. When opening,
+# the records after the last indexed one are found by scanning the tail of the
+# data. A partially written last line (from a crash during an append) is
+# discarded.
+#
+
+import os
+import sys
+import json
+from array import array
+
+from ._core import get_registered_class
+
+_SCAN_CHUNK = 1 << 20
+
+def _load_index(path):
+    """
+    Returns the offsets in index file path, or an empty array
+    """
+    offsets = array('Q')
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return(offsets)
+    
+    # Ignore a partially written entry
+    data = data[:len(data) - len(data) % offsets.itemsize]
+    offsets.frombytes(data)
+    if(sys.byteorder == 'big'):
+        offsets.byteswap()
+    return(offsets)
+
+def _index_bytes(offsets):
+    if(sys.byteorder == 'big'):
+        offsets = array('Q', offsets)
+        offsets.byteswap()
+    return(offsets.tobytes())
+
+def _scan_lines(fp, pos, offsets):
+    """
+    Append the offsets of the lines in file fp, starting at pos.
+    Returns the end of the last complete line.
+    """
+    fp.seek(pos)
+    line_start = pos
+    chunk_pos = pos
+    while(True):
+        chunk = fp.read(_SCAN_CHUNK)
+        if(not chunk):
+            break
+        i = chunk.find(b'\n')
+        while(i >= 0):
+            offsets.append(line_start)
+            line_start = chunk_pos + i + 1
+            i = chunk.find(b'\n', i + 1)
+        chunk_pos += len(chunk)
+    return(line_start)
+
+def _fsync_dir(path):
+    """
+    Make a rename within the directory of path durable, where supported
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+#-------------------------------------------------------------------------------
+class RecordStore:
+    """
+    Append-only store of EncodableClass records, in a JSON Lines file at path.
+    The file is created if it does not exist.
+    
+    Records are decoded into cls, or the registered class named by their
+    <classtype> if cls is None. Records are numbered in the order they were
+    appended, and can be read back by number.
+    
+    append() and extend() only buffer the records. They are made durable by
+    flush(), with a single fsync per call. extend() and close() flush.
+    
+        with RecordStore("events.jsonl") as store:
+            store.extend(new_events)
+            latest = store.tail(10)
+    """
+    def __init__(self, path, cls=None, index_interval=1000, validation="full"):
+        self.path = os.fspath(path)
+        self.index_path = self.path + ".idx"
+        self.cls = cls
+        self.index_interval = index_interval
+        self.validation = validation
+        
+        # Offsets of every record's line
+        self.offsets = array('Q')
+        
+        # Number of records whose lines were synced, and that are in the index
+        self._n_synced = 0
+        self._n_indexed = 0
+        
+        # End of the data, including lines that are not written out yet
+        self._size = 0
+        
+        self._fp = None
+        self._rfp = None
+        self._idx_fp = None
+        self._open()
+    
+    def __len__(self):
+        return(len(self.offsets))
+    
+    def append(self, obj):
+        """
+        Append EncodableClass obj as a new record. Returns its number.
+        The record is not durable until the next flush()
+        """
+        data = json.dumps(obj.to_dict(), separators=(',', ':')).encode('utf-8')
+        data += b'\n'
+        self._fp.write(data)
+        self.offsets.append(self._size)
+        self._size += len(data)
+        return(len(self.offsets) - 1)
+    
+    def extend(self, objs):
+        """
+        Append each EncodableClass object in objs as a record, then flush()
+        """
+        for obj in objs:
+            self.append(obj)
+        self.flush()
+    
+    def flush(self, index=False):
+        """
+        Write out and sync all appended records.
+        The index is updated once index_interval records are not in it yet, or
+        if index is True, in which case it is synced too.
+        """
+        if(self._n_synced < len(self.offsets)):
+            self._fp.flush()
+            os.fsync(self._fp.fileno())
+            self._n_synced = len(self.offsets)
+        
+        if(index or (self._n_synced - self._n_indexed >= self.index_interval)):
+            self._write_index()
+            if(index):
+                os.fsync(self._idx_fp.fileno())
+    
+    def get(self, idx):
+        """
+        Returns record number idx, decoded. Negative numbers count from the end
+        """
+        if(idx < 0):
+            idx += len(self.offsets)
+        return(self._decode(self._read(idx, idx + 1)[0]))
+    
+    def __getitem__(self, idx):
+        return(self.get(idx))
+    
+    def get_raw(self, idx):
+        """
+        Returns the to_dict() form of record number idx, without decoding it
+        """
+        if(idx < 0):
+            idx += len(self.offsets)
+        return(json.loads(self._read(idx, idx + 1)[0]))
+    
+    def tail(self, n):
+        """
+        Returns the last n records, decoded, oldest first.
+        Their lines are read with a single read.
+        """
+        n = min(n, len(self.offsets))
+        if(n <= 0):
+            return([])
+        lines = self._read(len(self.offsets) - n, len(self.offsets))
+        return([self._decode(line) for line in lines])
+    
+    def __iter__(self):
+        for idx in range(len(self.offsets)):
+            yield self.get(idx)
+    
+    def compact(self, keep=None, start=0):
+        """
+        Rewrite the store without records before number start, and without the
+        ones for which keep(obj) returns False, if keep is given.
+        Returns the number of records that were removed.
+        
+        The new data is written to a temporary file, synced, then renamed over
+        the old one, so that a crash leaves either the old or the new store.
+        """
+        self.flush()
+        
+        tmp_path = self.path + ".tmp"
+        offsets = array('Q')
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for idx in range(max(start, 0), len(self.offsets)):
+                line = self._read(idx, idx + 1)[0]
+                if((keep is not None) and (not keep(self._decode(line)))):
+                    continue
+                f.write(line)
+                offsets.append(size)
+                size += len(line)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        n_removed = len(self.offsets) - len(offsets)
+        self._close_files()
+        
+        # The old index must not be used with the new data, even if the rename
+        # below does not survive a crash
+        try:
+            os.remove(self.index_path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, self.path)
+        _fsync_dir(self.path)
+        
+        with open(self.index_path, 'wb') as f:
+            f.write(_index_bytes(offsets))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._open()
+        return(n_removed)
+    
+    def close(self):
+        """
+        Flush, update and sync the index, and close the store
+        """
+        if(self._fp is None):
+            return
+        self.flush(index=True)
+        self._close_files()
+    
+    def __enter__(self):
+        return(self)
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    #---------------------------------------------------------------------------
+    def _open(self):
+        self._fp = open(self.path, 'ab')
+        self._rfp = open(self.path, 'rb')
+        size = os.fstat(self._rfp.fileno()).st_size
+        
+        # Keep the indexed records that are consistent with the data
+        offsets = _load_index(self.index_path)
+        n_entries = len(offsets)
+        n = 0
+        prev = -1
+        for offset in offsets:
+            if((offset <= prev) or (offset >= size)):
+                break
+            prev = offset
+            n += 1
+        del offsets[n:]
+        if(n and (offsets[-1] != 0)):
+            # The last indexed record must start a line
+            self._rfp.seek(offsets[-1] - 1)
+            if(self._rfp.read(1) != b'\n'):
+                del offsets[:]
+        
+        # Scan the tail from the last indexed record, which is re-scanned
+        scan_pos = offsets.pop() if offsets else 0
+        n_indexed = len(offsets)
+        end = _scan_lines(self._rfp, scan_pos, offsets)
+        if(end < size):
+            # Partially written last record
+            self._fp.truncate(end)
+            os.fsync(self._fp.fileno())
+        
+        self.offsets = offsets
+        self._size = end
+        self._n_synced = len(offsets)
+        
+        if(n_indexed < n_entries):
+            # Drop the index entries that did not match the data
+            with open(self.index_path, 'wb') as f:
+                f.write(_index_bytes(offsets[:n_indexed]))
+        self._idx_fp = open(self.index_path, 'ab')
+        self._n_indexed = n_indexed
+    
+    def _close_files(self):
+        for f in (self._fp, self._rfp, self._idx_fp):
+            if(f is not None):
+                f.close()
+        self._fp = None
+        self._rfp = None
+        self._idx_fp = None
+    
+    def _write_index(self):
+        if(self._n_indexed < self._n_synced):
+            self._idx_fp.write(_index_bytes(self.offsets[self._n_indexed:self._n_synced]))
+            self._idx_fp.flush()
+            self._n_indexed = self._n_synced
+    
+    def _read(self, start, stop):
+        """
+        Returns the lines of records start to stop-1, with a single read.
+        Record numbers must not be negative
+        """
+        n = len(self.offsets)
+        if((start < 0) or (stop > n) or (start >= stop)):
+            raise IndexError("Store has no record number %d" % start)
+        
+        if(self._n_synced < n):
+            # Make buffered records readable
+            self._fp.flush()
+        
+        begin = self.offsets[start]
+        end = self.offsets[stop] if (stop < n) else self._size
+        self._rfp.seek(begin)
+        data = self._rfp.read(end - begin)
+        if(len(data) != end - begin):
+            raise ValueError("Store file '%s' was truncated" % self.path)
+        
+        lines = []
+        for idx in range(start, stop):
+            pos = self.offsets[idx] - begin
+            next_pos = (self.offsets[idx + 1] - begin) if (idx + 1 < n) else len(data)
+            lines.append(data[pos:next_pos])
+        return(lines)
+    
+    def _decode(self, line):
+        D = json.loads(line)
+        cls = self.cls
+        if(cls is None):
+            cls = get_registered_class(D.get('<classtype>'))
+            if(cls is None):
+                raise TypeError("Unknown class '%s'" % D.get('<classtype>'))
+        return(cls.from_dict(D, validation=self.validation))
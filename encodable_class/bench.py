@@ -0,0 +1,399 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Benchmarks
+#
+# Run with:
+#   python -m encodable_class.bench [--size N] [--depth D] [--save baseline.json]
+#   python -m encodable_class.bench --compare baseline.json
+#
+# Each benchmark builds a synthetic object graph with one of the generators
+# below, and measures:
+#   to_dict_s       Time of obj.to_dict()
+#   from_dict_s     Time of cls.from_dict(D)
+#   from_dict_iterative_s
+#                   Time of from_dict_iterative(cls, D)
+#   json_s          Time of a full JSON round-trip:
+#                       cls.from_dict(json.loads(json.dumps(obj.to_dict())))
+#   peak_mb         Peak memory allocated during the JSON round-trip
+#   clone_s         Time of clone(obj)
+# Times are the best of --repeat runs. For every metric, lower is better.
+#
+# Results can be saved as a JSON baseline. In compare mode, results that are
+# worse than the baseline by more than --threshold are reported as regressions,
+# and the exit status is 1.
+#
+
+import gc
+import sys
+import json
+import time
+import random
+import datetime
+import platform
+import argparse
+import tracemalloc
+from array import array
+
+from ._core import EncodableClass, ForeignObjectCodec
+from ._slots import SlottedClass
+from ._buffers import BytesCodec, ArrayCodec
+from ._clone import clone
+from ._iterative import from_dict_iterative
+
+#-------------------------------------------------------------------------------
+# Graph classes
+#-------------------------------------------------------------------------------
+class BenchNode(EncodableClass):
+    def __init__(self, name="", value=0.0):
+        self.name = name
+        self.value = value
+        self.children = []
+        self.link = None
+
+# The schema refers to the class itself, so it is set once the class exists
+BenchNode.encode_schema = {
+    "name" : str,
+    "value" : float,
+    "children" : [BenchNode],
+    "link" : BenchNode,
+}
+
+class BenchGraph(EncodableClass):
+    encode_schema = {"roots" : [BenchNode]}
+    
+    def __init__(self):
+        self.roots = []
+
+class DateTimeCodec(ForeignObjectCodec):
+    obj_type = datetime.datetime
+    intern_results = True
+    
+    @classmethod
+    def encode(cls, obj):
+        return(obj.isoformat())
+    
+    @classmethod
+    def decode(cls, d):
+        return(datetime.datetime.fromisoformat(d))
+
+class BenchSample(EncodableClass):
+    encode_schema = {
+        "when" : DateTimeCodec,
+        "raw" : BytesCodec,
+        "values" : ArrayCodec,
+        "tags" : {str : str},
+    }
+
+class BenchSamples(EncodableClass):
+    encode_schema = {"samples" : [BenchSample]}
+    
+    def __init__(self):
+        self.samples = []
+
+#-------------------------------------------------------------------------------
+# Generators
+# Each returns (class, root object) of a graph with roughly n objects
+#-------------------------------------------------------------------------------
+def gen_wide(n, rng):
+    """
+    Shallow graph: Many roots, each with a few leaf children
+    """
+    g = BenchGraph()
+    for i in range(n // 5):
+        root = BenchNode("r%d" % i, rng.random())
+        for j in range(4):
+            root.children.append(BenchNode("c%d" % j, rng.random()))
+        g.roots.append(root)
+    return(BenchGraph, g)
+
+def gen_deep(n, rng, depth=100):
+    """
+    Chains of nodes, each depth levels deep
+    """
+    g = BenchGraph()
+    for i in range(max(1, n // depth)):
+        node = BenchNode("d%d" % i, rng.random())
+        g.roots.append(node)
+        for j in range(depth - 1):
+            child = BenchNode("d%d.%d" % (i, j), rng.random())
+            node.children.append(child)
+            node = child
+    return(BenchGraph, g)
+
+def gen_shared(n, rng):
+    """
+    Every node links to one of a small pool of shared nodes, so that most
+    objects are encoded as references
+    """
+    g = BenchGraph()
+    pool = [BenchNode("s%d" % i, rng.random()) for i in range(max(1, n // 100))]
+    g.roots.extend(pool)
+    for i in range(n - len(pool)):
+        node = BenchNode("n%d" % i, rng.random())
+        node.link = rng.choice(pool)
+        node.children.append(rng.choice(pool))
+        g.roots.append(node)
+    return(BenchGraph, g)
+
+def gen_cyclic(n, rng, ring_size=50):
+    """
+    Rings of nodes, where each node links to the next, and the last back to
+    the first
+    """
+    g = BenchGraph()
+    for i in range(max(1, n // ring_size)):
+        ring = [BenchNode("c%d.%d" % (i, j), rng.random()) for j in range(ring_size)]
+        for a, b in zip(ring, ring[1:] + ring[:1]):
+            a.link = b
+        g.roots.append(ring[0])
+    return(BenchGraph, g)
+
+def gen_codec(n, rng):
+    """
+    Objects whose members are encoded by ForeignObjectCodecs
+    """
+    g = BenchSamples()
+    t0 = datetime.datetime(2020, 1, 1)
+    for i in range(n):
+        s = BenchSample()
+        s.when = t0 + datetime.timedelta(minutes=rng.randrange(1000))
+        s.raw = bytes(rng.getrandbits(8) for _ in range(16))
+        s.values = array('d', [rng.random() for _ in range(8)])
+        s.tags = {"kind" : rng.choice(("a", "b", "c")), "src" : "bench"}
+        g.samples.append(s)
+    return(BenchSamples, g)
+
+GENERATORS = {
+    "wide" : gen_wide,
+    "deep" : gen_deep,
+    "shared" : gen_shared,
+    "cyclic" : gen_cyclic,
+    "codec" : gen_codec,
+}
+
+#-------------------------------------------------------------------------------
+# Measurements
+#-------------------------------------------------------------------------------
+def _best_time(f, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        f()
+        t = time.perf_counter() - t
+        if((best is None) or (t < best)):
+            best = t
+    return(best)
+
+def _json_round_trip(cls, obj):
+    return(cls.from_dict(json.loads(json.dumps(obj.to_dict()))))
+
+def _peak_memory(f):
+    """
+    Returns the peak memory allocated while running f(), in MB
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        f()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return(peak / 1e6)
+
+def run_benchmark(name, size, repeat=5, seed=1, depth=100):
+    """
+    Run the benchmark of generator name, on a graph of roughly size objects
+    depth is the length of the chains of the "deep" benchmark.
+    Returns {metric : value}
+    """
+    rng = random.Random(seed)
+    if(name == "deep"):
+        cls, obj = gen_deep(size, rng, depth)
+    else:
+        cls, obj = GENERATORS[name](size, rng)
+    
+    D = json.loads(json.dumps(obj.to_dict()))
+    
+    return({
+        "to_dict_s" : _best_time(obj.to_dict, repeat),
+        "from_dict_s" : _best_time(lambda: cls.from_dict(D), repeat),
+        "from_dict_iterative_s" : _best_time(lambda: from_dict_iterative(cls, D), repeat),
+        "json_s" : _best_time(lambda: _json_round_trip(cls, obj), repeat),
+        "peak_mb" : _peak_memory(lambda: _json_round_trip(cls, obj)),
+        "clone_s" : _best_time(lambda: clone(obj), repeat),
+    })
+
+#-------------------------------------------------------------------------------
+# Memory use of slotted vs. regular objects
+#-------------------------------------------------------------------------------
+_RECORD_SCHEMA = {"t" : int, "v" : float, "tag" : str, "ok" : bool}
+
+class DictRecord(EncodableClass):
+    encode_schema = _RECORD_SCHEMA
+
+class SlottedRecord(SlottedClass):
+    encode_schema = _RECORD_SCHEMA
+
+class DictLog(EncodableClass):
+    encode_schema = {"records" : [DictRecord]}
+
+class SlottedLog(SlottedClass):
+    encode_schema = {"records" : [SlottedRecord]}
+
+def _make_log(log_cls, record_cls, n):
+    log = log_cls()
+    log.records = []
+    for i in range(n):
+        r = record_cls()
+        r.t = i
+        r.v = i * 0.5
+        r.tag = "r%d" % i
+        r.ok = bool(i & 1)
+        log.records.append(r)
+    return(log)
+
+def _decoded_size(log_cls, D):
+    """
+    Returns the number of bytes allocated by decoding D as a log_cls
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        log = log_cls.from_dict(D)
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del log
+    return(size)
+
+def bench_slots_memory(n=100000):
+    """
+    Decodes n records of the same schema as regular and as slotted objects.
+    Returns {class name : bytes per decoded record}
+    """
+    results = {}
+    for log_cls, record_cls in ((DictLog, DictRecord), (SlottedLog, SlottedRecord)):
+        D = _make_log(log_cls, record_cls, n).to_dict()
+        results[record_cls.__name__] = _decoded_size(log_cls, D) / n
+    return(results)
+
+#-------------------------------------------------------------------------------
+# Baselines
+#-------------------------------------------------------------------------------
+def compare(results, baseline, threshold):
+    """
+    Compare results against baseline results.
+    Returns a list of (benchmark, metric, baseline value, new value) for each
+    metric that is worse by more than the fraction threshold
+    """
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            base = baseline.get(name, {}).get(metric)
+            if((base is not None) and (value > base * (1 + threshold))):
+                regressions.append((name, metric, base, value))
+    return(regressions)
+
+def _print_results(results, baseline=None):
+    for name, metrics in results.items():
+        print("%s:" % name)
+        for metric, value in metrics.items():
+            line = "    %-22s %12.4f" % (metric, value)
+            base = (baseline or {}).get(name, {}).get(metric)
+            if(base):
+                line += "   (%+.1f%%)" % (100.0 * (value / base - 1))
+            print(line)
+
+#-------------------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m encodable_class.bench",
+        description="Benchmarks for encodable_class"
+    )
+    parser.add_argument("--size", type=int, default=20000,
+                        help="Approximate number of objects per graph (default: %(default)s)")
+    parser.add_argument("--depth", type=int, default=100,
+                        help="Length of the chains of the 'deep' benchmark (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of runs to take the best time of (default: %(default)s)")
+    parser.add_argument("--only", default=",".join(list(GENERATORS) + ["slots"]),
+                        help="Comma-separated benchmarks to run (default: %(default)s)")
+    parser.add_argument("--save", metavar="FILE",
+                        help="Write the results to FILE as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="Compare the results against the JSON baseline FILE")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Fraction a result may be worse than the baseline before it "
+                             "is flagged as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    names = [name.strip() for name in args.only.split(",") if name.strip()]
+    for name in names:
+        if((name not in GENERATORS) and (name != "slots")):
+            parser.error("Unknown benchmark '%s'" % name)
+    if(args.depth < 1):
+        parser.error("--depth must be at least 1")
+    
+    baseline = None
+    if(args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if(baseline["size"] != args.size):
+            print("Warning: Baseline was run with --size %d" % baseline["size"])
+        if(baseline.get("depth", args.depth) != args.depth):
+            print("Warning: Baseline was run with --depth %d" % baseline["depth"])
+        baseline = baseline["results"]
+    
+    results = {}
+    for name in names:
+        if(name == "slots"):
+            results["slots"] = dict(("%s_bytes" % k, v) for k, v in bench_slots_memory(args.size).items())
+        else:
+            results[name] = run_benchmark(name, args.size, args.repeat, depth=args.depth)
+    
+    _print_results(results, baseline)
+    
+    if(args.save):
+        with open(args.save, "w") as f:
+            json.dump({
+                "size" : args.size,
+                "depth" : args.depth,
+                "python" : platform.python_version(),
+                "platform" : platform.platform(),
+                "results" : results,
+            }, f, indent=4)
+    
+    if(baseline is not None):
+        regressions = compare(results, baseline, args.threshold)
+        if(regressions):
+            print("\nRegressions (more than %.0f%% worse than baseline):" % (100 * args.threshold))
+            for name, metric, base, value in regressions:
+                print("    %s.%s: %.4f --> %.4f" % (name, metric, base, value))
+            return(1)
+        print("\nNo regressions")
+    return(0)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Object graph shared by the tests of the codecs
+#
+# Covers shared references, cycles, forward references, tuples, dicts,
+# columnar lists, codecs and None.
+#
+
+import json
+import datetime
+
+from encodable_class import EncodableClass, ForeignObjectCodec, Columnar
+
+class DatetimeCodec(ForeignObjectCodec):
+    obj_type = datetime.datetime
+    
+    @classmethod
+    def encode(cls, obj):
+        return(obj.isoformat())
+    
+    @classmethod
+    def decode(cls, d):
+        return(datetime.datetime.fromisoformat(d))
+
+class Point(EncodableClass):
+    encode_schema = {
+        "x": int,
+        "y": float,
+        "label": str
+    }
+    
+    def __init__(self, x=0, y=0.0, label=""):
+        self.x = x
+        self.y = y
+        self.label = label
+
+class Node(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "flag": bool,
+        "children": [EncodableClass],
+        "parent": EncodableClass,
+        "pair": (int, EncodableClass),
+        "by_name": {str: EncodableClass},
+        "when": DatetimeCodec
+    }
+    
+    def __init__(self, name="", parent=None):
+        self.name = name
+        self.flag = False
+        self.children = []
+        self.parent = parent
+        self.pair = (0, None)
+        self.by_name = {}
+        self.when = datetime.datetime(2020, 1, 2, 3, 4, 5)
+        if(parent is not None):
+            parent.children.append(self)
+            parent.by_name[name] = self
+
+class SubNode(Node):
+    encode_schema = {
+        "weight": float
+    }
+    
+    def __init__(self, name="", parent=None):
+        Node.__init__(self, name, parent)
+        self.weight = 1.5
+
+class Model(EncodableClass):
+    encode_schema = {
+        "title": str,
+        "root": Node,
+        "items": [EncodableClass],
+        "points": Columnar(Point),
+        "tags": {str: [int]}
+    }
+    
+    def __init__(self):
+        self.title = ""
+        self.root = None
+        self.items = []
+        self.points = []
+        self.tags = {}
+
+def make_model(n=10):
+    model = Model()
+    model.title = "model"
+    
+    root = Node("root")
+    model.root = root
+    for i in range(n):
+        if(i % 3):
+            node = Node("n%d" % i, root)
+        else:
+            node = SubNode("n%d" % i, root)
+        node.flag = bool(i % 2)
+        Node("leaf%d" % i, node)
+    
+    # Shared references, and references back up the tree
+    for i, node in enumerate(root.children):
+        node.pair = (i, root.children[(i + 1) % n])
+    
+    # items refers to objects that are first encoded later, in points and
+    # inside the tree, and shares the points
+    model.points = [Point(i, i / 2, "p%d" % i) for i in range(n)]
+    model.items = [model.points[0], root.children[-1], None, model.points[-1]]
+    model.tags = {"even": list(range(0, n, 2)), "odd": list(range(1, n, 2))}
+    return(model)
+
+def to_json(obj):
+    return(json.dumps(obj.to_dict(), sort_keys=True))
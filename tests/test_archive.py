@@ -0,0 +1,85 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for dump_archive() and Archive
+#
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from encodable_class import dump_archive, Archive
+
+from .models import Model, make_model, to_json
+
+#-------------------------------------------------------------------------------
+class TestArchive(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "model.eca")
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_root(self):
+        model = make_model()
+        dump_archive(model, self.path)
+        with Archive(self.path) as archive:
+            self.assertEqual(to_json(archive.root), to_json(model))
+            root = archive.root.root
+            self.assertIs(root.children[0].parent, root)
+            self.assertIs(archive.root.items[0], archive.root.points[0])
+    
+    def test_partial(self):
+        model = make_model()
+        f = io.BytesIO()
+        dump_archive(model, f)
+        archive = Archive(f.getvalue())
+        self.assertGreater(len(archive), 1)
+        
+        # Records can be decoded on their own, in any order
+        points = [ref_id for ref_id in range(len(archive))
+                  if archive.get_raw(ref_id)["<classtype>"].endswith(".Point")]
+        ref_id = points[-1]
+        obj = archive.get(ref_id)
+        self.assertEqual(archive.n_objects, 1)
+        self.assertEqual(to_json(obj), to_json(model.points[obj.x]))
+        
+        # Repeated requests, and the full decode, return the same objects
+        self.assertIs(archive.get(ref_id), obj)
+        self.assertEqual(to_json(archive.root), to_json(model))
+        self.assertIs(archive.get(ref_id), obj)
+        with self.assertRaises(KeyError):
+            archive.get(10**6)
+    
+    def test_invalid(self):
+        model = make_model()
+        dump_archive(model, self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for bad in (b"", data[:-1], data[1:]):
+            with self.subTest(size=len(bad)):
+                with self.assertRaises(ValueError):
+                    Archive(bad)
@@ -0,0 +1,142 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for AutoSaver
+#
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from encodable_class import EncodableClass, AutoSaver, graph_equal
+
+class Item(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "peers": [EncodableClass]
+    }
+    
+    def __init__(self, name=""):
+        self.name = name
+        self.peers = []
+
+class Tagged(Item):
+    encode_schema = {
+        # Copied with copy.deepcopy()
+        "meta": dict
+    }
+    
+    def __init__(self, name=""):
+        Item.__init__(self, name)
+        self.meta = {"tag": name}
+
+class CountingSaver(AutoSaver):
+    # Records the number of objects of each snapshot it writes
+    def __init__(self, *args, **kwargs):
+        AutoSaver.__init__(self, *args, **kwargs)
+        self.counts = []
+    
+    def _write(self, snapshot, n_objects):
+        self.counts.append(n_objects)
+        AutoSaver._write(self, snapshot, n_objects)
+
+def make_model(n):
+    items = [Item("i%d" % i) for i in range(n)]
+    for i, item in enumerate(items):
+        item.peers = [items[(i+1) % n], items[(i+2) % n]]
+    root = Item("root")
+    root.peers = items
+    return(root)
+
+#-------------------------------------------------------------------------------
+class TestAutoSaver(unittest.TestCase):
+    
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def test_save_and_load(self):
+        model = make_model(50)
+        for compresslevel in (0, 6):
+            with self.subTest(compresslevel=compresslevel):
+                path = os.path.join(self.dir, "model%d" % compresslevel)
+                with AutoSaver(path, compresslevel=compresslevel) as saver:
+                    saver.save(model)
+                    self.assertTrue(saver.wait(10))
+                    self.assertIsNone(saver.error)
+                    self.assertTrue(graph_equal(saver.load(Item), model))
+    
+    def test_load_other_compresslevel(self):
+        model = make_model(10)
+        gz_path = os.path.join(self.dir, "model.json.gz")
+        plain_path = os.path.join(self.dir, "model.json")
+        with AutoSaver(gz_path, compresslevel=9) as saver:
+            saver.save(model)
+        with AutoSaver(plain_path, compresslevel=0) as saver:
+            saver.save(model)
+        with open(plain_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), model.to_dict())
+        
+        self.assertTrue(graph_equal(AutoSaver(gz_path, compresslevel=0).load(Item), model))
+        self.assertTrue(graph_equal(AutoSaver(plain_path, compresslevel=6).load(Item), model))
+    
+    def test_skip_unchanged(self):
+        model = make_model(20)
+        done = []
+        saver = AutoSaver(os.path.join(self.dir, "model"), on_done=done.append)
+        saver.save(model)
+        saver.wait()
+        saver.save(model)
+        saver.wait()
+        model.peers[0].name = "changed"
+        saver.save(model)
+        saver.close()
+        
+        self.assertEqual((saver.n_saved, saver.n_skipped), (2, 1))
+        self.assertFalse(saver.poll())
+        self.assertEqual(done, [None, None, None])
+        self.assertEqual(saver.load(Item).peers[0].name, "changed")
+    
+    def test_object_count(self):
+        model = make_model(5)
+        model.peers.append(Tagged("t"))
+        with CountingSaver(os.path.join(self.dir, "model")) as saver:
+            saver.save(model)
+        self.assertEqual(saver.counts, [7])
+        self.assertTrue(graph_equal(saver.load(Item), model))
+    
+    def test_error(self):
+        progress = []
+        saver = AutoSaver(os.path.join(self.dir, "missing", "model"),
+                          on_progress=lambda *p: progress.append(p))
+        saver.save(make_model(3))
+        saver.close()
+        self.assertIsInstance(saver.error, OSError)
+        self.assertEqual(saver.n_saved, 0)
+        saver.poll()
+        self.assertEqual(progress, [(0, "Failed")])
+        with self.assertRaises(ValueError):
+            saver.save(make_model(3))
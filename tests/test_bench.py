@@ -0,0 +1,110 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for the benchmark runner, at a tiny size
+#
+
+import io
+import os
+import json
+import random
+import tempfile
+import unittest
+import contextlib
+
+from encodable_class.bench import GENERATORS, gen_deep, run_benchmark, compare, main
+
+SIZE = 20
+
+def run_main(argv):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        status = main(argv)
+    return(status, out.getvalue())
+
+#-------------------------------------------------------------------------------
+class TestBench(unittest.TestCase):
+
+    def test_generators(self):
+        for name in GENERATORS:
+            with self.subTest(name=name):
+                results = run_benchmark(name, SIZE, repeat=1)
+                self.assertEqual(set(results), {
+                    "to_dict_s", "from_dict_s", "from_dict_iterative_s",
+                    "json_s", "peak_mb", "clone_s",
+                })
+                self.assertTrue(all(v >= 0 for v in results.values()))
+
+    def test_depth(self):
+        cls, g = gen_deep(SIZE, random.Random(1), depth=5)
+        self.assertEqual(len(g.roots), SIZE // 5)
+        for root in g.roots:
+            depth = 1
+            node = root
+            while(node.children):
+                node = node.children[0]
+                depth += 1
+            self.assertEqual(depth, 5)
+
+    def test_compare(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "baseline.json")
+            args = ["--size", str(SIZE), "--repeat", "1", "--depth", "5"]
+
+            status, out = run_main(args + ["--save", path])
+            self.assertEqual(status, 0)
+            with open(path) as f:
+                baseline = json.load(f)
+            self.assertEqual(baseline["depth"], 5)
+            self.assertEqual(set(baseline["results"]), set(GENERATORS) | {"slots"})
+
+            # Timings this small are noise. Only check that the comparison runs
+            status, out = run_main(args + ["--compare", path, "--threshold", "1000"])
+            self.assertEqual(status, 0)
+            self.assertIn("No regressions", out)
+            self.assertNotIn("Warning", out)
+
+            status, out = run_main(["--size", str(SIZE), "--repeat", "1", "--only", "deep",
+                                    "--compare", path, "--threshold", "1000"])
+            self.assertIn("Warning: Baseline was run with --depth 5", out)
+
+            # Any result is a regression against a baseline of zeros
+            for metrics in baseline["results"].values():
+                for metric in metrics:
+                    metrics[metric] = 0.0
+            with open(path, "w") as f:
+                json.dump(baseline, f)
+            status, out = run_main(args + ["--only", "wide", "--compare", path])
+            self.assertEqual(status, 1)
+            self.assertIn("Regressions", out)
+
+    def test_compare_results(self):
+        baseline = {"wide": {"to_dict_s": 1.0, "json_s": 1.0}}
+        results = {"wide": {"to_dict_s": 1.05, "json_s": 1.5, "clone_s": 9.0}}
+        self.assertEqual(compare(results, baseline, 0.10), [("wide", "json_s", 1.0, 1.5)])
+
+    def test_invalid_args(self):
+        for argv in (["--only", "nope"], ["--depth", "0"]):
+            with self.subTest(argv=argv):
+                with contextlib.redirect_stderr(io.StringIO()):
+                    with self.assertRaises(SystemExit):
+                        main(argv)
@@ -0,0 +1,77 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for dumpb() and loadb()
+#
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from encodable_class import dumpb, loadb
+
+from .models import Model, Node, make_model, to_json
+
+def dumpbs(obj):
+    f = io.BytesIO()
+    dumpb(obj, f)
+    return(f.getvalue())
+
+#-------------------------------------------------------------------------------
+class TestBinary(unittest.TestCase):
+    
+    def test_round_trip(self):
+        model = make_model()
+        model2 = loadb(dumpbs(model), Model)
+        self.assertEqual(to_json(model2), to_json(model))
+    
+    def test_sharing_and_cycles(self):
+        model2 = loadb(dumpbs(make_model()), Model)
+        root = model2.root
+        self.assertIs(root.children[0].parent, root)
+        self.assertIs(root.children[0].pair[1], root.children[1])
+        self.assertIs(model2.items[0], model2.points[0])
+        self.assertIs(model2.items[1], root.children[-1])
+    
+    def test_mapped(self):
+        model = make_model()
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, "model.bin")
+            with open(path, 'wb') as f:
+                dumpb(model, f, flush_size=64)
+            with open(path, 'rb') as f:
+                model2 = loadb(f, Model, mapped=True)
+            self.assertEqual(to_json(model2), to_json(model))
+        finally:
+            shutil.rmtree(d)
+    
+    def test_invalid(self):
+        data = dumpbs(make_model())
+        for bad in (b"", data + b"\x00", b"X" + data[1:]):
+            with self.subTest(size=len(bad)):
+                with self.assertRaises(ValueError):
+                    loadb(bad, Model)
+        with self.assertRaises(TypeError):
+            loadb(data, Node)
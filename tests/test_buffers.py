@@ -0,0 +1,115 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for BufferCodec and the sidecar files
+#
+
+import io
+import json
+import unittest
+from array import array
+
+from encodable_class import EncodableClass, dump, load, dumpb, loadb
+from encodable_class import BufferCodec, BytesCodec, ByteArrayCodec, MemoryViewCodec, ArrayCodec
+from encodable_class import SidecarWriter, SidecarReader
+
+class Blobs(EncodableClass):
+    encode_schema = {
+        "b": BytesCodec,
+        "ba": ByteArrayCodec,
+        "mv": MemoryViewCodec,
+        "a": ArrayCodec,
+        "arrays": [ArrayCodec]
+    }
+    
+    def __init__(self):
+        self.b = b"hello\x00"
+        self.ba = bytearray(b"xyz")
+        self.mv = memoryview(array('d', [1.5, 2.5, 3.5]))
+        self.a = array('i', range(10))
+        self.arrays = [array('d', [float(i)] * i) for i in range(4)]
+
+class Digest:
+    def __init__(self, data):
+        self.data = data
+    
+    def __bytes__(self):
+        return(self.data)
+
+class DigestCodec(BufferCodec):
+    # Uses the default to_buffer() and from_buffer()
+    obj_type = Digest
+
+class Digests(EncodableClass):
+    encode_schema = {
+        "digests": [DigestCodec],
+    }
+
+#-------------------------------------------------------------------------------
+class TestBuffers(unittest.TestCase):
+    
+    def assertBlobs(self, obj):
+        ref = Blobs()
+        self.assertEqual(obj.b, ref.b)
+        self.assertIs(type(obj.ba), bytearray)
+        self.assertEqual(obj.ba, ref.ba)
+        self.assertEqual(obj.mv.format, 'd')
+        self.assertEqual(obj.mv.tolist(), ref.mv.tolist())
+        self.assertEqual(obj.a, ref.a)
+        self.assertEqual(obj.arrays, ref.arrays)
+    
+    def test_inline(self):
+        D = json.loads(json.dumps(Blobs().to_dict()))
+        self.assertBlobs(Blobs.from_dict(D))
+    
+    def test_binary(self):
+        f = io.BytesIO()
+        dumpb(Blobs(), f)
+        self.assertBlobs(loadb(f.getvalue(), Blobs))
+    
+    def test_sidecar(self):
+        text = io.StringIO()
+        blob = io.BytesIO()
+        with SidecarWriter(blob, alignment=16) as writer:
+            dump(Blobs(), text)
+        self.assertGreater(writer.offset, 0)
+        
+        # Buffers are not stored inline
+        self.assertNotIn("aGVsbG8A", text.getvalue())
+        with SidecarReader(blob.getvalue()):
+            obj = load(io.StringIO(text.getvalue()), Blobs)
+        self.assertBlobs(obj)
+        self.assertTrue(obj.mv.readonly)
+        
+        # The sidecar is needed to decode
+        with self.assertRaises(ValueError):
+            load(io.StringIO(text.getvalue()), Blobs)
+    
+    def test_default_codec(self):
+        obj = Digests()
+        obj.digests = [Digest(b"\x01\x02"), Digest(b"")]
+        D = json.loads(json.dumps(obj.to_dict()))
+        self.assertEqual(Digests.from_dict(D).digests, [b"\x01\x02", b""])
+        
+        f = io.BytesIO()
+        dumpb(obj, f)
+        self.assertEqual(loadb(f.getvalue(), Digests).digests, [b"\x01\x02", b""])
@@ -0,0 +1,102 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for clone()
+#
+
+import unittest
+
+from encodable_class import EncodableClass, clone
+
+class Node(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "data": bytearray,
+        "extra": bytearray,
+        "children": [EncodableClass],
+        "parent": EncodableClass,
+        "pair": (int, EncodableClass),
+        "by_name": {str: EncodableClass}
+    }
+    
+    def __init__(self, name="", parent=None):
+        self.name = name
+        self.data = bytearray(name.encode('utf-8'))
+        self.extra = self.data
+        self.children = []
+        self.parent = parent
+        self.pair = (0, None)
+        self.by_name = {}
+        if(parent is not None):
+            parent.children.append(self)
+            parent.by_name[name] = self
+
+def make_tree():
+    root = Node("root")
+    a = Node("a", root)
+    b = Node("b", root)
+    Node("c", a)
+    b.pair = (1, a)
+    b.extra = a.data
+    return(root)
+
+#-------------------------------------------------------------------------------
+class TestClone(unittest.TestCase):
+    
+    def test_equal(self):
+        root = make_tree()
+        self.assertEqual(clone(root).to_dict(), root.to_dict())
+    
+    def test_shared_refs_and_cycles(self):
+        root2 = clone(make_tree())
+        a, b = root2.children
+        self.assertIs(a.parent, root2)
+        self.assertIs(root2.by_name["a"], a)
+        self.assertIs(b.pair[1], a)
+        self.assertIs(a.children[0].parent, a)
+    
+    def test_copies_are_independent(self):
+        root = make_tree()
+        root2 = clone(root)
+        self.assertIsNot(root2, root)
+        self.assertIsNot(root2.children, root.children)
+        self.assertIsNot(root2.data, root.data)
+        root2.data.extend(b"!")
+        self.assertEqual(root.data, bytearray(b"root"))
+    
+    def test_shared_mutable_primitives(self):
+        root2 = clone(make_tree())
+        a, b = root2.children
+        self.assertIs(root2.extra, root2.data)
+        self.assertIs(b.extra, a.data)
+    
+    def test_memo(self):
+        root = make_tree()
+        memo = {}
+        root2 = clone(root, memo)
+        self.assertIs(memo[id(root)], root2)
+        self.assertIs(memo[id(root.children[0])], root2.children[0])
+        
+        # Clones sharing a memo share references as a whole
+        other = clone(root.children[1], memo)
+        self.assertIs(other, root2.children[1])
+        self.assertIs(memo['<deepcopy>'][id(root.data)], root2.data)
@@ -0,0 +1,205 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for graph_equal(), graph_diff() and GraphHasher
+#
+
+import json
+import unittest
+
+from encodable_class import EncodableClass, clone
+from encodable_class import graph_equal, graph_diff, GraphHasher
+
+class Leaf(EncodableClass):
+    encode_schema = {
+        "n": int,
+    }
+    def __init__(self, n):
+        self.n = n
+
+class Root(EncodableClass):
+    encode_schema = {
+        "items": [EncodableClass],
+    }
+    def __init__(self, items):
+        self.items = items
+
+class Node(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "v": float,
+        "parent": EncodableClass,
+        "kids": [EncodableClass],
+        "d": {str: int},
+        "t": (int, EncodableClass),
+    }
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.v = 1.0
+        self.parent = parent
+        self.kids = []
+        self.d = {"a": 1, "b": 2}
+        self.t = (1, None)
+        if(parent is not None):
+            parent.kids.append(self)
+
+def make_tree():
+    r = Node("r")
+    a = Node("a", r)
+    b = Node("b", r)
+    Node("c", a)
+    a.t = (2, b)
+    return(r)
+
+def to_json(obj):
+    return(json.dumps(obj.to_dict()))
+
+class TestCompare(unittest.TestCase):
+    def assertAgree(self, a, b):
+        """
+        graph_equal() with and without a hasher matches comparing to_dict()
+        """
+        expected = (to_json(a) == to_json(b))
+        self.assertEqual(graph_equal(a, b), expected)
+        self.assertEqual(graph_equal(a, b, GraphHasher()), expected)
+        self.assertEqual(graph_diff(a, b) == [], expected)
+        
+        # Again with hashes that are already cached
+        hasher = GraphHasher()
+        hasher.hash(a)
+        hasher.hash(b)
+        self.assertEqual(graph_equal(a, b, hasher), expected)
+        return(expected)
+    
+    def test_equal_trees(self):
+        a = make_tree()
+        b = make_tree()
+        self.assertTrue(self.assertAgree(a, b))
+        self.assertTrue(self.assertAgree(a, clone(a)))
+        self.assertEqual(GraphHasher().hash(a), GraphHasher().hash(b))
+    
+    def test_sharing_differs(self):
+        s = Leaf(1)
+        a = Root([s, s])
+        b = Root([Leaf(1), Leaf(1)])
+        
+        # Hashes ignore sharing, but the result must not
+        self.assertEqual(GraphHasher().hash(a), GraphHasher().hash(b))
+        self.assertFalse(self.assertAgree(a, b))
+        self.assertEqual(graph_diff(a, b), [("items", 1)])
+    
+    def test_sharing_into_subgraph(self):
+        a = make_tree()
+        b = make_tree()
+        
+        # In b, a.t references a copy of b instead of the one in r.kids
+        copy = Node("b")
+        copy.parent = b
+        b.kids[0].t = (2, copy)
+        self.assertFalse(self.assertAgree(a, b))
+        self.assertEqual(graph_diff(a, b), [("kids", 1)])
+    
+    def test_value_differs(self):
+        a = make_tree()
+        b = make_tree()
+        b.kids[0].kids[0].name = "x"
+        self.assertFalse(self.assertAgree(a, b))
+        self.assertEqual(graph_diff(a, b), [("kids", 0, "kids", 0, "name")])
+        
+        b = make_tree()
+        b.v = 2.0
+        self.assertFalse(self.assertAgree(a, b))
+        self.assertEqual(graph_diff(a, b), [("v",)])
+        
+        b = make_tree()
+        b.kids.append(Node("z"))
+        self.assertEqual(graph_diff(a, b), [("kids",)])
+    
+    def test_first_path_reported(self):
+        # b is reached through a.t before r.kids
+        a = make_tree()
+        b = make_tree()
+        b.kids[1].name = "q"
+        self.assertEqual(graph_diff(a, b), [("kids", 0, "t", 1, "name")])
+    
+    def test_dict_order(self):
+        a = make_tree()
+        b = make_tree()
+        b.d = {"b": 2, "a": 1}
+        self.assertTrue(graph_equal(a, b))
+        self.assertTrue(graph_equal(a, b, GraphHasher()))
+        b.d["c"] = 3
+        self.assertEqual(graph_diff(a, b), [("d", "c")])
+    
+    def test_floats(self):
+        a = make_tree()
+        b = make_tree()
+        a.v = b.v = float('nan')
+        self.assertTrue(graph_equal(a, b))
+        self.assertEqual(GraphHasher().hash(a), GraphHasher().hash(b))
+        a.v = -0.0
+        b.v = 0.0
+        self.assertTrue(graph_equal(a, b))
+        self.assertEqual(GraphHasher().hash(a), GraphHasher().hash(b))
+    
+    def test_cycles(self):
+        a = make_tree()
+        b = make_tree()
+        a.kids[0].parent = a.kids[0]
+        self.assertFalse(self.assertAgree(a, b))
+        
+        a = Leaf(1)
+        b = Leaf(1)
+        self.assertTrue(self.assertAgree(Root([a, a]), Root([b, b])))
+    
+    def test_tuple_hash(self):
+        # Tuples and lists of the same items hash differently
+        class Pair(EncodableClass):
+            encode_schema = {
+                "v": object,
+            }
+        a = Pair()
+        a.v = (1, 2)
+        b = Pair()
+        b.v = [1, 2]
+        self.assertFalse(graph_equal(a, b))
+        self.assertNotEqual(GraphHasher().hash(a), GraphHasher().hash(b))
+
+    def test_forget(self):
+        a = make_tree()
+        b = make_tree()
+        hasher = GraphHasher()
+        self.assertEqual(hasher.hash(a), hasher.hash(b))
+        
+        # Forgetting the modified object also discards its ancestors' hashes
+        a.kids[0].kids[0].name = "x"
+        hasher.forget(a.kids[0].kids[0])
+        self.assertNotEqual(hasher.hash(a), hasher.hash(b))
+        self.assertEqual(hasher.hash(a), GraphHasher().hash(a))
+        self.assertFalse(graph_equal(a, b, hasher))
+        
+        a.kids[0].kids[0].name = "c"
+        hasher.forget(a.kids[0].kids[0])
+        self.assertEqual(hasher.hash(a), hasher.hash(b))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,342 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for to_dict() and from_dict()
+#
+
+import abc
+import gc
+import json
+import weakref
+import datetime
+import unittest
+
+from encodable_class import EncodableClass, ForeignObjectCodec
+from encodable_class import EncodeContext, DecodeContext, VALIDATION_LEVELS, Columnar
+from encodable_class import do_encode, do_decode, do_resolve_ref, get_class_plan
+from encodable_class import invalidate_plans, get_registered_class, get_subtype_table, lookup_subtype
+from encodable_class import _core
+
+class DatetimeCodec(ForeignObjectCodec):
+    obj_type = datetime.datetime
+    
+    @classmethod
+    def encode(cls, obj):
+        return(obj.timestamp()*1000000)
+    
+    @classmethod
+    def decode(cls, d):
+        return(datetime.datetime.fromtimestamp(d/1000000))
+
+class Bar(EncodableClass):
+    encode_schema = {
+        "x": int,
+        "D": {
+            str: str
+        },
+    }
+    def __init__(self, x):
+        self.x = x
+        self.D = {}
+
+class Foo(EncodableClass):
+    encode_schema = {
+        "a": int,
+        "items": [EncodableClass],
+        "pair": (int, EncodableClass),
+        "by_name": {str: EncodableClass},
+        "timestamp": DatetimeCodec,
+    }
+    def __init__(self, a):
+        self.a = a
+        self.items = []
+        self.pair = (0, None)
+        self.by_name = {}
+        self.timestamp = datetime.datetime(2020, 1, 2, 3, 4, 5)
+
+def make_graph():
+    foo = Foo(1)
+    foo.items.append(Bar(100))
+    b = Bar(22)
+    b.D["hello"] = "world"
+    foo.items.append(b)
+    foo.items.append(b)
+    foo2 = Foo(999)
+    foo2.items.append(b)
+    foo2.items.append(foo)
+    foo.items.append(foo2)
+    foo.items.append(foo)
+    foo.pair = (5, foo2)
+    foo.by_name["b"] = b
+    return(foo)
+
+def to_json(obj):
+    return(json.dumps(obj.to_dict(), sort_keys=True))
+
+class TestRoundTrip(unittest.TestCase):
+    def test_round_trip(self):
+        foo = make_graph()
+        D = foo.to_dict()
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                foo2 = Foo.from_dict(D, validation=validation)
+                self.assertEqual(to_json(foo2), to_json(foo))
+    
+    def test_json_round_trip(self):
+        foo = make_graph()
+        text = to_json(foo)
+        self.assertEqual(to_json(Foo.from_dict(json.loads(text))), text)
+    
+    def test_sharing_and_cycles(self):
+        foo2 = Foo.from_dict(make_graph().to_dict())
+        b = foo2.items[1]
+        self.assertIs(foo2.items[2], b)
+        self.assertIs(foo2.by_name["b"], b)
+        self.assertIs(foo2.items[4], foo2)
+        self.assertIs(foo2.items[3].items[1], foo2)
+        self.assertIs(foo2.pair[1], foo2.items[3])
+    
+    def test_input_not_modified(self):
+        D = make_graph().to_dict()
+        text = json.dumps(D, sort_keys=True)
+        Foo.from_dict(D)
+        self.assertEqual(json.dumps(D, sort_keys=True), text)
+    
+    def test_forward_reference(self):
+        # The tuple references foo2 before it is written out in items
+        foo = Foo(1)
+        foo2 = Foo(2)
+        foo.pair = (1, foo2)
+        foo.items.append(foo2)
+        D = foo.to_dict()
+        
+        # Move the full definition of foo2 after its reference
+        D["pair"], D["items"][0] = D["items"][0], D["pair"]
+        D["pair"] = [1, D["pair"]]
+        D["items"][0] = D["items"][0][1]
+        decoded = Foo.from_dict(D)
+        self.assertIs(decoded.pair[1], decoded.items[0])
+        self.assertEqual(decoded.items[0].a, 2)
+    
+    def test_wrong_class(self):
+        with self.assertRaises(ValueError):
+            Bar.from_dict(Foo(1).to_dict())
+
+class TestPlainDictContext(unittest.TestCase):
+    def test_from_dict(self):
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                objs = {}
+                foo = Foo.from_dict(make_graph().to_dict(), objs, validation=validation)
+                self.assertIs(objs[foo.to_dict()["<ref_id>"]], foo)
+                self.assertIs(foo.items[4], foo)
+                self.assertEqual(to_json(foo), to_json(make_graph()))
+    
+    def test_decode_context(self):
+        # A DecodeContext is shared with the caller, who resolves the
+        # references
+        D = make_graph().to_dict()
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                ctx = DecodeContext()
+                foo = Foo.from_dict(D, ctx, validation=validation)
+                self.assertIs(ctx[D["<ref_id>"]], foo)
+                self.assertEqual(len(ctx), 4)
+                ctx.resolve_pending()
+                ctx.check_resolved()
+                self.assertEqual(to_json(foo), to_json(make_graph()))
+    
+    def test_duplicate_ref_id(self):
+        D = make_graph().to_dict()
+        D["items"][0]["<ref_id>"] = D["<ref_id>"]
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                with self.assertRaises(ValueError):
+                    Foo.from_dict(D, validation=validation)
+    
+    def test_do_decode(self):
+        foo = Foo(1)
+        b = Bar(2)
+        foo.items = [Bar(1), b, b]
+        D = foo.to_dict()
+        objs = {}
+        items = do_decode(D["items"], [EncodableClass], "items", objs)
+        self.assertIs(items[1], items[2])
+        self.assertIs(objs[D["items"][1]["<ref_id>"]], items[1])
+        
+        # Same through a DecodeContext
+        ctx = DecodeContext()
+        items = do_decode(D["items"], [EncodableClass], "items", ctx)
+        items = do_resolve_ref([EncodableClass], items, ctx)
+        self.assertIs(items[1], items[2])
+    
+    def test_invalid_context(self):
+        with self.assertRaises(TypeError):
+            Foo.from_dict(make_graph().to_dict(), [])
+
+class TestClassPlans(unittest.TestCase):
+    def test_abc_mixin(self):
+        class Shape(EncodableClass, abc.ABC):
+            encode_schema = {
+                "n": int,
+            }
+            @abc.abstractmethod
+            def area(self):
+                pass
+        
+        class Square(Shape):
+            def area(self):
+                return(self.n * self.n)
+        
+        sq = Square()
+        sq.n = 3
+        self.assertEqual(Square.from_dict(sq.to_dict()).area(), 9)
+    
+    def test_schema_reassigned(self):
+        class Base(EncodableClass):
+            encode_schema = {
+                "a": int,
+            }
+        class Derived(Base):
+            encode_schema = {
+                "b": int,
+            }
+        
+        obj = Derived()
+        obj.a = 1
+        obj.b = 2
+        obj.c = 3
+        self.assertEqual(set(get_class_plan(Derived).schema), {"a", "b"})
+        
+        Base.encode_schema = {"a": int, "c": int}
+        self.assertEqual(set(get_class_plan(Derived).schema), {"a", "b", "c"})
+        self.assertEqual(obj.to_dict()["c"], 3)
+        
+        del Derived.encode_schema
+        self.assertEqual(set(get_class_plan(Derived).schema), {"a", "c"})
+    
+    def test_do_encode_cached(self):
+        class Rec(EncodableClass):
+            encode_schema = {
+                "a": int,
+            }
+        r = Rec()
+        r.a = 1
+        r.b = 2
+        for _ in range(2):
+            D = do_encode((1, "x", {"k": [r]}), (int, str, {str: [Rec]}), "v", EncodeContext())
+            self.assertEqual(D[2]["k"][0]["a"], 1)
+            value = do_decode(list(D), (int, str, {str: [Rec]}), "v", {})
+            self.assertEqual(value[:2], (1, "x"))
+            self.assertEqual(value[2]["k"][0].a, 1)
+        
+        # Compiled templates follow schema changes
+        D = do_encode([r], Columnar(Rec), "v", EncodeContext())
+        self.assertEqual(set(D["<columns>"]), {"a"})
+        Rec.encode_schema = {"a": int, "b": int}
+        D = do_encode([r], Columnar(Rec), "v", EncodeContext())
+        self.assertEqual(set(D["<columns>"]), {"a", "b"})
+
+    def test_template_cache_bounded(self):
+        for n in range(_core.TEMPLATE_CACHE_SIZE + 10):
+            do_encode([n], [int], "v%d" % n, EncodeContext())
+        self.assertEqual(len(_core._template_nodes), _core.TEMPLATE_CACHE_SIZE)
+    
+    def test_compiled_once(self):
+        # Each level of a nested template is compiled once, and the plan uses
+        # the callables of its nodes
+        calls = []
+        compile_encoder = _core._compile_encoder
+        def counting(node):
+            calls.append(node.depth)
+            return(compile_encoder(node))
+        
+        tmpl = int
+        for _ in range(20):
+            tmpl = [tmpl]
+        class Nested(EncodableClass):
+            encode_schema = {
+                "v": {str: tmpl},
+            }
+        
+        _core._compile_encoder = counting
+        try:
+            plan = get_class_plan(Nested)
+        finally:
+            _core._compile_encoder = compile_encoder
+        self.assertEqual(sorted(calls), [1, 2] + list(range(2, 23)))
+        
+        node = plan.node_map["v"]
+        self.assertIs(plan.encoders[0][1], node.encode)
+        self.assertIs(plan.decoders[0][1], node.decode)
+        self.assertIs(plan.sampled_decoders[0][1], node.decode_sampled)
+        self.assertIs(plan.trusted_decoders[0][1], node.decode_trusted)
+
+class TestRegistry(unittest.TestCase):
+    def make_class(self):
+        class Dynamic(EncodableClass):
+            encode_schema = {"a": int}
+        return(Dynamic)
+    
+    def test_classes_are_freed(self):
+        cls = self.make_class()
+        classid = get_class_plan(cls).classid
+        self.assertIs(get_registered_class(classid), cls)
+        
+        obj = cls()
+        obj.a = 5
+        self.assertEqual(cls.from_dict(obj.to_dict()).a, 5)
+        self.assertIs(lookup_subtype(EncodableClass, classid), cls)
+        
+        ref = weakref.ref(cls)
+        del cls, obj
+        invalidate_plans()
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertIsNone(get_registered_class(classid))
+    
+    def test_redefined_class(self):
+        old = self.make_class()
+        new = self.make_class()
+        classid = get_class_plan(old).classid
+        self.assertIs(get_registered_class(classid), new)
+        del new
+        gc.collect()
+        self.assertIs(get_registered_class(classid), old)
+    
+    def test_subtype_tables(self):
+        table = get_subtype_table(Bar)
+        lookup_subtype(Bar, get_class_plan(Bar).classid)
+        self.assertTrue(table)
+        
+        # Only the tables of its bases are affected by a new class
+        class Unrelated(EncodableClass):
+            encode_schema = {}
+        self.assertTrue(table)
+        
+        class SubBar(Bar):
+            pass
+        self.assertFalse(table)
+        self.assertIs(lookup_subtype(Bar, get_class_plan(SubBar).classid), SubBar)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for ChangeTracker
+#
+
+import gc
+import json
+import weakref
+import unittest
+
+from encodable_class import EncodableClass, TrackedClass, ChangeTracker, mark_dirty
+
+class Task(TrackedClass):
+    encode_schema = {
+        "name": str,
+        "done": bool,
+        "deps": [EncodableClass]
+    }
+    
+    def __init__(self, name=""):
+        self.name = name
+        self.done = False
+        self.deps = []
+
+class Project(TrackedClass):
+    encode_schema = {
+        "tasks": [EncodableClass]
+    }
+    
+    def __init__(self, n=0):
+        self.tasks = [Task("t%d" % i) for i in range(n)]
+        for i in range(1, n):
+            self.tasks[i].deps = [self.tasks[i-1]]
+
+def to_json(obj):
+    return(json.dumps(obj.to_dict(), sort_keys=True))
+
+#-------------------------------------------------------------------------------
+class TestChangeTracker(unittest.TestCase):
+    
+    def test_deltas(self):
+        project = Project(5)
+        with ChangeTracker(project) as writer:
+            snapshot = json.loads(json.dumps(writer.snapshot()))
+            self.assertFalse(writer.is_dirty)
+            
+            deltas = []
+            project.tasks[1].done = True
+            deltas.append(writer.delta())
+            
+            # New object, and a cycle
+            new = Task("new")
+            new.deps = [project.tasks[0], new]
+            project.tasks.append(new)
+            mark_dirty(project, "tasks")
+            deltas.append(writer.delta())
+            
+            project.tasks[0].deps.append(new)
+            mark_dirty(project.tasks[0], "deps")
+            deltas.append(writer.delta())
+            self.assertEqual(writer.delta()["<changes>"], [])
+        
+        with ChangeTracker.load(Project, snapshot) as reader:
+            for delta in deltas:
+                reader.apply(json.loads(json.dumps(delta)))
+            project2 = reader.root
+        
+        self.assertEqual(to_json(project2), to_json(project))
+        new2 = project2.tasks[-1]
+        self.assertIs(new2.deps[1], new2)
+        self.assertIs(project2.tasks[0].deps[0], new2)
+    
+    def test_delta_order(self):
+        project = Project(2)
+        with ChangeTracker(project) as writer:
+            snapshot = writer.snapshot()
+            project.tasks[0].name = "a"
+            d1 = writer.delta()
+            project.tasks[0].name = "b"
+            d2 = writer.delta()
+        with ChangeTracker.load(Project, snapshot) as reader:
+            with self.assertRaises(ValueError):
+                reader.apply(d2)
+            reader.apply(d1)
+            reader.apply(d2)
+            self.assertEqual(reader.root.tasks[0].name, "b")
+    
+    def test_closed(self):
+        project = Project(2)
+        writer = ChangeTracker(project)
+        writer.snapshot()
+        writer.close()
+        project.tasks[0].done = True
+        self.assertFalse(writer.is_dirty)
+    
+    def test_only_known_objects(self):
+        a = Project(2)
+        b = Project(2)
+        with ChangeTracker(a) as ta, ChangeTracker(b) as tb:
+            ta.snapshot()
+            tb.snapshot()
+            
+            a.tasks[0].done = True
+            self.assertTrue(ta.is_dirty)
+            self.assertFalse(tb.is_dirty)
+            
+            # Objects outside of both graphs, including decoded ones
+            Task("x").done = True
+            Project.from_dict(a.to_dict())
+            mark_dirty(Task("y"), "deps")
+            self.assertFalse(tb.is_dirty)
+            self.assertEqual(len(ta.delta()["<changes>"]), 1)
+            
+            # New objects are known once a delta contained them
+            new = Task("new")
+            a.tasks.append(new)
+            mark_dirty(a, "tasks")
+            ta.delta()
+            new.done = True
+            self.assertEqual(ta.delta()["<changes>"], [[3, {"done": True}]])
+    
+    def test_apply_not_reported(self):
+        project = Project(2)
+        with ChangeTracker(project) as writer:
+            snapshot = writer.snapshot()
+            project.tasks[0].name = "a"
+            project.tasks[1].deps.append(Task("new"))
+            mark_dirty(project.tasks[1], "deps")
+            delta = writer.delta()
+        with ChangeTracker.load(Project, snapshot) as reader:
+            reader.apply(delta)
+            self.assertFalse(reader.is_dirty)
+            reader.root.tasks[1].deps[-1].done = True
+            self.assertTrue(reader.is_dirty)
+    
+    def test_trackers_not_kept_alive(self):
+        project = Project(2)
+        writer = ChangeTracker(project)
+        writer.snapshot()
+        ref = weakref.ref(writer)
+        del writer
+        gc.collect()
+        self.assertIsNone(ref())
+        project.tasks[0].done = True
@@ -0,0 +1,60 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for to_header_dict() and from_header_dict()
+#
+
+import json
+import unittest
+
+from encodable_class import VALIDATION_LEVELS, to_header_dict, from_header_dict
+
+from .models import Model, Node, make_model, to_json
+
+#-------------------------------------------------------------------------------
+class TestHeader(unittest.TestCase):
+    
+    def test_round_trip(self):
+        model = make_model()
+        H = json.loads(json.dumps(to_header_dict(model)))
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                model2 = from_header_dict(Model, H, validation=validation)
+                self.assertEqual(to_json(model2), to_json(model))
+                root = model2.root
+                self.assertIs(root.children[0].parent, root)
+                self.assertIs(model2.items[0], model2.points[0])
+    
+    def test_class_table(self):
+        H = to_header_dict(make_model())
+        classids = [classid for classid, fingerprint in H["<classes>"]]
+        self.assertEqual(len(classids), len(set(classids)))
+        self.assertNotIn('"<classtype>"', json.dumps(H))
+    
+    def test_schema_mismatch(self):
+        H = to_header_dict(make_model())
+        for entry in H["<classes>"]:
+            entry[1] = "0" * len(entry[1])
+        with self.assertRaises(ValueError):
+            from_header_dict(Model, H)
+        with self.assertRaises(ValueError):
+            from_header_dict(Node, to_header_dict(make_model()))
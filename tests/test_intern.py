@@ -0,0 +1,166 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for InternTable
+#
+
+import io
+import json
+import datetime
+import unittest
+
+from encodable_class import EncodableClass, ForeignObjectCodec, Columnar
+from encodable_class import DecodeContext, InternTable, VALIDATION_LEVELS
+from encodable_class import dump, load, dumpb, loadb, to_header_dict, from_header_dict
+
+class DateCodec(ForeignObjectCodec):
+    obj_type = datetime.date
+    intern_results = True
+
+    @classmethod
+    def encode(cls, obj):
+        return(obj.isoformat())
+
+    @classmethod
+    def decode(cls, d):
+        return(datetime.date.fromisoformat(d))
+
+class Entry(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "tags": [str],
+        "attrs": {str: str},
+        "pair": (str, int),
+        "when": DateCodec,
+        "count": int,
+    }
+
+    def __init__(self, name=None):
+        self.name = name
+        self.tags = ["tag", "tag"]
+        self.attrs = {"key": "value"}
+        self.pair = ("tag", 1)
+        self.when = datetime.date(2016, 1, 1)
+        self.count = 1
+
+class Doc(EncodableClass):
+    encode_schema = {
+        "entries": [Entry],
+        "columns": Columnar(Entry),
+    }
+
+    def __init__(self, n=40):
+        # More entries than the "sampled" level checks
+        self.entries = [Entry("name") for _ in range(n)]
+        self.columns = [Entry("name") for _ in range(n)]
+
+def all_entries(doc):
+    return(doc.entries + doc.columns)
+
+def decode_json(D, **kwargs):
+    # Strings parsed from JSON are separate objects, even if equal
+    return(Doc.from_dict(json.loads(json.dumps(D)), **kwargs))
+
+#-------------------------------------------------------------------------------
+class TestIntern(unittest.TestCase):
+
+    def assertInterned(self, doc):
+        first = doc.entries[0]
+        for entry in all_entries(doc):
+            self.assertIs(entry.name, first.name)
+            for tag in entry.tags:
+                self.assertIs(tag, first.tags[0])
+            self.assertIs(entry.pair[0], first.tags[0])
+            for k, v in entry.attrs.items():
+                self.assertIs(k, list(first.attrs)[0])
+                self.assertIs(v, first.attrs["key"])
+            self.assertIs(entry.when, first.when)
+
+    def test_validation_levels(self):
+        D = Doc().to_dict()
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                doc = decode_json(D, validation=validation, intern=InternTable())
+                self.assertInterned(doc)
+
+                # Nothing is interned without a table
+                doc = decode_json(D, validation=validation)
+                self.assertIsNot(doc.entries[0].name, doc.entries[1].name)
+                self.assertEqual(doc.entries[1].tags, ["tag", "tag"])
+                self.assertEqual(doc.columns[1].attrs, {"key": "value"})
+
+    def test_formats(self):
+        doc = Doc()
+
+        fp = io.StringIO()
+        dump(doc, fp)
+        fp.seek(0)
+        self.assertInterned(load(fp, Doc, intern=InternTable()))
+
+        fp = io.BytesIO()
+        dumpb(doc, fp)
+        self.assertInterned(loadb(fp.getvalue(), Doc, intern=InternTable()))
+
+        H = json.loads(json.dumps(to_header_dict(doc)))
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                self.assertInterned(from_header_dict(Doc, H, validation=validation, intern=InternTable()))
+
+    def test_not_root(self):
+        D = json.loads(json.dumps(Doc().to_dict()))
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                table = InternTable()
+                ctx = DecodeContext()
+                doc = Doc.from_dict(D, ctx, validation=validation, intern=table)
+                ctx.resolve_pending()
+                self.assertInterned(doc)
+                self.assertIsNone(ctx.intern)
+
+                # Also within a plain dict of decoded objects
+                objs = {}
+                self.assertInterned(Doc.from_dict(D, objs, validation=validation, intern=InternTable()))
+
+    def test_shared_table(self):
+        D = Doc(2).to_dict()
+        table = InternTable()
+        doc1 = decode_json(D, intern=table)
+        doc2 = decode_json(D, validation="trusted", intern=table)
+        self.assertIs(doc1.entries[0].name, doc2.columns[1].name)
+        self.assertIs(doc1.entries[0].when, doc2.entries[1].when)
+
+        stats = table.get_stats()
+        self.assertEqual(stats.pop("str")["unique"], 4)
+        self.assertEqual(table.lookups, 2 * 4 * 7)
+
+        # Every decoded date is a new object
+        (date_stats,) = stats.values()
+        self.assertEqual(date_stats["unique"], 1)
+        self.assertEqual(date_stats["hits"], 2 * 4 - 1)
+
+    def test_none(self):
+        doc = Doc(2)
+        doc.entries[0].name = None
+        doc.entries[0].tags = ["tag", None]
+        doc2 = decode_json(doc.to_dict(), validation="trusted", intern=InternTable())
+        self.assertIsNone(doc2.entries[0].name)
+        self.assertEqual(doc2.entries[0].tags, ["tag", None])
@@ -0,0 +1,116 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for to_dict_iterative() and from_dict_iterative()
+#
+
+import unittest
+
+from encodable_class import EncodableClass, DecodeContext, get_classid_str
+from encodable_class import to_dict_iterative, from_dict_iterative
+
+from .models import Model, make_model, to_json
+
+class Link(EncodableClass):
+    encode_schema = {
+        "n": int,
+        "next": EncodableClass
+    }
+    
+    def __init__(self, n=0, next=None):
+        self.n = n
+        self.next = next
+
+class Holder(EncodableClass):
+    encode_schema = {
+        "pair": (int, Link),
+        "links": [Link],
+        "nested": [[Link]],
+    }
+
+#-------------------------------------------------------------------------------
+class TestIterative(unittest.TestCase):
+    
+    def test_same_as_to_dict(self):
+        model = make_model()
+        self.assertEqual(to_dict_iterative(model), model.to_dict())
+    
+    def test_round_trip(self):
+        model = make_model()
+        model2 = from_dict_iterative(Model, model.to_dict())
+        self.assertEqual(to_json(model2), to_json(model))
+        root = model2.root
+        self.assertIs(root.children[0].parent, root)
+        self.assertIs(model2.items[0], model2.points[0])
+    
+    def test_context(self):
+        model = make_model()
+        ctx = DecodeContext()
+        model2 = from_dict_iterative(Model, model.to_dict(), ctx)
+        self.assertIs(ctx[0], model2)
+    
+    def test_deep(self):
+        # Far deeper than the recursion limit
+        head = None
+        for n in range(20000):
+            head = Link(n, head)
+        D = to_dict_iterative(head)
+        head2 = from_dict_iterative(Link, D)
+        n = 0
+        while(head2 is not None):
+            self.assertEqual(head2.n, 19999 - n)
+            head2 = head2.next
+            n += 1
+        self.assertEqual(n, 20000)
+    
+    def test_forward_references(self):
+        # References to objects that are only defined further down
+        def ref(ref_id):
+            return({"<classtype>": "<ref>", "<ref_id>": ref_id})
+        def link(ref_id, n, next=None):
+            return({"<classtype>": get_classid_str(Link), "<ref_id>": ref_id, "n": n, "next": next})
+        D = {
+            "<classtype>": get_classid_str(Holder),
+            "<ref_id>": 0,
+            "pair": [1, ref(2)],
+            "links": [ref(1), link(1, 10, ref(2)), link(2, 20)],
+            "nested": [[ref(2), link(3, 30, link(4, 40))], []],
+        }
+        for decode in (Holder.from_dict, lambda D: from_dict_iterative(Holder, D)):
+            h = decode(D)
+            l1, l2 = h.links[1], h.links[2]
+            self.assertEqual(h.pair, (1, l2))
+            self.assertIs(h.links[0], l1)
+            self.assertIs(l1.next, l2)
+            self.assertIs(h.nested[0][0], l2)
+            self.assertEqual(h.nested[0][1].next.n, 40)
+            self.assertEqual(h.nested[1], [])
+    
+    def test_invalid(self):
+        link = {"<classtype>": get_classid_str(Link), "<ref_id>": 1, "n": 1, "next": None}
+        for links, error in (("x", TypeError), ([["x"]], TypeError),
+                             ([{"<classtype>": link["<classtype>"]}], ValueError),
+                             ([link, link], ValueError)):
+            D = {"<classtype>": get_classid_str(Holder), "<ref_id>": 0, "pair": [1, None],
+                 "links": links, "nested": []}
+            with self.assertRaises(error):
+                from_dict_iterative(Holder, D)
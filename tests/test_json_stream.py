@@ -0,0 +1,100 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for dump()/load() and the streaming JSON reader/writer
+#
+
+import io
+import json
+import unittest
+
+from encodable_class import VALIDATION_LEVELS, InternTable
+from encodable_class import dump, load, iterencode, iterload
+
+from .models import Model, Node, make_model, to_json
+
+def dumps(obj, **kwargs):
+    f = io.StringIO()
+    dump(obj, f, **kwargs)
+    return(f.getvalue())
+
+#-------------------------------------------------------------------------------
+class TestJSONStream(unittest.TestCase):
+    
+    def test_same_as_to_dict(self):
+        model = make_model()
+        D = json.loads(json.dumps(model.to_dict()))
+        self.assertEqual(json.loads(dumps(model)), D)
+        self.assertEqual(json.loads("".join(iterencode(model))), D)
+    
+    def test_same_text(self):
+        model = make_model()
+        for kwargs in ({}, {"indent": 2, "sort_keys": True}, {"separators": (',', ':')}):
+            with self.subTest(**kwargs):
+                self.assertEqual(dumps(model, **kwargs), json.dumps(model.to_dict(), **kwargs))
+    
+    def test_round_trip(self):
+        model = make_model()
+        text = dumps(model)
+        for validation in VALIDATION_LEVELS:
+            with self.subTest(validation=validation):
+                # Small chunks split tokens across reads
+                model2 = load(io.StringIO(text), Model, chunk_size=7, validation=validation)
+                self.assertEqual(to_json(model2), to_json(model))
+    
+    def test_sharing_and_cycles(self):
+        model2 = load(io.StringIO(dumps(make_model())), Model)
+        root = model2.root
+        self.assertIs(root.children[0].parent, root)
+        self.assertIs(root.by_name["n1"], root.children[1])
+        self.assertIs(root.children[0].pair[1], root.children[1])
+        self.assertIs(model2.items[0], model2.points[0])
+        self.assertIs(model2.items[1], root.children[-1])
+    
+    def test_intern(self):
+        model = make_model()
+        for node in model.root.children:
+            node.name = "same"
+        table = InternTable()
+        model2 = load(io.StringIO(dumps(model)), Model, intern=table)
+        names = [node.name for node in model2.root.children]
+        self.assertTrue(all(name is names[0] for name in names))
+    
+    def test_iterload(self):
+        model = make_model()
+        reader = iterload(io.StringIO(dumps(model)), Model, "items")
+        items = list(reader)
+        self.assertEqual(len(items), len(model.items))
+        self.assertEqual([type(item).__name__ for item in items if item is not None],
+                         [type(item).__name__ for item in model.items if item is not None])
+    
+    def test_invalid(self):
+        text = dumps(make_model())
+        for bad in (text[:-1], text + "{}"):
+            with self.subTest(bad=bad[-20:]):
+                with self.assertRaises(ValueError):
+                    load(io.StringIO(bad), Model)
+        # Same as from_dict()
+        with self.assertRaises(KeyError):
+            load(io.StringIO(text.replace('"title"', '"titel"', 1)), Model)
+        with self.assertRaises(ValueError):
+            load(io.StringIO(text), Node)
@@ -0,0 +1,102 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for from_dict_lazy()
+#
+
+import json
+import unittest
+
+from encodable_class import EncodableClass, LazyClass
+from encodable_class import from_dict_lazy, materialize, is_lazy
+
+class Item(LazyClass):
+    encode_schema = {
+        "name": str,
+        "tags": [str],
+        "next": EncodableClass
+    }
+    
+    def __init__(self, name=""):
+        self.name = name
+        self.tags = [name]
+        self.next = None
+
+class Root(LazyClass):
+    encode_schema = {
+        "items": [EncodableClass],
+        "first": EncodableClass
+    }
+    
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.first = self.items[0] if self.items else None
+
+class PlainRoot(EncodableClass):
+    encode_schema = {
+        "items": [EncodableClass],
+        "label": str
+    }
+    
+    def __init__(self, items=()):
+        self.items = list(items)
+        self.label = "plain"
+
+def make_items(n):
+    items = [Item("i%d" % i) for i in range(n)]
+    for i in range(n):
+        items[i].next = items[(i+1) % n]
+    return(items)
+
+#-------------------------------------------------------------------------------
+class TestLazy(unittest.TestCase):
+    
+    def roundtrip(self, root):
+        D = json.loads(json.dumps(root.to_dict()))
+        return(D, from_dict_lazy(type(root), D))
+    
+    def test_lazy_members(self):
+        D, L = self.roundtrip(Root(make_items(4)))
+        self.assertTrue(is_lazy(L))
+        self.assertEqual(L.first.name, "i0")
+        self.assertIs(L.items[0], L.first)
+        self.assertIs(L.items[3].next, L.first)
+        materialize(L)
+        self.assertFalse(is_lazy(L))
+        self.assertFalse(any(is_lazy(x) for x in L.items))
+        self.assertEqual(L.to_dict(), D)
+    
+    def test_plain_class_is_eager(self):
+        D, L = self.roundtrip(PlainRoot(make_items(3)))
+        self.assertFalse(is_lazy(L))
+        self.assertIn("label", L.__dict__)
+        self.assertEqual(L.label, "plain")
+        self.assertIs(L.items[2].next, L.items[0])
+        materialize(L)
+        self.assertEqual(L.to_dict(), D)
+    
+    def test_missing_attribute(self):
+        D, L = self.roundtrip(Root(make_items(2)))
+        with self.assertRaises(AttributeError):
+            L.nonexistent
+        self.assertFalse(hasattr(PlainRoot(), "nonexistent"))
+        self.assertFalse(hasattr(EncodableClass, "__getattr__"))
@@ -0,0 +1,112 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for to_dict_parallel()
+#
+
+import random
+import threading
+import unittest
+import multiprocessing
+
+from encodable_class import EncodableClass, Columnar, to_dict_parallel
+
+class Leaf(EncodableClass):
+    encode_schema = {
+        "v": int,
+        "peer": EncodableClass,
+    }
+    def __init__(self, v):
+        self.v = v
+        self.peer = None
+
+class Group(EncodableClass):
+    encode_schema = {
+        "leaves": [Leaf],
+        "cols": Columnar(Leaf),
+        "pair": (int, Leaf),
+    }
+    def __init__(self, n):
+        self.leaves = []
+        self.cols = []
+        self.pair = (n, None)
+
+class Root(EncodableClass):
+    encode_schema = {
+        "head": Leaf,
+        "groups": [Group],
+        "index": {str: Group},
+        "tail": [Leaf],
+    }
+
+def build(n, seed=1):
+    """
+    Graph with references across chunks, back to the root, and cycles
+    """
+    rnd = random.Random(seed)
+    r = Root()
+    r.head = Leaf(-1)
+    r.groups = []
+    r.index = {}
+    leaves = [r.head]
+    for g in range(n):
+        G = Group(g)
+        for i in range(3):
+            L = Leaf(g*10 + i)
+            if(rnd.random() < 0.3):
+                L.peer = rnd.choice(leaves)
+            leaves.append(L)
+            G.leaves.append(L)
+        G.cols = [Leaf(-g), rnd.choice(leaves), None]
+        G.cols[0].peer = r
+        G.pair = (g, rnd.choice(leaves))
+        r.groups.append(G)
+        if(g % 3 == 0):
+            r.index["k%d" % g] = G if (rnd.random() < 0.5) else Group(-g)
+    r.tail = [rnd.choice(leaves) for _ in range(20)]
+    r.head.peer = leaves[-1]
+    return(r)
+
+@unittest.skipUnless('fork' in multiprocessing.get_all_start_methods(), "Requires fork")
+class TestParallel(unittest.TestCase):
+    def test_same_as_to_dict(self):
+        for n, chunk_size in ((20, 7), (200, 30)):
+            with self.subTest(n=n):
+                r = build(n)
+                self.assertEqual(to_dict_parallel(r, max_workers=2, chunk_size=chunk_size), r.to_dict())
+    
+    def test_other_threads(self):
+        # Falls back to to_dict() rather than forking with other threads alive
+        r = build(200)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(to_dict_parallel(r, chunk_size=30)))
+            for _ in range(2)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [r.to_dict()] * 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for Profiler
+#
+
+import threading
+import unittest
+
+from encodable_class import EncodableClass, Columnar, Profiler, get_class_plan
+
+class Leaf(EncodableClass):
+    encode_schema = {
+        "name": str,
+        "value": int
+    }
+    
+    def __init__(self, name="", value=0):
+        self.name = name
+        self.value = value
+
+class Custom(Leaf):
+    def to_dict(self, _encoded_objs=None):
+        # Overrides to_dict(), but still relies on the base implementation
+        return(super().to_dict(_encoded_objs))
+
+class Tree(EncodableClass):
+    encode_schema = {
+        "leaves": [EncodableClass],
+        "columns": Columnar(Leaf)
+    }
+    
+    def __init__(self, n=0):
+        self.leaves = [Leaf("l%d" % i, i) for i in range(n)] + [Custom("c", -1)]
+        self.columns = [Leaf("c%d" % i, i) for i in range(n)]
+
+def counts(prof, direction):
+    return(dict((classid, s["count"]) for classid, s in prof.report()[direction].items()))
+
+#-------------------------------------------------------------------------------
+class TestProfiler(unittest.TestCase):
+    
+    def test_counts(self):
+        tree = Tree(5)
+        with Profiler() as prof:
+            D = tree.to_dict()
+            for validation in ("full", "sampled", "trusted"):
+                Tree.from_dict(D, validation=validation)
+        
+        self.assertEqual(D, tree.to_dict())
+        enc = counts(prof, "encode")
+        self.assertEqual(enc[get_class_plan(Tree).classid], 1)
+        self.assertEqual(enc[get_class_plan(Leaf).classid], 5)
+        self.assertEqual(enc[get_class_plan(Custom).classid], 1)
+        dec = counts(prof, "decode")
+        self.assertEqual(dec[get_class_plan(Tree).classid], 3)
+        self.assertEqual(dec[get_class_plan(Leaf).classid], 15)
+        
+        keys = prof.report()["encode"][get_class_plan(Leaf).classid]["keys"]
+        # Once per object, and once per row of the columns
+        self.assertEqual(keys["name"]["count"], 10)
+    
+    def test_inactive(self):
+        tree = Tree(3)
+        plan = get_class_plan(Leaf)
+        encoders = list(plan.encoders)
+        prof = Profiler()
+        with prof:
+            tree.to_dict()
+        self.assertEqual(plan.encoders, encoders)
+        
+        # Nothing is recorded once stopped
+        report = prof.report()
+        tree.to_dict()
+        self.assertEqual(prof.report(), report)
+    
+    def test_other_threads(self):
+        tree = Tree(3)
+        done = threading.Event()
+        go = threading.Event()
+        
+        def run():
+            go.wait()
+            tree.to_dict()
+            done.set()
+        t = threading.Thread(target=run)
+        t.start()
+        with Profiler() as prof:
+            go.set()
+            done.wait()
+        t.join()
+        self.assertEqual(prof.report()["encode"], {})
+    
+    def test_nested(self):
+        with Profiler() as prof:
+            with self.assertRaises(RuntimeError):
+                Profiler().start()
+            Tree(1).to_dict()
+        self.assertIn(get_class_plan(Tree).classid, prof.report()["encode"])
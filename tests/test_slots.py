@@ -0,0 +1,86 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for SlottedClass
+#
+
+import json
+import unittest
+
+from encodable_class import EncodableClass, SlottedClass, clone
+
+class Vec(SlottedClass):
+    encode_schema = {
+        "x": float,
+        "y": float
+    }
+    
+    def __init__(self, x=0.0, y=0.0):
+        self.x = x
+        self.y = y
+
+class Particle(Vec):
+    encode_schema = {
+        "name": str,
+        "near": [EncodableClass]
+    }
+    
+    def __init__(self, name="", x=0.0, y=0.0):
+        Vec.__init__(self, x, y)
+        self.name = name
+        self.near = []
+
+class Custom(SlottedClass):
+    __slots__ = ("a", "cache")
+    encode_schema = {
+        "a": int
+    }
+
+def to_json(obj):
+    return(json.dumps(obj.to_dict(), sort_keys=True))
+
+#-------------------------------------------------------------------------------
+class TestSlottedClass(unittest.TestCase):
+    
+    def test_slots(self):
+        p = Particle("p", 1.0, 2.0)
+        self.assertFalse(hasattr(p, "__dict__"))
+        self.assertEqual(set(Vec.__slots__), {"x", "y"})
+        self.assertEqual(set(Particle.__slots__), {"name", "near"})
+        with self.assertRaises(AttributeError):
+            p.other = 1
+    
+    def test_custom_slots(self):
+        c = Custom()
+        c.a = 1
+        c.cache = None
+        self.assertEqual(Custom.from_dict(c.to_dict()).a, 1)
+    
+    def test_round_trip(self):
+        particles = [Particle("p%d" % i, float(i), -float(i)) for i in range(4)]
+        for p in particles:
+            p.near = [q for q in particles if q is not p]
+        D = particles[0].to_dict()
+        p2 = Particle.from_dict(json.loads(json.dumps(D)))
+        self.assertEqual(to_json(p2), to_json(particles[0]))
+        self.assertIs(p2.near[0].near[0], p2)
+        self.assertEqual(to_json(clone(particles[0])), to_json(particles[0]))
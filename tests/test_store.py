@@ -0,0 +1,148 @@
+# The MIT License (MIT)
+#
+# Copyright (c) 2016 Alex Mykyta
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#==============================================================================
+# Tests for RecordStore
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from encodable_class import EncodableClass, RecordStore
+
+class Leaf(EncodableClass):
+    encode_schema = {
+        "n": int,
+        "msg": str,
+        "link": EncodableClass,
+    }
+    def __init__(self, n):
+        self.n = n
+        self.msg = "line\n%d" % n
+        self.link = None
+
+class TestRecordStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "store.jsonl")
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def fill(self, n, **kwargs):
+        with RecordStore(self.path, Leaf, **kwargs) as store:
+            store.extend(Leaf(i) for i in range(n))
+    
+    def assertRecords(self, expected):
+        with RecordStore(self.path, Leaf) as store:
+            self.assertEqual(len(store), len(expected))
+            self.assertEqual([obj.n for obj in store], expected)
+    
+    def test_reopen(self):
+        for n in (0, 1, 25):
+            with self.subTest(n=n):
+                if(os.path.exists(self.path)):
+                    os.remove(self.path)
+                    os.remove(self.path + ".idx")
+                self.fill(n, index_interval=10)
+                self.assertRecords(list(range(n)))
+                
+                # Reopening again starts from the index written on close
+                self.assertRecords(list(range(n)))
+    
+    def test_unflushed_reads(self):
+        with RecordStore(self.path, Leaf) as store:
+            for i in range(5):
+                store.append(Leaf(i))
+            self.assertEqual(store.get(3).n, 3)
+            self.assertEqual(store[-1].msg, "line\n4")
+            self.assertEqual([obj.n for obj in store.tail(2)], [3, 4])
+    
+    def test_cycle_in_record(self):
+        obj = Leaf(1)
+        obj.link = obj
+        with RecordStore(self.path, Leaf) as store:
+            store.append(obj)
+            decoded = store.get(0)
+        self.assertIs(decoded.link, decoded)
+    
+    def test_truncated_last_line(self):
+        for n in (1, 25):
+            with self.subTest(n=n):
+                if(os.path.exists(self.path)):
+                    os.remove(self.path)
+                    os.remove(self.path + ".idx")
+                self.fill(n)
+                with open(self.path, 'ab') as f:
+                    f.write(b'{"<classtype>":"Leaf","n":')
+                self.assertRecords(list(range(n)))
+                
+                # The partial line was removed, so appends start a new line
+                with RecordStore(self.path, Leaf) as store:
+                    store.append(Leaf(99))
+                self.assertRecords(list(range(n)) + [99])
+    
+    def test_index_past_data(self):
+        self.fill(25)
+        
+        # Lose the last record, and part of the one before
+        with open(self.path, 'rb') as f:
+            lines = f.readlines()
+        with open(self.path, 'r+b') as f:
+            f.truncate(sum(len(line) for line in lines[:23]) + 5)
+        self.assertRecords(list(range(23)))
+    
+    def test_corrupt_index(self):
+        self.fill(25)
+        with open(self.path + ".idx", 'wb') as f:
+            f.write(b'\x05' * 24)
+        self.assertRecords(list(range(25)))
+    
+    def test_index_synced(self):
+        with RecordStore(self.path, Leaf, index_interval=1000) as store:
+            idx_fd = store._idx_fp.fileno()
+            with mock.patch("os.fsync", wraps=os.fsync) as fsync:
+                store.append(Leaf(1))
+                store.flush()
+                self.assertNotIn(mock.call(idx_fd), fsync.call_args_list)
+                store.flush(index=True)
+                self.assertIn(mock.call(idx_fd), fsync.call_args_list)
+    
+    def test_compact(self):
+        self.fill(40)
+        with RecordStore(self.path, Leaf) as store:
+            n_removed = store.compact(keep=lambda obj: obj.n % 2 == 0, start=10)
+            self.assertEqual(n_removed, 25)
+            store.append(Leaf(99))
+        self.assertRecords(list(range(10, 40, 2)) + [99])
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+    
+    def test_compact_to_one(self):
+        self.fill(5)
+        with RecordStore(self.path, Leaf) as store:
+            store.compact(start=4)
+        self.assertRecords([4])
+
+if __name__ == '__main__':
+    unittest.main()